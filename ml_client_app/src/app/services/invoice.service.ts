@@ -1,10 +1,13 @@
 import { Injectable } from '@angular/core';
-import { HttpClient } from '@angular/common/http';
-import { Observable } from 'rxjs';
+import { HttpClient, HttpParams } from '@angular/common/http';
+import { Observable, of, timer } from 'rxjs';
+import { exhaustMap, first, map, switchMap } from 'rxjs/operators';
 
 export interface InvoiceResponse {
   status: string;
   message: string;
+  cached?: boolean;
+  duplicate?: boolean;
   invoice: {
     id: number;
     file: string;
@@ -25,11 +28,50 @@ export interface InvoiceResponse {
   };
 }
 
+export interface ExtractionJob {
+  // null : facture servie par le cache, sans tâche d'extraction
+  id: number | null;
+  invoice: number;
+  status: 'queued' | 'running' | 'done' | 'failed';
+  attempts: number;
+  max_attempts: number;
+  error?: string | null;
+  created_at: string;
+  started_at?: string | null;
+  finished_at?: string | null;
+}
+
+export interface ExtractionStatusResponse {
+  status: string;
+  job: ExtractionJob;
+  invoice?: InvoiceResponse['invoice'];
+}
+
+export interface InvoiceSummary {
+  id: number;
+  file: string;
+  uploaded_at: string;
+  processed: boolean;
+  numero_facture: string | null;
+  numero_commande: string | null;
+  date_piece: string | null;
+  total_ttc: string | null;
+  client_societe: string | null;
+  document_type: string | null;
+}
+
+export interface InvoicePage<T> {
+  next: string | null;
+  previous: string | null;
+  results: T[];
+}
+
 @Injectable({
   providedIn: 'root'
 })
 export class InvoiceService {
   private apiUrl = 'http://localhost:8000/api/invoices/';
+  private pollInterval = 1000;
 
   constructor(private http: HttpClient) { }
 
@@ -37,11 +79,43 @@ export class InvoiceService {
     const formData = new FormData();
     formData.append('file', file);
     
-    return this.http.post<InvoiceResponse>(this.apiUrl, formData);
+    // 202 (`queued`) : le texte est extrait en arrière-plan, il faut suivre la tâche ;
+    // 200 (doublon) ou 201 (cache) : la facture est déjà traitée
+    return this.http
+      .post<InvoiceResponse>(this.apiUrl, formData)
+      .pipe(switchMap((response) => response.status === 'queued'
+        ? this.waitForExtraction(response.invoice.id)
+        : of(response)));
+  }
+
+  getExtractionStatus(id: number): Observable<ExtractionStatusResponse> {
+    return this.http.get<ExtractionStatusResponse>(`${this.apiUrl}${id}/status/`);
+  }
+
+  waitForExtraction(id: number): Observable<InvoiceResponse> {
+    return timer(0, this.pollInterval).pipe(
+      exhaustMap(() => this.getExtractionStatus(id)),
+      first((response) => response.job.status === 'done' || response.job.status === 'failed'),
+      map((response) => {
+        if (response.job.status === 'failed' && !response.invoice?.extracted_content) {
+          throw new Error(response.job.error || "L'extraction a échoué");
+        }
+        return {
+          status: 'success',
+          message: 'Facture téléchargée et traitée avec succès',
+          invoice: response.invoice!,
+        };
+      })
+    );
   }
 
-  getInvoices(): Observable<any> {
-    return this.http.get<any>(this.apiUrl);
+  // Liste paginée par curseur : passer l'URL `next` de la page précédente
+  getInvoices(pageUrl?: string): Observable<InvoicePage<InvoiceSummary>> {
+    if (pageUrl) {
+      return this.http.get<InvoicePage<InvoiceSummary>>(pageUrl);
+    }
+    const params = new HttpParams().set('view', 'summary');
+    return this.http.get<InvoicePage<InvoiceSummary>>(this.apiUrl, { params });
   }
 
   getInvoice(id: number): Observable<InvoiceResponse> {
@@ -0,0 +1,13 @@
+"""
+Benchmarks de la chaîne d'extraction
+
+À lancer depuis `ml_server_app/`, par exemple :
+    python -m benchmarks.suite --pages 1 5 20 --output bench.json
+    python -m benchmarks.ocr_memory --pages 10 50 100
+    python -m benchmarks.line_items --lines 1000 10000 100000
+    python -m benchmarks.layout --pages 1 10 50
+    python -m benchmarks.normalizer --megabytes 1 10
+    python -m benchmarks.search --invoices 10000 100000
+    python -m benchmarks.duplicates --invoices 10000 100000
+    python -m benchmarks.storage --pages 10 50 200
+"""
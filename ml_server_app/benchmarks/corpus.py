@@ -0,0 +1,211 @@
+"""
+Génération de documents synthétiques pour les benchmarks
+
+Trois formes de factures, générées sans fichier ni service externe :
+PDF textuels (couche texte), PDF « scannés » (une image par page) et images.
+"""
+import os
+
+from PIL import Image, ImageDraw, ImageFont
+
+A4_INCHES = (8.27, 11.69)
+
+
+def render_page(lines, dpi=150):
+    """
+    Dessine une page A4 en niveaux de gris contenant les lignes de texte données
+
+    Returns:
+        PIL.Image.Image: Image de la page
+    """
+    width, height = int(A4_INCHES[0] * dpi), int(A4_INCHES[1] * dpi)
+    page = Image.new('L', (width, height), 255)
+    draw = ImageDraw.Draw(page)
+    line_height = max(12, dpi // 8)
+    font = _font(int(line_height * 0.75))
+    for index, line in enumerate(lines):
+        y = dpi // 2 + index * line_height
+        if y > height - dpi // 2:
+            break
+        draw.text((dpi // 2, y), line, fill=0, font=font)
+    return page
+
+
+def _font(size):
+    # Police vectorielle intégrée à Pillow (>= 10.1), sinon police bitmap par défaut
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        return ImageFont.load_default()
+
+
+def invoice_lines(page_number, lines_per_page=40):
+    lines = [
+        "SOCIETE EXEMPLE SAS - 12 rue des Lilas 75011 Paris",
+        f"FACTURE N° FA-2024-{page_number:05d}    Date: 12/03/2024",
+        "Client: Dupont et Fils    Code client: C0042",
+        "Désignation                Qté     Prix unitaire     Total HT",
+    ]
+    for index in range(lines_per_page):
+        quantity = index % 9 + 1
+        price = 3.5 + index
+        lines.append(f"Article {page_number}-{index:03d} fourniture   {quantity}   {price:.2f}   {quantity * price:.2f}")
+    lines.append("Total TTC 1481,47 €")
+    return lines
+
+
+def make_scanned_pdf(path, pages, dpi=150):
+    """
+    Crée un PDF « scanné » (une image par page, sans couche texte)
+
+    Les pages sont écrites une à une pour que la génération elle-même ne
+    garde pas tout le document en mémoire.
+    """
+    first = render_page(invoice_lines(1), dpi)
+
+    def remaining():
+        for page_number in range(2, pages + 1):
+            yield render_page(invoice_lines(page_number), dpi)
+
+    first.save(path, 'PDF', resolution=dpi, save_all=True, append_images=remaining())
+    return path
+
+
+def _pdf_string(text):
+    # Chaîne littérale PDF en WinAnsi (accents et symbole euro compris)
+    data = text.encode('cp1252', errors='replace')
+    return b'(' + data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+def _write_pdf(path, page_streams):
+    # PDF minimal : une police Helvetica (WinAnsi), un flux de contenu par page
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # Arbre des pages, complété une fois les pages créées
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    page_ids = []
+    for stream in page_streams:
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = b" ".join(b"%d 0 R" % page_id for page_id in page_ids)
+    objects[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(page_ids)
+
+    with open(path, 'wb') as file:
+        file.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(file.tell())
+            file.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        xref_offset = file.tell()
+        file.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            file.write(b"%010d 00000 n \n" % offset)
+        file.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+                   % (len(objects) + 1, xref_offset))
+    return path
+
+
+def make_text_pdf(path, pages, lines_per_page=40):
+    """
+    Crée un PDF textuel (Helvetica, une facture par page)
+
+    Le fichier est écrit directement (objets, table xref) : aucune bibliothèque
+    de génération PDF n'est nécessaire.
+    """
+    streams = []
+    for page_number in range(1, pages + 1):
+        commands = [b"BT", b"/F1 9 Tf", b"11 TL", b"40 800 Td"]
+        for line in invoice_lines(page_number, lines_per_page):
+            commands.append(_pdf_string(line) + b" Tj T*")
+        commands.append(b"ET")
+        streams.append(b"\n".join(commands))
+    return _write_pdf(path, streams)
+
+
+def positioned_invoice(page_number, lines_per_page=40):
+    """
+    Fragments d'une facture mise en page : (x, y, texte), y depuis le bas
+
+    Libellés et valeurs sont des fragments distincts : numéro et date à
+    droite de leur libellé, tableau en colonnes, puis encadré des totaux écrit
+    colonne par colonne (tous les libellés, puis toutes les valeurs), le
+    montant à payer sous son libellé.
+    """
+    items = [
+        (40, 800, "SOCIETE EXEMPLE SAS"),
+        (40, 788, "12 rue des Lilas 75011 Paris"),
+        (360, 800, "Facture N°"),
+        (450, 800, f"FA-2024-{page_number:05d}"),
+        (360, 788, "Date"),
+        (450, 788, "12/03/2024"),
+        (40, 740, "Désignation"), (300, 740, "Qté"), (360, 740, "Prix unitaire"), (480, 740, "Total HT"),
+    ]
+    y = 728
+    total = 0.0
+    for index in range(lines_per_page):
+        quantity = index % 9 + 1
+        price = 3.5 + index
+        total += quantity * price
+        items += [(40, y, f"Article {page_number}-{index:03d} fourniture"), (300, y, str(quantity)),
+                  (360, y, f"{price:.2f}"), (480, y, f"{quantity * price:.2f}")]
+        y -= 12
+    tva = round(total * 0.2, 2)
+    items += [
+        (360, y - 12, "Total HT"), (360, y - 24, "TVA 20%"), (360, y - 40, "Net à payer"),
+        (480, y - 12, f"{total:.2f}".replace('.', ',')), (480, y - 24, f"{tva:.2f}".replace('.', ',')),
+        (360, y - 52, f"{total + tva:.2f} €".replace('.', ',')),
+    ]
+    return items
+
+
+def make_layout_pdf(path, pages, lines_per_page=40):
+    """Crée un PDF dont chaque fragment de texte est placé par ses coordonnées (Tm)"""
+    streams = []
+    for page_number in range(1, pages + 1):
+        commands = [b"BT", b"/F1 9 Tf"]
+        for x, y, text in positioned_invoice(page_number, lines_per_page):
+            commands.append(b"1 0 0 1 %d %d Tm " % (x, y) + _pdf_string(text) + b" Tj")
+        commands.append(b"ET")
+        streams.append(b"\n".join(commands))
+    return _write_pdf(path, streams)
+
+
+def make_image(path, dpi=200, lines_per_page=40):
+    """Crée une image de facture (le format dépend de l'extension : .png, .jpg...)"""
+    render_page(invoice_lines(1, lines_per_page), dpi).save(path)
+    return path
+
+
+# Formes de documents : (extension, fonction de génération(chemin, pages, dpi))
+DOCUMENT_KINDS = {
+    'text_pdf': ('.pdf', lambda path, pages, dpi: make_text_pdf(path, pages)),
+    'layout_pdf': ('.pdf', lambda path, pages, dpi: make_layout_pdf(path, pages)),
+    'scanned_pdf': ('.pdf', make_scanned_pdf),
+    'image': ('.png', lambda path, pages, dpi: make_image(path, dpi)),
+}
+
+
+def make_corpus(directory, kinds, page_counts, dpi=150):
+    """
+    Génère un document par forme et par nombre de pages
+
+    Les images n'ont qu'une page : une seule est générée quel que soit `page_counts`.
+
+    Returns:
+        list: Dictionnaires (kind, pages, path, bytes)
+    """
+    documents = []
+    for kind in kinds:
+        extension, generate = DOCUMENT_KINDS[kind]
+        for pages in (page_counts if kind != 'image' else [1]):
+            path = os.path.join(directory, f"{kind}_{pages}{extension}")
+            generate(path, pages, dpi)
+            documents.append({"kind": kind, "pages": pages, "path": path,
+                              "bytes": os.path.getsize(path)})
+    return documents
@@ -0,0 +1,147 @@
+"""
+Durée de la recherche des doublons selon le nombre de factures enregistrées
+
+Les factures synthétiques (fournisseurs et articles tirés d'un vocabulaire
+de quelques milliers de mots) sont enregistrées avec leur empreinte dans une
+base de test temporaire. Chaque recherche porte sur un nouveau scan d'une
+facture existante (erreurs d'OCR simulées) : on mesure la durée de
+`find_duplicates`, le nombre de factures comparées (partageant une bande LSH)
+et la proportion d'originaux retrouvés. La base de développement n'est pas
+modifiée.
+
+    python -m benchmarks.duplicates --invoices 10000 100000 --output duplicates.json
+"""
+import argparse
+import json
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+
+from .suite import percentile
+
+BATCH_SIZE = 2000
+VOCABULARY_SIZE = 3000
+OCR_CONFUSIONS = {'l': '1', 'o': '0', 'O': '0', 'e': 'c', 'i': 'l', 'S': '5', 'B': '8'}
+
+
+def make_vocabulary(rnd):
+    syllables = [consonant + vowel for consonant in 'bcdfglmnprstv' for vowel in 'aeiou']
+    return [''.join(rnd.choice(syllables) for _ in range(rnd.randint(2, 4))) for _ in range(VOCABULARY_SIZE)]
+
+
+def make_invoice_text(rnd, vocabulary, number):
+    supplier = ' '.join(rnd.choice(vocabulary).capitalize() for _ in range(2))
+    lines = [supplier, f"{rnd.randint(1, 99)} rue {rnd.choice(vocabulary)} {rnd.randint(10000, 95999)}",
+             f"FACTURE N° FA-{number:08d} Date: {rnd.randint(1, 28):02d}/03/2024"]
+    for _ in range(rnd.randint(5, 25)):
+        words = ' '.join(rnd.choice(vocabulary) for _ in range(rnd.randint(2, 5)))
+        lines.append(f"{words} {rnd.randint(1, 9)} {rnd.randint(100, 99999) / 100:.2f}".replace('.', ','))
+    lines.append(f"Total TTC {rnd.randint(1000, 999999) / 100:.2f}".replace('.', ','))
+    return "\n".join(lines)
+
+
+def rescan(rnd, text, error_rate=0.01):
+    """Copie d'un texte avec des erreurs d'OCR (confusions et caractères parasites)"""
+    characters = []
+    for character in text:
+        if rnd.random() < error_rate:
+            characters.append(OCR_CONFUSIONS.get(character, rnd.choice(string.ascii_letters)))
+        else:
+            characters.append(character)
+    return ''.join(characters)
+
+
+def fill(count, rnd, vocabulary, samples):
+    """Enregistre `count` factures et leur empreinte ; retourne (id, texte) de quelques-unes"""
+    from django.db import transaction
+
+    from invoice_api.extractors import TextProcessor
+    from invoice_api.fingerprints import compute_signature
+    from invoice_api.models import Invoice, InvoiceFingerprint
+
+    kept = []
+    sample_numbers = set(rnd.sample(range(count), samples))
+    for start in range(0, count, BATCH_SIZE):
+        invoices, signatures, texts = [], [], []
+        for number in range(start, min(count, start + BATCH_SIZE)):
+            text = TextProcessor.clean_text(make_invoice_text(rnd, vocabulary, number))
+            invoices.append(Invoice(file=f'invoices/{number}.pdf', processed=True))
+            signatures.append(compute_signature(text))
+            texts.append((number, text))
+        with transaction.atomic():
+            Invoice.objects.bulk_create(invoices, batch_size=500)
+            InvoiceFingerprint.store(list(zip(invoices, signatures)))
+        kept += [(invoice.pk, text) for invoice, (number, text) in zip(invoices, texts)
+                 if number in sample_numbers]
+    return kept
+
+
+def run(counts, lookups, seed):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ml_server_app.settings')
+    import django
+    django.setup()
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+
+    from invoice_api.extractors import TextProcessor
+    from invoice_api.fingerprints import band_keys, compute_signature
+    from invoice_api.models import FingerprintBand, Invoice
+
+    setup_test_environment()
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for count in counts:
+            connection.settings_dict['TEST']['NAME'] = os.path.join(work_dir, f'duplicates-{count}.sqlite3')
+            old_name = connection.creation.create_test_db(verbosity=0)
+            try:
+                rnd = random.Random(seed)
+                vocabulary = make_vocabulary(rnd)
+                start = time.perf_counter()
+                samples = fill(count, rnd, vocabulary, min(lookups, count))
+                fill_seconds = time.perf_counter() - start
+
+                seconds, compared, found = [], [], 0
+                probe = Invoice(pk=0)
+                for original_id, text in samples:
+                    signature = compute_signature(TextProcessor.clean_text(rescan(rnd, text)))
+                    start = time.perf_counter()
+                    duplicates = probe.find_duplicates(signature)
+                    seconds.append(time.perf_counter() - start)
+                    found += any(duplicate['invoice_id'] == original_id for duplicate in duplicates)
+                    compared.append(FingerprintBand.objects.filter(key__in=band_keys(signature))
+                                    .values('fingerprint_id').distinct().count())
+                results.append({
+                    "invoices": count,
+                    "fill_seconds": round(fill_seconds, 2),
+                    "lookups": len(samples),
+                    "recall": round(found / len(samples), 3),
+                    "compared_mean": round(sum(compared) / len(compared), 1),
+                    "p50_ms": round(percentile(seconds, 0.5) * 1000, 2),
+                    "p99_ms": round(percentile(seconds, 0.99) * 1000, 2),
+                })
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--invoices', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--lookups', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=11)
+    parser.add_argument('--output', help="Fichier JSON du rapport (sortie standard par défaut)")
+    args = parser.parse_args(argv)
+
+    report = json.dumps({"results": run(args.invoices, args.lookups, args.seed)}, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""
+Surcoût du mode mise en page à la lecture des PDF textuels
+
+Pour chaque nombre de pages, le même PDF est lu avec `extract_text()` seul
+puis avec le relevé des positions (même appel, visiteurs de PyPDF2), suivi
+de l'indexation des fragments et de la recherche des champs par libellé.
+
+    python -m benchmarks.layout --pages 1 10 50 --output layout.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from PyPDF2 import PdfReader
+
+from invoice_api.layout import PageRunCollector, locate_fields
+
+from .corpus import make_layout_pdf
+
+
+def read_flat(path):
+    for page in PdfReader(path).pages:
+        page.extract_text()
+
+
+def read_with_layout(path):
+    layouts = []
+    for number, page in enumerate(PdfReader(path).pages, start=1):
+        collector = PageRunCollector(page)
+        page.extract_text(**collector.visitors())
+        layouts.append(collector.layout(number))
+    start = time.perf_counter()
+    fields = locate_fields(layouts)
+    return sum(len(layout.runs) for layout in layouts), len(fields), time.perf_counter() - start
+
+
+def _best(function, path, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(path)
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+
+def run(page_counts, repeat):
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for pages in page_counts:
+            path = make_layout_pdf(os.path.join(temp_dir, f"layout-{pages}.pdf"), pages)
+            flat = _best(read_flat, path, repeat)
+            with_layout = _best(read_with_layout, path, repeat)
+            runs, fields, locate_seconds = read_with_layout(path)
+            results.append({
+                "pages": pages,
+                "runs": runs,
+                "fields": fields,
+                "flat_seconds": round(flat, 4),
+                "layout_seconds": round(with_layout, 4),
+                "overhead": round(with_layout / flat - 1, 3) if flat else None,
+                "locate_seconds": round(locate_seconds, 4),
+            })
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 10, 50])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help="Fichier JSON du rapport (sortie standard par défaut)")
+    args = parser.parse_args(argv)
+
+    report = json.dumps({"results": run(args.pages, args.repeat)}, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""
+Durée de la lecture des lignes d'articles selon la taille du tableau
+
+Le tableau synthétique reprend les colonnes des factures du corpus
+(quantité, prix unitaire, remise, total HT) ; la durée par ligne doit rester
+constante quand le nombre de lignes augmente.
+
+    python -m benchmarks.line_items --lines 1000 10000 100000 --output line_items.json
+"""
+import argparse
+import json
+import sys
+import time
+
+from invoice_api.line_items import parse_line_items
+from invoice_api.patterns import pattern_registry
+
+
+def make_table(lines):
+    rows = [f"REF-{n:05d} Article {n} {n % 9 + 1} {n % 90 + 10},50 € 5% {(n % 9 + 1) * 10},00 €"
+            for n in range(lines)]
+    return "\n".join(["Référence Désignation Qté P.U. HT Remise Montant HT"] + rows + ["Total HT 0,00"])
+
+
+def run(line_counts, repeat):
+    header_pattern = pattern_registry.get().product_lines_pattern
+    results = []
+    for lines in line_counts:
+        text = make_table(lines)
+        durations = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            articles = parse_line_items(text, header_pattern)
+            durations.append(time.perf_counter() - start)
+        best = min(durations)
+        results.append({
+            "lines": lines,
+            "articles": len(articles),
+            "seconds": round(best, 4),
+            "us_per_line": round(best / lines * 1e6, 2),
+        })
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--lines', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help="Fichier JSON du rapport (sortie standard par défaut)")
+    args = parser.parse_args(argv)
+
+    report = json.dumps({"results": run(args.lines, args.repeat)}, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
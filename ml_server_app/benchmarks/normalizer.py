@@ -0,0 +1,84 @@
+"""
+Débit du nettoyage et de la mise en forme du texte extrait
+
+Compare les passes successives d'origine (`clean_text_sequential` puis
+`format_text_sequential`) à l'expression unique de `normalizer`, sur tout le
+texte puis par morceaux (`iter_normalized`). Le texte synthétique répète le
+texte des pages du corpus jusqu'à la taille demandée.
+
+    python -m benchmarks.normalizer --megabytes 1 10 --output normalizer.json
+"""
+import argparse
+import json
+import sys
+import time
+
+from benchmarks.corpus import positioned_invoice
+from invoice_api.normalizer import (
+    clean_text_sequential, format_text_sequential, iter_normalized, normalize_text,
+)
+
+CHUNK_SIZE = 64 * 1024
+
+
+def make_text(size):
+    # Fragments regroupés par ligne, comme dans le texte d'une page PDF
+    lines = {}
+    for x, y, text in sorted(positioned_invoice(1, 40), key=lambda item: (-item[1], item[0])):
+        lines.setdefault(y, []).append(text)
+    page = "\n".join("   ".join(line) for line in lines.values()) + "\n\x0c\n\n\n"
+    return (page * (size // len(page) + 1))[:size]
+
+
+def _sequential(text):
+    cleaned = clean_text_sequential(text)
+    return cleaned, format_text_sequential(cleaned)
+
+
+def _chunked(text):
+    blocks = list(iter_normalized(text[i:i + CHUNK_SIZE] for i in range(0, len(text), CHUNK_SIZE)))
+    return "".join(b[0] for b in blocks), "".join(b[1] for b in blocks)
+
+
+def run(sizes, repeat):
+    results = []
+    for megabytes in sizes:
+        text = make_text(int(megabytes * 1024 * 1024))
+        entry = {"megabytes": megabytes}
+        expected = None
+        for name, function in (("sequential", _sequential), ("single_pass", normalize_text),
+                               ("chunked", _chunked)):
+            durations = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                output = function(text)
+                durations.append(time.perf_counter() - start)
+            if expected is None:
+                expected = output
+            entry[name] = {
+                "seconds": round(min(durations), 4),
+                "mb_per_second": round(megabytes / min(durations), 2),
+                "identical": output == expected,
+            }
+        entry["speedup"] = round(entry["sequential"]["seconds"] / entry["single_pass"]["seconds"], 2)
+        results.append(entry)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--megabytes', type=float, nargs='+', default=[1, 10])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help="Fichier JSON du rapport (sortie standard par défaut)")
+    args = parser.parse_args(argv)
+
+    report = json.dumps({"results": run(args.megabytes, args.repeat)}, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""
+Mémoire résidente maximale de l'OCR d'un PDF scanné en fonction du nombre de pages
+
+Compare la conversion complète du document en images avant l'OCR (`full`)
+avec la rastérisation par fenêtres de `TextExtractor.extract_from_scanned_pdf`
+(`windowed`). Chaque mesure est faite dans un processus neuf.
+
+    python -m benchmarks.ocr_memory --pages 10 50 100 --output ocr_memory.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+from .corpus import make_scanned_pdf
+
+
+def _run_full(pdf_path):
+    # Comportement d'origine : toutes les pages chargées en mémoire avant l'OCR
+    import pytesseract
+    from pdf2image import convert_from_path
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        images = convert_from_path(pdf_path, output_folder=temp_dir)
+        text = ""
+        for image in images:
+            text += pytesseract.image_to_string(image, lang='fra+eng') + "\n"
+    return {"page_count": len(images), "text": text}
+
+
+def _run_windowed(pdf_path):
+    from invoice_api import ocr
+    from invoice_api.extractors import TextExtractor
+
+    result = TextExtractor.extract_from_scanned_pdf(pdf_path)
+    executor = ocr.get_ocr_executor()
+    if executor is not None:
+        executor.shutdown(wait=True)
+    return result
+
+
+MODES = {'full': _run_full, 'windowed': _run_windowed}
+
+
+def _measure(mode, pdf_path, queue):
+    start = time.perf_counter()
+    try:
+        result = MODES[mode](pdf_path)
+    except Exception as e:
+        result = {"error": f"{type(e).__name__}: {str(e)}"}
+    queue.put({
+        "seconds": round(time.perf_counter() - start, 3),
+        "error": result.get("error"),
+        # ru_maxrss est exprimé en kilo-octets sous Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "peak_child_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    })
+
+
+def run(page_counts, modes, dpi):
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for pages in page_counts:
+            pdf_path = make_scanned_pdf(os.path.join(temp_dir, f"scan_{pages}.pdf"), pages, dpi)
+            for mode in modes:
+                queue = multiprocessing.Queue()
+                process = multiprocessing.Process(target=_measure, args=(mode, pdf_path, queue))
+                process.start()
+                measure = queue.get()
+                process.join()
+                measure.update({"mode": mode, "pages": pages})
+                results.append(measure)
+                print(f"{mode:>9} {pages:>5} pages  {measure['seconds']:>8.2f} s  "
+                      f"RSS {measure['peak_rss_mb']:>8.1f} Mo  "
+                      f"(enfants {measure['peak_child_rss_mb']:.1f} Mo)"
+                      + (f"  ERREUR: {measure['error']}" if measure['error'] else ""),
+                      file=sys.stderr)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--pages', type=int, nargs='+', default=[5, 20, 50])
+    parser.add_argument('--modes', nargs='+', choices=sorted(MODES), default=['full', 'windowed'])
+    parser.add_argument('--dpi', type=int, default=150, help="Résolution des pages générées")
+    parser.add_argument('--output', help="Fichier JSON de résultats")
+    args = parser.parse_args(argv)
+
+    results = run(args.pages, args.modes, args.dpi)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Latence de la recherche plein texte selon le nombre de factures indexées
+
+Les factures synthétiques (fournisseur, référence, montants et une vingtaine
+de lignes de texte) sont insérées dans une base de test temporaire, puis
+indexées par lots comme le fait `Invoice.bulk_set_extracted_text`. Chaque
+requête (référence exacte, fournisseur, montant, préfixe, mot fréquent) est
+mesurée avec `search_invoices` ; la base de développement n'est pas modifiée.
+
+    python -m benchmarks.search --invoices 10000 100000 1000000 --output search.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from .suite import percentile
+
+SUPPLIERS = ["Papeterie Durand", "ACME Corporation", "Transports Lefèvre", "Boulangerie Martin",
+             "Garage du Centre", "Imprimerie Moderne", "Électricité Bernard", "Café de la Gare"]
+WORDS = ["fourniture", "livraison", "prestation", "maintenance", "ramette", "cartouche", "câble",
+         "location", "abonnement", "transport", "réparation", "conseil", "formation", "licence"]
+BATCH_SIZE = 5000
+
+QUERIES = {
+    "reference": "FA-2024-{number:07d}",
+    "supplier": "transports lefèvre",
+    "amount": "{amount}",
+    "prefix": "mainten*",
+    "common_word": "livraison",
+}
+
+
+def make_invoice_text(rnd, number):
+    supplier = rnd.choice(SUPPLIERS)
+    lines = [supplier, f"FACTURE N° FA-2024-{number:07d} Date: 12/03/2024"]
+    total = 0
+    for _ in range(20):
+        amount = rnd.randint(100, 99999) / 100
+        total += amount
+        lines.append(f"{rnd.choice(WORDS)} {rnd.choice(WORDS)} {rnd.randint(1, 9)} {amount:.2f}".replace('.', ','))
+    lines.append(f"Total TTC {total:.2f}".replace('.', ','))
+    return supplier, round(total, 2), "\n".join(lines)
+
+
+def fill_index(count, seed=7):
+    """Crée `count` factures et leur ligne d'index ; retourne un montant existant"""
+    from django.db import transaction
+
+    from invoice_api.models import Invoice
+    from invoice_api.search import index_invoices
+
+    rnd = random.Random(seed)
+    sample_amount = None
+    for start in range(0, count, BATCH_SIZE):
+        invoices, texts = [], []
+        for number in range(start, min(count, start + BATCH_SIZE)):
+            supplier, total, text = make_invoice_text(rnd, number)
+            invoices.append(Invoice(file=f'invoices/{number}.pdf', processed=True,
+                                    numero_facture=f'FA-2024-{number:07d}', client_societe=supplier,
+                                    total_ttc=total))
+            texts.append(text)
+        sample_amount = sample_amount or f"{invoices[0].total_ttc:.2f}".replace('.', ',')
+        with transaction.atomic():
+            Invoice.objects.bulk_create(invoices, batch_size=500)
+            index_invoices(list(zip(invoices, texts)))
+    return sample_amount
+
+
+def run(counts, repeat, limit, work_dir):
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ml_server_app.settings')
+    import django
+    django.setup()
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+
+    from invoice_api.search import search_invoices
+
+    setup_test_environment()
+    results = []
+    for count in counts:
+        # Base de test sur disque (un million de factures ne tient pas en mémoire)
+        connection.settings_dict['TEST']['NAME'] = os.path.join(work_dir, f'search-{count}.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            start = time.perf_counter()
+            amount = fill_index(count)
+            entry = {"invoices": count, "index_seconds": round(time.perf_counter() - start, 2),
+                     "queries": {}}
+            for name, template in QUERIES.items():
+                query = template.format(number=count // 2, amount=amount)
+                seconds = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    found = search_invoices(query, limit)
+                    seconds.append(time.perf_counter() - start)
+                entry["queries"][name] = {
+                    "query": query,
+                    "results": len(found),
+                    "p50_ms": round(percentile(seconds, 0.5) * 1000, 2),
+                    "p99_ms": round(percentile(seconds, 0.99) * 1000, 2),
+                }
+            results.append(entry)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--invoices', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--output', help="Fichier JSON du rapport (sortie standard par défaut)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        report = json.dumps({"results": run(args.invoices, args.repeat, args.limit, work_dir)}, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
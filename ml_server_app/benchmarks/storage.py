@@ -0,0 +1,93 @@
+"""
+Lecture des documents avant extraction : fichier relu par étape ou contenu partagé
+
+Pour des PDF scannés de taille croissante, mesure la durée et le pic de
+mémoire Python (tracemalloc) des étapes qui lisent le fichier avant le texte
+des pages : empreinte SHA-256, identification du type et analyse par PyPDF2.
+- `per_step` : chaque étape ouvre et relit le fichier (empreinte par blocs,
+  en-tête, puis `PdfReader(chemin)`, qui copie le fichier en mémoire) ;
+- `shared` : un seul StoredDocument projeté en mémoire (mmap) sert aux trois
+  étapes (voir invoice_api/storage.py).
+
+    python -m benchmarks.storage --pages 10 50 200 --output storage.json
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from PyPDF2 import PdfReader
+
+from benchmarks.corpus import make_scanned_pdf
+from invoice_api.storage import PDF_HEADER_WINDOW, StoredDocument, sniff_file_type
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _per_step(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    with open(path, 'rb') as file:
+        sniffed = sniff_file_type(file.read(PDF_HEADER_WINDOW), complete=True)
+    reader = PdfReader(path)
+    return digest.hexdigest(), sniffed, len(reader.pages)
+
+
+def _shared(path):
+    with StoredDocument.from_path(path) as document:
+        reader = PdfReader(document.stream())
+        return document.sha256(), document.sniff(), len(reader.pages)
+
+
+def _measure(function, path, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = function(path)
+        durations.append(time.perf_counter() - start)
+    tracemalloc.start()
+    function(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return output, {"seconds": round(min(durations), 4), "peak_mb": round(peak / 1e6, 2)}
+
+
+def run(page_counts, repeat, dpi):
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        for pages in page_counts:
+            path = make_scanned_pdf(os.path.join(work_dir, f'scan-{pages}.pdf'), pages, dpi)
+            entry = {"pages": pages, "megabytes": round(os.path.getsize(path) / 1e6, 2)}
+            outputs = []
+            for name, function in (("per_step", _per_step), ("shared", _shared)):
+                output, entry[name] = _measure(function, path, repeat)
+                outputs.append(output)
+            entry["identical"] = outputs[0] == outputs[1]
+            results.append(entry)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--pages', type=int, nargs='+', default=[10, 50, 200])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--dpi', type=int, default=150)
+    parser.add_argument('--output', help="Fichier JSON du rapport (sortie standard par défaut)")
+    args = parser.parse_args(argv)
+
+    report = json.dumps({"results": run(args.pages, args.repeat, args.dpi)}, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
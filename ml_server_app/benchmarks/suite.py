@@ -0,0 +1,294 @@
+"""
+Banc d'essai de l'extraction et de l'API sur un corpus synthétique
+
+Le corpus (PDF textuels, PDF scannés, images) est généré hors ligne pour
+chaque nombre de pages demandé, puis mesuré à deux niveaux :
+- `extraction` : `TextExtractor.extract_from_file`, dans un processus neuf par
+  document ; débit, latences p50/p99 totales et par étape (mesures jointes au
+  résultat) et mémoire résidente maximale du processus ;
+- `api` : les endpoints de `InvoiceViewSet` via le client de test de DRF, sur
+  une base de test et un stockage temporaires (la base de développement n'est
+  pas modifiée). Le traitement des tâches par un worker est mesuré à part.
+
+Le fichier JSON produit contient le commit courant ; `--compare` affiche
+l'écart des latences médianes avec un fichier précédent.
+
+    python -m benchmarks.suite --pages 1 5 20 --repeat 5 --output bench.json
+    python -m benchmarks.suite --compare bench-main.json --output bench.json
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from .corpus import DOCUMENT_KINDS, make_corpus
+
+
+def percentile(values, fraction):
+    """Percentile par rang le plus proche (valeurs non vides)"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def _latency_summary(seconds):
+    if not seconds:
+        return {}
+    return {
+        "p50": round(percentile(seconds, 0.5), 4),
+        "p99": round(percentile(seconds, 0.99), 4),
+        "mean": round(sum(seconds) / len(seconds), 4),
+    }
+
+
+def _peak_rss_mb():
+    # ru_maxrss est exprimé en kilo-octets sous Linux
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(own / 1024, 1), round(children / 1024, 1)
+
+
+def _extract_document(document, repeat, queue):
+    from invoice_api import ocr
+    from invoice_api.extractors import TextExtractor
+
+    runs = []
+    errors = []
+    start_rss, _ = _peak_rss_mb()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = TextExtractor.extract_from_file(document["path"])
+        seconds = time.perf_counter() - start
+        if "error" in result:
+            errors.append(result["error"])
+        runs.append({"seconds": seconds,
+                     "stages": result.get("metrics", {}).get("stages", {})})
+
+    executor = ocr.get_ocr_executor()
+    if executor is not None:
+        executor.shutdown(wait=True)
+    peak_rss, peak_child_rss = _peak_rss_mb()
+    queue.put({"runs": runs, "errors": errors, "start_rss_mb": start_rss,
+               "peak_rss_mb": peak_rss, "peak_child_rss_mb": peak_child_rss})
+
+
+def run_extraction(documents, repeat):
+    """
+    Mesure l'extraction de chaque document dans un processus neuf
+
+    Returns:
+        list: Une entrée par document (débit, latences, étapes, mémoire)
+    """
+    results = []
+    for document in documents:
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=_extract_document, args=(document, repeat, queue))
+        process.start()
+        measure = queue.get()
+        process.join()
+
+        seconds = [run["seconds"] for run in measure["runs"]]
+        stage_names = sorted({name for run in measure["runs"] for name in run["stages"]})
+        total_seconds = sum(seconds)
+        entry = {
+            "kind": document["kind"],
+            "pages": document["pages"],
+            "bytes": document["bytes"],
+            "runs": len(seconds),
+            "errors": len(measure["errors"]),
+            "error": measure["errors"][0] if measure["errors"] else None,
+            "latency": _latency_summary(seconds),
+            "documents_per_second": round(len(seconds) / total_seconds, 2) if total_seconds else None,
+            "pages_per_second": round(len(seconds) * document["pages"] / total_seconds, 2) if total_seconds else None,
+            "stages": {
+                name: _latency_summary([run["stages"].get(name, 0.0) for run in measure["runs"]])
+                for name in stage_names
+            },
+            "start_rss_mb": measure["start_rss_mb"],
+            "peak_rss_mb": measure["peak_rss_mb"],
+            "peak_child_rss_mb": measure["peak_child_rss_mb"],
+        }
+        results.append(entry)
+        print(f"{entry['kind']:>12} {entry['pages']:>4} p.  "
+              f"p50 {entry['latency']['p50']:>8.4f} s  p99 {entry['latency']['p99']:>8.4f} s  "
+              f"{entry['pages_per_second']:>8} pages/s  RSS {entry['peak_rss_mb']:>7.1f} Mo"
+              + (f"  ERREUR: {entry['error']}" if entry['error'] else ""),
+              file=sys.stderr)
+    return results
+
+
+def run_api(documents, repeat, work_dir):
+    """
+    Mesure les endpoints de InvoiceViewSet sur une base de test temporaire
+
+    Returns:
+        list: Une entrée par endpoint (débit et latences)
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ml_server_app.settings')
+    import django
+    django.setup()
+    from django.db import connection
+    from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+    from rest_framework.test import APIClient
+
+    from invoice_api.jobs import run_worker
+    from invoice_api.models import InvoiceContent
+
+    # Stockage, cache et mesures isolés dans le dossier temporaire
+    cache_dir = os.path.join(work_dir, 'cache')
+    isolated = override_settings(MEDIA_ROOT=os.path.join(work_dir, 'media'), EXTRACTION_CACHE_DIR=cache_dir,
+                                 METRICS_DIR=os.path.join(work_dir, 'metrics'))
+    isolated.enable()
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0)
+    timings = {}
+
+    def timed(name, call, expected_status):
+        start = time.perf_counter()
+        response = call()
+        seconds = time.perf_counter() - start
+        if response.status_code != expected_status:
+            raise RuntimeError(f"{name} : statut {response.status_code} (attendu {expected_status})")
+        timings.setdefault(name, []).append(seconds)
+        return response
+
+    def upload(document, expected_status, name='create'):
+        with open(document["path"], 'rb') as file:
+            return timed(name, lambda: client.post(
+                '/api/invoices/', {'file': file}, format='multipart'), expected_status)
+
+    try:
+        client = APIClient()
+        # Extractions à froid : cache désactivé, chaque envoi passe par un worker
+        invoice_ids = []
+        with override_settings(EXTRACTION_CACHE_DIR=None):
+            for _ in range(repeat):
+                for document in documents:
+                    invoice_ids.append(upload(document, 202).data['invoice']['id'])
+                    start = time.perf_counter()
+                    run_worker('benchmark', max_jobs=1)
+                    timings.setdefault('worker_job', []).append(time.perf_counter() - start)
+
+        # Envois d'un fichier déjà analysé : réponse directe depuis le cache
+        for invoice_id in invoice_ids[:len(documents)]:
+            timed('extract', lambda: client.get(f'/api/invoices/{invoice_id}/extract/?refresh=1'), 200)
+        extracted = set(InvoiceContent.objects.exclude(etag='').values_list('invoice_id', flat=True))
+        for document, invoice_id in zip(documents, invoice_ids):
+            if invoice_id in extracted:
+                for _ in range(repeat):
+                    upload(document, 201, name='create_cached')
+
+        for invoice_id in invoice_ids:
+            timed('retrieve', lambda: client.get(f'/api/invoices/{invoice_id}/'), 200)
+            timed('status', lambda: client.get(f'/api/invoices/{invoice_id}/status/'), 200)
+            timed('extract_cached', lambda: client.get(f'/api/invoices/{invoice_id}/extract/'), 200)
+            # Le texte formaté n'existe que pour les extractions réussies
+            if invoice_id not in extracted:
+                continue
+            response = timed('formatted_text_json',
+                             lambda: client.get(f'/api/invoices/{invoice_id}/formatted_text/'), 200)
+            timed('formatted_text_html',
+                  lambda: client.get(f'/api/invoices/{invoice_id}/formatted_text/?format=html'), 200)
+            timed('formatted_text_304', lambda: client.get(
+                f'/api/invoices/{invoice_id}/formatted_text/',
+                HTTP_IF_NONE_MATCH=response['ETag']), 304)
+
+        for _ in range(repeat):
+            timed('list', lambda: client.get('/api/invoices/'), 200)
+            timed('list_summary', lambda: client.get('/api/invoices/?view=summary'), 200)
+            timed('list_filtered', lambda: client.get(
+                '/api/invoices/?view=summary&total_min=100&date_from=2024-01-01'), 200)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+        isolated.disable()
+
+    results = []
+    for name, seconds in timings.items():
+        total_seconds = sum(seconds)
+        entry = {
+            "endpoint": name,
+            "requests": len(seconds),
+            "latency": _latency_summary(seconds),
+            "requests_per_second": round(len(seconds) / total_seconds, 2) if total_seconds else None,
+        }
+        results.append(entry)
+        print(f"{name:>20}  {entry['requests']:>4} req.  p50 {entry['latency']['p50']:>8.4f} s  "
+              f"p99 {entry['latency']['p99']:>8.4f} s  {entry['requests_per_second']:>8} req/s",
+              file=sys.stderr)
+    results.append({"endpoint": "process", "peak_rss_mb": _peak_rss_mb()[0]})
+    return results
+
+
+def _git_revision():
+    def git(*args):
+        return subprocess.run(['git', *args], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    try:
+        return {"commit": git('rev-parse', 'HEAD') or None,
+                "dirty": bool(git('status', '--porcelain', '--untracked-files=no'))}
+    except OSError:
+        return {"commit": None, "dirty": None}
+
+
+def compare(previous, current):
+    """Affiche l'écart des latences médianes entre deux exécutions"""
+    def medians(report):
+        values = {}
+        for entry in report.get("extraction", []):
+            values[f"extraction {entry['kind']} {entry['pages']} p."] = entry["latency"].get("p50")
+        for entry in report.get("api", []):
+            if "latency" in entry:
+                values[f"api {entry['endpoint']}"] = entry["latency"].get("p50")
+        return values
+
+    before, after = medians(previous), medians(current)
+    print(f"Comparaison avec {previous.get('git', {}).get('commit')}", file=sys.stderr)
+    for key in sorted(set(before) & set(after)):
+        if before[key] and after[key]:
+            print(f"{key:>40}  {before[key]:>8.4f} s -> {after[key]:>8.4f} s  "
+                  f"({(after[key] / before[key] - 1):+.0%})", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--kinds', nargs='+', choices=sorted(DOCUMENT_KINDS), default=sorted(DOCUMENT_KINDS))
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 5, 20], help="Pages par document")
+    parser.add_argument('--dpi', type=int, default=150, help="Résolution des documents scannés")
+    parser.add_argument('--repeat', type=int, default=3, help="Répétitions par document")
+    parser.add_argument('--skip-api', action='store_true', help="Ne mesurer que l'extraction")
+    parser.add_argument('--compare', help="Fichier JSON d'une exécution précédente")
+    parser.add_argument('--output', help="Fichier JSON de résultats")
+    args = parser.parse_args(argv)
+
+    report = {
+        "git": _git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created_at": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        "options": {"kinds": args.kinds, "pages": args.pages, "dpi": args.dpi, "repeat": args.repeat},
+    }
+    with tempfile.TemporaryDirectory() as work_dir:
+        corpus_dir = os.path.join(work_dir, 'corpus')
+        os.makedirs(corpus_dir)
+        documents = make_corpus(corpus_dir, args.kinds, args.pages, args.dpi)
+        report["extraction"] = run_extraction(documents, args.repeat)
+        if not args.skip_api:
+            report["api"] = run_api(documents, args.repeat, work_dir)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            compare(json.load(file), report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,28 @@
 from django.contrib import admin
-from .models import Invoice
+from .models import Invoice, InvoiceContent, ExtractionBatch, ExtractionJob
 
 @admin.register(Invoice)
 class InvoiceAdmin(admin.ModelAdmin):
-    list_display = ('id', 'uploaded_at', 'processed')
-    list_filter = ('processed', 'uploaded_at')
-    search_fields = ('id',)
\ No newline at end of file
+    list_display = ('id', 'uploaded_at', 'processed', 'numero_facture', 'date_piece', 'total_ttc')
+    list_filter = ('processed', 'uploaded_at', 'document_type')
+    raw_id_fields = ('batch', 'duplicate_of')
+    search_fields = ('id', 'numero_facture', 'numero_commande', 'client_siret', 'client_tva')
+
+
+@admin.register(InvoiceContent)
+class InvoiceContentAdmin(admin.ModelAdmin):
+    list_display = ('invoice',)
+    search_fields = ('invoice__id',)
+
+
+@admin.register(ExtractionBatch)
+class ExtractionBatchAdmin(admin.ModelAdmin):
+    list_display = ('id', 'created_at')
+    list_filter = ('created_at',)
+
+
+@admin.register(ExtractionJob)
+class ExtractionJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'invoice', 'status', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('id', 'invoice__id')
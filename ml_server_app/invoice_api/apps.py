@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class InvoiceApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'invoice_api'
+
+    def ready(self):
+        from django.db.models.signals import post_migrate
+
+        from .search import reset_availability
+
+        # L'index de recherche est créé ou supprimé par la migration 0008
+        post_migrate.connect(reset_availability, sender=self)
@@ -0,0 +1,250 @@
+"""
+Endpoints asynchrones (ASGI) : téléchargement, nouvelle extraction et texte formaté
+
+Sous un serveur ASGI (uvicorn, daphne...), une vue DRF synchrone occupe un
+thread pendant toute l'extraction. Ces vues attendent l'extraction sans
+bloquer la boucle d'événements :
+- l'extraction est confiée à un pool de processus borné
+  (ASYNC_EXTRACTION_PROCESSES) ;
+- l'analyse du corps de la requête et l'écriture du fichier dans le stockage
+  s'exécutent dans des threads (asyncio.to_thread) ;
+- les requêtes SQL passent par l'ORM asynchrone.
+
+Au-delà de ASYNC_EXTRACTION_MAX_PENDING extractions en cours dans le
+processus, les nouvelles demandes reçoivent 503. Contrairement à l'endpoint
+synchrone, qui met l'extraction en file d'attente, le téléchargement renvoie
+la facture une fois extraite (201).
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from asgiref.sync import sync_to_async
+from django.core.files.storage import default_storage
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from .cache import extract_stored_with_cache
+from .conf import get_setting
+from .models import Invoice, InvoiceContent
+from .ocr import limit_ocr_processes
+from .serializers import InvoiceSerializer
+from .uploads import check_uploaded_file, get_upload_handlers
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = 0
+_pending_lock = threading.Lock()
+
+
+def get_extraction_executor():
+    """
+    Retourne le pool de processus des extractions asynchrones
+
+    Returns:
+        ProcessPoolExecutor: Pool partagé, ou None si les extractions s'exécutent
+                             dans des threads du processus (ASYNC_EXTRACTION_PROCESSES = 0)
+    """
+    global _executor
+    processes = get_setting('ASYNC_EXTRACTION_PROCESSES')
+    if processes == 0:
+        return None
+
+    with _executor_lock:
+        if _executor is None:
+            # spawn : le serveur ASGI a des threads actifs, qu'un fork copierait
+            # dans un état incohérent
+            _executor = ProcessPoolExecutor(
+                max_workers=processes or os.cpu_count() or 1,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=limit_ocr_processes,
+                initargs=(1,),
+            )
+        return _executor
+
+
+def _reset_extraction_executor(executor):
+    """Abandonne un pool devenu inutilisable (processus tué, par exemple)"""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def run_extraction(name, content_hash=None, refresh=False):
+    """
+    Extrait le texte d'un fichier (cache compris) sans bloquer la boucle d'événements
+
+    Seul le nom du fichier dans le stockage est transmis au pool : le
+    processus d'extraction lit lui-même le contenu (voir storage.py).
+
+    Returns:
+        tuple: (résultat de l'extraction, True si le résultat vient du cache)
+    """
+    executor = get_extraction_executor()
+    if executor is None:
+        return await asyncio.to_thread(extract_stored_with_cache, name, content_hash, refresh)
+
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(executor, extract_stored_with_cache, name, content_hash, refresh)
+    except BrokenProcessPool:
+        _reset_extraction_executor(executor)
+        raise
+
+
+def _acquire_slot():
+    global _pending
+    with _pending_lock:
+        if _pending >= get_setting('ASYNC_EXTRACTION_MAX_PENDING'):
+            return False
+        _pending += 1
+        return True
+
+
+def _release_slot():
+    global _pending
+    with _pending_lock:
+        _pending -= 1
+
+
+def _error(message, status):
+    return JsonResponse({'status': 'error', 'message': message}, status=status)
+
+
+def _busy():
+    response = _error("Trop d'extractions en cours, réessayer plus tard", 503)
+    response['Retry-After'] = '5'
+    return response
+
+
+async def _serialize(request, invoice):
+    return await sync_to_async(lambda: InvoiceSerializer(invoice, context={'request': request}).data)()
+
+
+async def _extract_and_store(invoice, refresh=False):
+    extracted_data, cached = await run_extraction(invoice.file.name, invoice.sha256 or None, refresh)
+    await sync_to_async(invoice.set_extracted_text)(extracted_data)
+    return cached
+
+
+async def _discard_upload(invoice, name):
+    """Supprime la facture et le fichier d'un téléchargement dont l'extraction a échoué"""
+    if invoice is not None:
+        await invoice.adelete()
+    if name is not None:
+        await asyncio.to_thread(default_storage.delete, name)
+
+
+@csrf_exempt
+@require_POST
+async def upload_invoice(request):
+    """
+    Endpoint asynchrone pour télécharger une facture et attendre son extraction
+    """
+    request.upload_handlers = get_upload_handlers(request)
+    # Le corps est analysé (copie, empreinte, type) hors de la boucle d'événements
+    files = await asyncio.to_thread(lambda: request.FILES)
+    uploaded = files.get('file')
+
+    rejection = check_uploaded_file(request, uploaded)
+    if rejection:
+        return _error(rejection['message'], rejection['status'])
+    if uploaded is None:
+        return _error('Aucun fichier fourni', 400)
+
+    duplicate = await Invoice.objects.filter(sha256=uploaded.sha256).order_by('id').afirst()
+    if duplicate:
+        return JsonResponse({
+            'status': 'success',
+            'message': 'Facture déjà téléchargée',
+            'duplicate': True,
+            'invoice': await _serialize(request, duplicate)
+        })
+
+    if not _acquire_slot():
+        return _busy()
+    name = invoice = None
+    try:
+        file_field = Invoice._meta.get_field('file')
+        name = await asyncio.to_thread(
+            default_storage.save, file_field.generate_filename(None, uploaded.name), uploaded)
+        invoice = await Invoice.objects.acreate(file=name, sha256=uploaded.sha256)
+        cached = await _extract_and_store(invoice)
+    except Exception as e:
+        # Rien n'est conservé : un nouvel envoi du fichier ne doit pas être pris
+        # pour le doublon d'une facture sans texte extrait
+        await _discard_upload(invoice, name)
+        return _error(f"Erreur lors de l'extraction : {type(e).__name__}: {str(e)}", 500)
+    finally:
+        _release_slot()
+
+    return JsonResponse({
+        'status': 'success',
+        'message': 'Facture téléchargée et traitée avec succès',
+        'cached': cached,
+        'invoice': await _serialize(request, invoice)
+    }, status=201)
+
+
+@require_GET
+async def extract_invoice(request, pk):
+    """
+    Endpoint asynchrone pour extraire à nouveau le texte d'une facture (?refresh=1)
+    """
+    invoice = await Invoice.objects.filter(pk=pk).afirst()
+    if invoice is None:
+        return _error('Facture non trouvée', 404)
+    if not await asyncio.to_thread(invoice.file.storage.exists, invoice.file.name):
+        return _error('Fichier non trouvé', 404)
+
+    if not _acquire_slot():
+        return _busy()
+    try:
+        cached = await _extract_and_store(invoice, refresh=request.GET.get('refresh') in ('1', 'true'))
+    except Exception as e:
+        return _error(f"Erreur lors de l'extraction : {type(e).__name__}: {str(e)}", 500)
+    finally:
+        _release_slot()
+
+    return JsonResponse({
+        'status': 'success',
+        'message': 'Texte extrait avec succès',
+        'cached': cached,
+        'invoice': await _serialize(request, invoice)
+    })
+
+
+@require_GET
+async def formatted_text(request, pk):
+    """
+    Endpoint asynchrone pour obtenir le texte formaté (JSON, ou HTML avec ?format=html)
+    """
+    kind = 'html' if request.GET.get('format') == 'html' else 'json'
+    content = await (InvoiceContent.objects.filter(invoice_id=pk)
+                     .only('invoice_id', 'etag', 'updated_at').afirst())
+    if content is None or not content.etag:
+        return _error('Aucun texte extrait disponible', 404)
+
+    etag = content.http_etag(kind)
+    last_modified = content.updated_at.timestamp()
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        content = await (InvoiceContent.objects
+                         .only('invoice_id', 'etag', 'render_version', 'rendered_html', 'rendered_json')
+                         .aget(pk=content.pk))
+        body = await sync_to_async(content.get_rendered)(kind)
+        content_type = 'text/html; charset=utf-8' if kind == 'html' else 'application/json'
+        response = HttpResponse(body, content_type=content_type)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, no_cache=True)
+    return response
@@ -0,0 +1,202 @@
+"""
+Téléchargement de factures par lots
+
+Les fichiers reçus (ou les membres d'une archive ZIP) sont copiés un par un
+dans le stockage, par blocs, sans décompresser l'archive en mémoire. Toutes
+les factures du lot et leurs tâches d'extraction sont ensuite créées en une
+seule transaction. L'empreinte SHA-256 de chaque fichier est calculée pendant
+la copie (ou reprise de la réception, voir uploads.py).
+
+Les membres d'une archive subissent les mêmes contrôles que les fichiers
+reçus : type réel d'après la signature et taille maximale par fichier. Un
+fichier identique à une facture existante, ou à un autre fichier du lot,
+n'est pas enregistré ; il figure parmi les fichiers ignorés.
+"""
+import hashlib
+import os
+import zipfile
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from .conf import get_setting
+from .extractors import SUPPORTED_EXTENSIONS
+from .models import ExtractionBatch, ExtractionJob, Invoice
+from .storage import PDF_HEADER_WINDOW, sniff_file_type
+from .uploads import max_upload_bytes
+
+
+class BatchUploadError(Exception):
+    """Lot refusé (archive invalide, limites dépassées, aucun fichier pris en charge)"""
+
+
+def _iter_zip_members(uploaded):
+    try:
+        archive = zipfile.ZipFile(uploaded)
+    except zipfile.BadZipFile:
+        raise BatchUploadError(f"Archive ZIP invalide : {uploaded.name}")
+
+    with archive:
+        for info in archive.infolist():
+            if info.is_dir():
+                continue
+            # Taille déclarée : la lecture du membre ne la dépasse jamais
+            yield info.filename, info.file_size, lambda info=info: archive.open(info)
+
+
+def iter_batch_files(uploaded_files):
+    """
+    Parcourt les fichiers d'un lot, en développant les archives ZIP
+
+    Yields:
+        tuple: (nom, taille, fonction ouvrant le fichier)
+    """
+    for uploaded in uploaded_files:
+        if os.path.splitext(uploaded.name)[1].lower() == '.zip':
+            yield from _iter_zip_members(uploaded)
+        else:
+            yield uploaded.name, uploaded.size, lambda uploaded=uploaded: uploaded
+
+
+class _HashingReader:
+    """Calcule l'empreinte SHA-256 des données au fil de leur lecture"""
+
+    def __init__(self, file):
+        self.file = file
+        self.digest = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.file.read(size)
+        self.digest.update(data)
+        return data
+
+
+def _save_file(content, base_name, file_field):
+    """
+    Copie un fichier dans le stockage
+
+    Returns:
+        tuple: (nom enregistré, empreinte SHA-256)
+    """
+    content_hash = getattr(content, 'sha256', None)
+    reader = content if content_hash else _HashingReader(content)
+    name = default_storage.save(file_field.generate_filename(None, base_name),
+                                File(reader, name=base_name))
+    return name, content_hash or reader.digest.hexdigest()
+
+
+def _skip_reason(name):
+    base_name = os.path.basename(name)
+    if not base_name or base_name.startswith('.') or name.startswith('__MACOSX/'):
+        return "Fichier caché ou métadonnées d'archive"
+    if os.path.splitext(base_name)[1].lower() not in SUPPORTED_EXTENSIONS:
+        return "Format de fichier non pris en charge"
+    return None
+
+
+def _check_member(content, size):
+    """
+    Contrôle un membre d'archive comme un fichier reçu (voir uploads.py)
+
+    Returns:
+        str: Motif du refus, ou None si le membre est accepté
+    """
+    # Tout le membre, ou au moins la fenêtre d'en-tête, est lu : le type est connu
+    sniffed = sniff_file_type(content.read(PDF_HEADER_WINDOW), complete=True)
+    content.seek(0)
+    if not sniffed or sniffed[0] not in ('pdf', 'image'):
+        return "Type de fichier non pris en charge"
+    limit = max_upload_bytes(sniffed[0])
+    if size > limit:
+        return f"Fichier trop volumineux (plus de {limit} octets)"
+    return None
+
+
+def create_batch(uploaded_files, rejected=()):
+    """
+    Enregistre les fichiers d'un lot et met leur extraction en file d'attente
+
+    Args:
+        uploaded_files: Fichiers reçus (UploadedFile), PDF, images ou archives ZIP
+        rejected: Fichiers déjà refusés à la réception ({'name': ..., 'reason': ...})
+
+    Returns:
+        ExtractionBatch: Lot créé
+
+    Raises:
+        BatchUploadError: Si le lot est refusé ; aucun fichier n'est alors conservé
+    """
+    max_files = get_setting('BATCH_MAX_FILES')
+    max_bytes = get_setting('BATCH_MAX_BYTES')
+    file_field = Invoice._meta.get_field('file')
+
+    saved = []
+    skipped = list(rejected)
+    total_bytes = 0
+    # Empreinte → nom des fichiers déjà retenus dans le lot
+    seen = {}
+    duplicates = 0
+    try:
+        for name, size, open_file in iter_batch_files(uploaded_files):
+            reason = _skip_reason(name)
+            if reason:
+                skipped.append({'name': name, 'reason': reason})
+                continue
+
+            if len(saved) >= max_files:
+                raise BatchUploadError(f"Le lot dépasse {max_files} fichiers")
+            total_bytes += size
+            if total_bytes > max_bytes:
+                raise BatchUploadError(f"Le lot dépasse {max_bytes} octets une fois décompressé")
+
+            # Seul le nom de base est conservé : les chemins de l'archive sont ignorés
+            base_name = os.path.basename(name)
+            try:
+                with open_file() as content:
+                    # Les fichiers reçus directement ont été contrôlés à la réception
+                    reason = None if hasattr(content, 'sha256') else _check_member(content, size)
+                    if reason is None:
+                        stored_name, content_hash = _save_file(content, base_name, file_field)
+            except zipfile.BadZipFile:
+                reason = "Membre de l'archive illisible"
+            if reason is None and content_hash in seen:
+                default_storage.delete(stored_name)
+                reason = f"Doublon de {seen[content_hash]} dans le lot"
+                duplicates += 1
+            if reason:
+                skipped.append({'name': name, 'reason': reason})
+                continue
+            seen[content_hash] = name
+            saved.append((name, stored_name, content_hash))
+
+        if not saved and not duplicates:
+            raise BatchUploadError("Aucun fichier pris en charge dans le lot")
+
+        with transaction.atomic():
+            # Fichiers identiques à une facture existante : ni enregistrés ni extraits
+            existing = dict(
+                Invoice.objects.filter(sha256__in=seen).order_by('-id').values_list('sha256', 'id')
+            )
+            for name, stored_name, content_hash in saved:
+                if content_hash in existing:
+                    default_storage.delete(stored_name)
+                    skipped.append({'name': name,
+                                    'reason': f"Doublon de la facture {existing[content_hash]}"})
+            saved = [entry for entry in saved if entry[2] not in existing]
+
+            batch = ExtractionBatch.objects.create(skipped=skipped)
+            invoices = Invoice.objects.bulk_create(
+                [Invoice(file=stored_name, sha256=content_hash, batch=batch)
+                 for _, stored_name, content_hash in saved]
+            )
+            max_attempts = get_setting('EXTRACTION_JOB_MAX_ATTEMPTS')
+            ExtractionJob.objects.bulk_create(
+                [ExtractionJob(invoice=invoice, max_attempts=max_attempts) for invoice in invoices]
+            )
+    except BaseException:
+        for _, stored_name, _ in saved:
+            default_storage.delete(stored_name)
+        raise
+
+    return batch
@@ -0,0 +1,315 @@
+"""
+Extraction en masse, sans passer par l'API
+
+Les fichiers d'un dossier (ou d'une liste) sont traités par un pool de
+processus et chaque résultat est écrit immédiatement dans un fichier JSON
+Lines (une ligne par fichier : chemin, statut, durée, résultat). Une
+extraction interrompue reprend avec `resume` : les fichiers déjà présents
+dans la sortie sont ignorés.
+
+Les factures dont le fichier correspond peuvent être mises à jour par lots
+(`update_invoices`), ce qui nécessite Django configuré. Sans cette option,
+le module fonctionne hors de Django :
+
+    python -m invoice_api.bulk media/invoices --output extraction.jsonl
+    python manage.py bulk_extract media/invoices --output extraction.jsonl --update-invoices
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from .extractors import SUPPORTED_EXTENSIONS, TextExtractor
+from .ocr import limit_ocr_processes
+
+
+class BulkExtractionError(Exception):
+    """Paramètres de l'extraction en masse invalides (sortie illisible, reprise impossible...)"""
+
+
+def iter_input_files(paths, file_list=None):
+    """
+    Parcourt les fichiers pris en charge des chemins donnés
+
+    Args:
+        paths: Fichiers ou dossiers (parcourus récursivement, dans l'ordre alphabétique)
+        file_list: Fichier texte contenant un chemin par ligne (optionnel)
+
+    Yields:
+        str: Chemin absolu de chaque fichier
+    """
+    candidates = list(paths)
+    if file_list:
+        with open(file_list, 'r', encoding='utf-8') as file:
+            candidates += [line.strip() for line in file if line.strip()]
+
+    for path in candidates:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if os.path.splitext(name)[1].lower() in SUPPORTED_EXTENSIONS:
+                        yield os.path.abspath(os.path.join(root, name))
+        elif os.path.splitext(path)[1].lower() in SUPPORTED_EXTENSIONS:
+            yield os.path.abspath(path)
+
+
+def read_completed(output_path, retry_errors=False):
+    """
+    Relit une sortie JSON Lines existante pour reprendre l'extraction
+
+    Une dernière ligne incomplète (interruption pendant l'écriture) est retirée
+    du fichier.
+
+    Returns:
+        set: Chemins déjà traités (hors erreurs si `retry_errors`)
+    """
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+
+    with open(output_path, 'rb+') as file:
+        valid_size = 0
+        for line in file:
+            if not line.endswith(b'\n'):
+                break
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            valid_size += len(line)
+            if retry_errors and record.get('status') == 'error':
+                completed.discard(record['path'])
+            else:
+                completed.add(record['path'])
+        file.truncate(valid_size)
+    return completed
+
+
+def _extract(path):
+    start = time.perf_counter()
+    try:
+        result = TextExtractor.extract_from_file(path)
+    except Exception as e:
+        result = {"error": f"Erreur inattendue: {type(e).__name__}: {str(e)}"}
+    return path, result, time.perf_counter() - start
+
+
+class _InvoiceUpdater:
+    """Met à jour par lots les factures dont le fichier correspond aux résultats"""
+
+    def __init__(self, batch_size):
+        from django.core.files.storage import default_storage
+
+        from .storage import storage_path
+
+        # Dossier du stockage des factures : les fichiers lus doivent s'y trouver
+        root = storage_path('', default_storage)
+        if root is None:
+            raise BulkExtractionError("La mise à jour des factures nécessite un stockage local des fichiers")
+        self.batch_size = batch_size
+        self.media_root = os.path.abspath(root)
+        self.pending = []
+        self.updated = 0
+
+    def add(self, path, result):
+        relative = os.path.relpath(path, self.media_root)
+        if relative.startswith(os.pardir + os.sep):
+            return
+        self.pending.append((relative.replace(os.sep, '/'), result))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        from .models import Invoice
+
+        if not self.pending:
+            return
+        results = dict(self.pending)
+        self.pending = []
+        invoices = Invoice.objects.filter(file__in=list(results)).only('id', 'file')
+        items = [(invoice, results[invoice.file.name]) for invoice in invoices]
+        Invoice.bulk_set_extracted_text(items)
+        self.updated += len(items)
+
+
+def run_bulk_extraction(paths, output, file_list=None, processes=None, ocr_processes=1,
+                        resume=False, retry_errors=False, update_invoices=False,
+                        batch_size=100, progress=None, progress_interval=2.0):
+    """
+    Extrait le texte d'un ensemble de fichiers avec un pool de processus
+
+    Args:
+        paths: Fichiers ou dossiers à traiter
+        output: Chemin du fichier JSON Lines, ou flux texte ouvert (sys.stdout)
+        file_list: Fichier texte contenant un chemin par ligne
+        processes: Nombre de processus d'extraction (nombre de cœurs par défaut)
+        ocr_processes: Processus OCR par processus d'extraction
+        resume: Ignorer les fichiers déjà présents dans la sortie
+        retry_errors: Avec `resume`, traiter à nouveau les fichiers en erreur
+        update_invoices: Mettre à jour les factures correspondantes (Django requis)
+        batch_size: Nombre de résultats par mise à jour des factures
+        progress: Fonction appelée périodiquement avec les compteurs en cours
+        progress_interval: Intervalle (secondes) entre deux appels de `progress`
+
+    Returns:
+        dict: Compteurs (fichiers, erreurs, ignorés, octets, durée, factures mises à jour)
+
+    Raises:
+        BulkExtractionError: Si la reprise est demandée sans fichier de sortie
+    """
+    to_file = isinstance(output, (str, os.PathLike))
+    if resume and not to_file:
+        raise BulkExtractionError("La reprise nécessite un fichier de sortie")
+    completed = read_completed(output, retry_errors) if resume else set()
+
+    files = [path for path in dict.fromkeys(iter_input_files(paths, file_list)) if path not in completed]
+    stats = {
+        "total": len(files),
+        "done": 0,
+        "errors": 0,
+        "skipped": len(completed),
+        "bytes": 0,
+        "seconds": 0.0,
+        "invoices_updated": 0,
+    }
+    updater = _InvoiceUpdater(batch_size) if update_invoices else None
+    if update_invoices:
+        # Les connexions ne doivent pas être partagées avec les processus du pool
+        from django.db import connections
+        connections.close_all()
+
+    processes = processes or os.cpu_count() or 1
+    stream = open(output, 'a' if resume else 'w', encoding='utf-8') if to_file else output
+    start = time.perf_counter()
+    last_report = start
+    try:
+        with ProcessPoolExecutor(max_workers=processes, initializer=limit_ocr_processes,
+                                 initargs=(ocr_processes,)) as executor:
+            remaining = iter(files)
+            in_flight = set()
+            try:
+                while True:
+                    # Fenêtre glissante : les résultats ne s'accumulent pas en mémoire
+                    while len(in_flight) < processes * 2:
+                        path = next(remaining, None)
+                        if path is None:
+                            break
+                        in_flight.add(executor.submit(_extract, path))
+                    if not in_flight:
+                        break
+
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        path, result, seconds = future.result()
+                        failed = "error" in result
+                        stream.write(json.dumps({
+                            "path": path,
+                            "status": "error" if failed else "ok",
+                            "seconds": round(seconds, 3),
+                            "result": result,
+                        }, ensure_ascii=False, default=str) + "\n")
+                        stream.flush()
+
+                        stats["done"] += 1
+                        stats["errors"] += failed
+                        stats["bytes"] += os.path.getsize(path) if os.path.exists(path) else 0
+                        if updater is not None:
+                            updater.add(path, result)
+
+                    now = time.perf_counter()
+                    if progress and now - last_report >= progress_interval:
+                        stats["seconds"] = now - start
+                        progress(dict(stats))
+                        last_report = now
+            except BaseException:
+                # Interruption : les fichiers en attente ne sont pas lancés
+                for future in in_flight:
+                    future.cancel()
+                raise
+    finally:
+        if updater is not None:
+            updater.flush()
+            stats["invoices_updated"] = updater.updated
+        if to_file:
+            stream.close()
+        stats["seconds"] = time.perf_counter() - start
+
+    if progress:
+        progress(dict(stats))
+    return stats
+
+
+def format_progress(stats):
+    """Met en forme les compteurs d'avancement sur une ligne"""
+    seconds = stats["seconds"] or 1e-9
+    rate = stats["done"] / seconds
+    eta = (stats["total"] - stats["done"]) / rate if rate else 0
+    return (f"{stats['done']}/{stats['total']} fichier(s)  {rate:.1f} fichiers/s  "
+            f"{stats['bytes'] / seconds / 1e6:.2f} Mo/s  erreurs {stats['errors']}  "
+            f"reste ~{eta:.0f} s")
+
+
+def add_arguments(parser):
+    """Options communes à la commande `bulk_extract` et à `python -m invoice_api.bulk`"""
+    parser.add_argument('paths', nargs='*', help="Fichiers ou dossiers à traiter")
+    parser.add_argument('--file-list', help="Fichier texte contenant un chemin par ligne")
+    parser.add_argument('--output', '-o', default='-',
+                        help="Fichier JSON Lines de résultats (sortie standard par défaut)")
+    parser.add_argument('--processes', type=int, default=None,
+                        help="Processus d'extraction (nombre de cœurs par défaut)")
+    parser.add_argument('--ocr-processes', type=int, default=1,
+                        help="Processus OCR par processus d'extraction")
+    parser.add_argument('--resume', action='store_true',
+                        help="Reprendre : ignorer les fichiers déjà présents dans la sortie")
+    parser.add_argument('--retry-errors', action='store_true',
+                        help="Avec --resume, traiter à nouveau les fichiers en erreur")
+    parser.add_argument('--update-invoices', action='store_true',
+                        help="Mettre à jour les factures dont le fichier correspond")
+    parser.add_argument('--batch-size', type=int, default=100,
+                        help="Résultats par mise à jour des factures")
+
+
+def run_from_options(options, progress):
+    """Lance l'extraction à partir des options analysées par `add_arguments`"""
+    if not options['paths'] and not options['file_list']:
+        raise BulkExtractionError("Aucun fichier ou dossier à traiter")
+    output = sys.stdout if options['output'] == '-' else options['output']
+    return run_bulk_extraction(
+        options['paths'], output,
+        file_list=options['file_list'],
+        processes=options['processes'],
+        ocr_processes=options['ocr_processes'],
+        resume=options['resume'],
+        retry_errors=options['retry_errors'],
+        update_invoices=options['update_invoices'],
+        batch_size=options['batch_size'],
+        progress=progress,
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    add_arguments(parser)
+    options = vars(parser.parse_args(argv))
+
+    if options['update_invoices']:
+        os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ml_server_app.settings')
+        import django
+        django.setup()
+
+    try:
+        stats = run_from_options(options, lambda stats: print(format_progress(stats), file=sys.stderr))
+    except BulkExtractionError as e:
+        parser.error(str(e))
+    except KeyboardInterrupt:
+        print("Interrompu : relancer avec --resume pour continuer", file=sys.stderr)
+        sys.exit(130)
+    if options['update_invoices']:
+        print(f"{stats['invoices_updated']} facture(s) mise(s) à jour", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
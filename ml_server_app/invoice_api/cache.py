@@ -0,0 +1,248 @@
+"""
+Cache des résultats d'extraction, indexé par le contenu des fichiers
+
+La clé combine l'empreinte SHA-256 du fichier, la version des extracteurs et
+celle du jeu de patterns regex : un même document téléchargé plusieurs fois
+n'est analysé (PDF ou OCR) qu'une seule fois tant que ni le code ni les
+patterns ne changent.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+from . import metrics
+from .conf import get_setting
+from .extractors import EXTRACTOR_VERSION, TextExtractor
+from .patterns import pattern_registry
+from .storage import StoredDocument, open_document
+
+
+def compute_file_hash(source):
+    """
+    Calcule l'empreinte SHA-256 d'un fichier
+
+    Args:
+        source: Chemin local ou StoredDocument (contenu partagé avec l'extraction)
+
+    Returns:
+        str: Empreinte hexadécimale
+    """
+    with open_document(source) as document:
+        return document.sha256()
+
+
+class ExtractionCache:
+    """
+    Cache disque à éviction LRU bornée en taille
+
+    Chaque entrée est un fichier JSON ; sa date de modification est mise à jour
+    à chaque lecture et sert d'horodatage LRU. Les compteurs de succès et
+    d'échecs sont propres au processus courant.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._size = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(content_hash):
+        """Clé d'une entrée pour un fichier, la version des extracteurs et des patterns"""
+        material = f"{content_hash}:{EXTRACTOR_VERSION}:{pattern_registry.version}"
+        # Le mode mise en page ajoute les positions au résultat
+        if get_setting('PDF_LAYOUT_EXTRACTION'):
+            material += ":layout"
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        # Sous-dossiers pour éviter des répertoires de plusieurs milliers de fichiers
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key):
+        """
+        Retourne le résultat mis en cache pour une clé
+
+        Returns:
+            dict: Résultat de `process_extracted_text`, ou None en cas d'absence
+        """
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                entry = json.load(file)
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            metrics.increment('cache_misses')
+            return None
+
+        with self._lock:
+            self.hits += 1
+            self.saved_seconds += entry.get("seconds", 0.0)
+        metrics.increment('cache_hits')
+        return entry["result"]
+
+    def set(self, key, result, seconds=0.0):
+        """
+        Enregistre un résultat puis évince les entrées les plus anciennes si
+        la taille maximale est dépassée
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        payload = json.dumps({"seconds": round(seconds, 3), "result": result})
+
+        # Écriture atomique : un lecteur concurrent ne voit jamais d'entrée partielle
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            file.write(payload)
+        os.replace(temp_path, path)
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(payload.encode('utf-8'))
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.json'):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield stat.st_mtime, stat.st_size, path
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        # Descendre sous 90 % de la limite pour ne pas évincer à chaque écriture
+        entries = sorted(self._entries())
+        size = sum(entry_size for _, entry_size, _ in entries)
+        target = self.max_bytes * 0.9
+        for _, entry_size, path in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= entry_size
+        self._size = size
+
+    def stats(self):
+        """
+        Retourne les compteurs du cache
+
+        Returns:
+            dict: Succès, échecs, taux de succès, temps d'extraction économisé et taille
+        """
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+                "saved_seconds": round(self.saved_seconds, 3),
+                "size_bytes": self._size,
+                "max_bytes": self.max_bytes,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_extraction_cache():
+    """
+    Retourne le cache partagé par le processus courant
+
+    Returns:
+        ExtractionCache: Cache, ou None s'il est désactivé (EXTRACTION_CACHE_DIR vide)
+    """
+    global _cache
+    directory = get_setting('EXTRACTION_CACHE_DIR')
+    if not directory:
+        return None
+    with _cache_lock:
+        if _cache is None or _cache.directory != str(directory):
+            _cache = ExtractionCache(str(directory), get_setting('EXTRACTION_CACHE_MAX_BYTES'))
+        return _cache
+
+
+def lookup_cached_extraction(source, content_hash=None):
+    """
+    Recherche le résultat d'extraction d'un fichier dans le cache
+
+    Args:
+        source: Chemin local ou StoredDocument (lu seulement sans `content_hash`)
+        content_hash: Empreinte SHA-256 déjà calculée (optionnelle)
+
+    Returns:
+        dict: Résultat mis en cache ou None
+    """
+    cache = get_extraction_cache()
+    if cache is None:
+        return None
+    return cache.get(cache.make_key(content_hash or compute_file_hash(source)))
+
+
+def extract_with_cache(source, content_hash=None, refresh=False):
+    """
+    Extrait le texte d'un fichier en réutilisant le résultat mis en cache
+
+    Le fichier est lu une seule fois : le même contenu sert à l'empreinte et
+    à l'extraction, et il n'est pas lu du tout si `content_hash` est connu et
+    le résultat en cache.
+
+    Args:
+        source: Chemin local ou StoredDocument
+        content_hash: Empreinte SHA-256 déjà calculée (optionnelle)
+        refresh: Ignorer l'entrée existante et la remplacer
+
+    Returns:
+        tuple: (résultat de l'extraction, True si le résultat vient du cache)
+    """
+    with open_document(source) as document:
+        cache = get_extraction_cache()
+        if cache is None:
+            return TextExtractor.extract_from_file(document), False
+
+        key = cache.make_key(content_hash or document.sha256())
+        if not refresh:
+            cached = cache.get(key)
+            if cached is not None:
+                return cached, True
+
+        start = time.perf_counter()
+        result = TextExtractor.extract_from_file(document)
+        # Les erreurs (bibliothèque OCR absente, par exemple) peuvent être passagères
+        if "error" not in result:
+            cache.set(key, result, time.perf_counter() - start)
+        return result, False
+
+
+def extract_stored_with_cache(name, content_hash=None, refresh=False):
+    """
+    Variante de `extract_with_cache` pour un fichier du stockage des factures,
+    désigné par son nom (transmissible à un pool de processus)
+
+    Returns:
+        tuple: (résultat de l'extraction, True si le résultat vient du cache)
+    """
+    with StoredDocument.from_storage(name) as document:
+        return extract_with_cache(document, content_hash, refresh)
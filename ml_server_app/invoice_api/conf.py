@@ -0,0 +1,110 @@
+"""
+Paramètres de l'extraction
+
+Les valeurs sont lues dans les settings Django lorsqu'ils sont configurés,
+sinon les valeurs par défaut ci-dessous s'appliquent (utilisation des
+extracteurs hors de Django).
+"""
+from django.conf import settings
+
+DEFAULTS = {
+    # File d'attente des extractions
+    'EXTRACTION_WORKERS': 2,
+    'EXTRACTION_WORKER_POLL_INTERVAL': 1.0,
+    'EXTRACTION_JOB_MAX_ATTEMPTS': 3,
+    'EXTRACTION_JOB_RETRY_DELAY': 5,
+    'EXTRACTION_JOB_TIMEOUT': 600,
+
+    # OCR
+    # Moteur : 'tesserocr' (modèles gardés en mémoire), 'pytesseract' (un processus
+    # par image) ou 'auto' (tesserocr s'il est disponible, sinon pytesseract)
+    'OCR_BACKEND': 'auto',
+    'OCR_LANG': 'fra+eng',
+    # Nombre de processus OCR par processus d'extraction (None : nombre de cœurs)
+    'OCR_PROCESSES': None,
+    # Nombre maximal de pages d'un même document traitées simultanément
+    'OCR_MAX_PAGES_IN_FLIGHT': 4,
+    # Rastérisation des PDF scannés par fenêtres de pages
+    'OCR_RASTER_WINDOW': 4,
+    'OCR_DPI': 200,
+    # Prétraitement des images avant l'OCR, par type de document (voir preprocessing.py)
+    'OCR_PREPROCESSING': True,
+    'OCR_PREPROCESSING_PROFILES': {
+        # Photos et numérisations : taille très variable, éclairage inégal
+        'image': {
+            'max_side': 4000,
+            'target_char_height': 28,
+            'deskew': True,
+            'max_skew': 10,
+            'binarize': 'adaptive',
+        },
+        # Pages rastérisées à OCR_DPI
+        'pdf_scanned': {
+            'target_dpi': 300,
+            'deskew': True,
+            'max_skew': 5,
+            'binarize': 'otsu',
+        },
+    },
+    # Pages PDF dont la couche texte compte moins de caractères : traitées par OCR
+    'OCR_MIN_PAGE_CHARS': 20,
+
+    # PDF textuels : relever la position des fragments de texte et chercher les
+    # valeurs à côté de leur libellé (voir layout.py)
+    'PDF_LAYOUT_EXTRACTION': False,
+
+    # Cache des extractions (désactivé si le dossier n'est pas défini)
+    'EXTRACTION_CACHE_DIR': None,
+    'EXTRACTION_CACHE_MAX_BYTES': 512 * 1024 * 1024,
+
+    # Mesures de l'extraction : instantanés par processus (désactivé si non défini)
+    'METRICS_DIR': None,
+    # Délai maximal (secondes) avant l'écriture des compteurs incrémentés hors
+    # extraction (succès du cache) ; 0 : écriture à chaque incrément
+    'METRICS_SNAPSHOT_INTERVAL': 5.0,
+    # Autoriser ?profile=1 sur l'endpoint extract (capture cProfile)
+    'EXTRACTION_PROFILING': False,
+
+    # Téléchargement par lots : nombre de fichiers et taille décompressée maximales
+    'BATCH_MAX_FILES': 1000,
+    'BATCH_MAX_BYTES': 2 * 1024 * 1024 * 1024,
+
+    # Taille maximale d'un PDF ou d'une image téléchargé (les archives ZIP sont
+    # limitées par BATCH_MAX_BYTES)
+    'UPLOAD_MAX_FILE_BYTES': 50 * 1024 * 1024,
+
+    # Vues asynchrones (ASGI) : processus d'extraction (None : nombre de cœurs ;
+    # 0 : threads du processus courant) et extractions simultanées par processus
+    'ASYNC_EXTRACTION_PROCESSES': None,
+    'ASYNC_EXTRACTION_MAX_PENDING': 256,
+
+    # Pagination de la liste des factures
+    'INVOICE_PAGE_SIZE': 50,
+    'INVOICE_MAX_PAGE_SIZE': 500,
+
+    # Recherche plein texte : nombre de résultats par défaut (borné par
+    # INVOICE_MAX_PAGE_SIZE) et configuration tsvector de PostgreSQL
+    'SEARCH_RESULTS_LIMIT': 20,
+    # Factures classées au plus par recherche, les plus récentes d'abord (None : toutes)
+    'SEARCH_MAX_CANDIDATES': 5000,
+    'SEARCH_TEXT_CONFIG': 'french',
+
+    # Doublons : similarité estimée des textes (0 à 1) à partir de laquelle une
+    # facture est marquée comme doublon d'une facture antérieure
+    'DUPLICATE_SIMILARITY_THRESHOLD': 0.7,
+}
+
+
+def get_setting(name):
+    """
+    Retourne la valeur d'un paramètre de l'extraction
+
+    Args:
+        name: Nom du paramètre (voir DEFAULTS)
+
+    Returns:
+        Valeur définie dans les settings Django, ou valeur par défaut
+    """
+    if settings.configured:
+        return getattr(settings, name, DEFAULTS[name])
+    return DEFAULTS[name]
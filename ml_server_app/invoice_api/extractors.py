@@ -1,21 +1,16 @@
-import os
 import tempfile
-import re
-from PIL import Image
-import json
-import yaml
+import time
 
-try:
-    import pytesseract
-    TESSERACT_AVAILABLE = True
-except ImportError:
-    TESSERACT_AVAILABLE = False
-
-try:
-    from pdf2image import convert_from_path
-    PDF2IMAGE_AVAILABLE = True
-except ImportError:
-    PDF2IMAGE_AVAILABLE = False
+from . import metrics, normalizer
+from .patterns import pattern_registry
+from .conf import get_setting
+from .layout import PageRunCollector, locate_fields
+from .fingerprints import compute_signature
+from .line_items import normalize_number, parse_line_items
+from .storage import open_document
+from .ocr import (
+    OCR_AVAILABLE, PDF2IMAGE_AVAILABLE, iter_page_images, ocr_page_images, rasterize_page_range
+)
 
 try:
     from PyPDF2 import PdfReader
@@ -23,66 +18,27 @@ try:
 except ImportError:
     PYPDF2_AVAILABLE = False
 
-def load_regex_patterns():
-    """Charge les patterns regex depuis le fichier YAML"""
-    patterns_file = os.path.join(os.path.dirname(__file__), 'regex_patterns.yaml')
-    try:
-        with open(patterns_file, 'r', encoding='utf-8') as file:
-            return yaml.safe_load(file)
-    except Exception as e:
-        print(f"Erreur lors du chargement des patterns regex: {str(e)}")
-        return None
+# Version des extracteurs : à incrémenter lorsque le résultat d'une extraction
+# change pour un même fichier (invalide le cache des extractions)
+EXTRACTOR_VERSION = '5'
+
+# Extensions des fichiers pris en charge par `extract_from_file`
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.tiff', '.bmp')
+SUPPORTED_EXTENSIONS = ('.pdf',) + IMAGE_EXTENSIONS
 
 class TextProcessor:    
     @staticmethod
     def clean_text(text):
-        if not text:
-            return ""
-            
-        # Supprimer les caractères de contrôle sauf les sauts de ligne
-        text = re.sub(r'[\x00-\x09\x0b\x0c\x0e-\x1f\x7f]', '', text)
-        
-        # Normaliser les espaces multiples
-        text = re.sub(r' +', ' ', text)
-        
-        # Normaliser les sauts de ligne multiples
-        text = re.sub(r'\n{3,}', '\n\n', text)
-        
-        return text.strip()
+        # Caractères de contrôle, espaces et sauts de ligne multiples (voir normalizer)
+        return normalizer.clean_text(text)
     
     @staticmethod
     def format_invoice_text(text):
-        if not text:
-            return ""
-            
-        # Identifier et mettre en évidence les sections importantes
-        formatted_text = text
-        
-        # Mettre en évidence les montants
-        formatted_text = re.sub(r'(\d+[,.]\d{2})\s*(€|EUR|EURO|EUROS)?', r'→ \1 € ←', formatted_text)
-        
-        # Identifier les dates (format JJ/MM/AAAA ou JJ-MM-AAAA)
-        formatted_text = re.sub(r'(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})', r'Date: \1', formatted_text)
-        
-        # Identifier les numéros de facture potentiels
-        formatted_text = re.sub(r'(?i)(facture|invoice|n°|numéro)[\s:]*([A-Z0-9-]{5,})', r'Numéro de facture: \2', formatted_text)
-        
-        # Ajouter des séparateurs pour améliorer la lisibilité
-        lines = formatted_text.split('\n')
-        result = []
-        
-        for line in lines:
-            # Ajouter des séparateurs pour les lignes qui semblent être des en-têtes
-            if line.isupper() and len(line) > 5:
-                result.append('\n' + line + '\n' + '-' * len(line))
-            else:
-                result.append(line)
-        
-        return '\n'.join(result)
+        # Montants, dates, numéros de facture et en-têtes, en une passe (voir normalizer)
+        return normalizer.format_text(text)
     
     @staticmethod
-    def _extract_structured_data_fallback(text):
-        """Méthode de secours utilisant les patterns regex codés en dur"""
+    def extract_structured_data(text, patterns=None):
         data = {
             "numeroFacture": None,
             "numeroCommande": None,
@@ -104,239 +60,70 @@ class TextProcessor:
             "articles": []
         }
         
-        # Charger les patterns depuis le fichier YAML
-        patterns = load_regex_patterns()
+        # Récupérer les patterns compilés (chargés une seule fois par processus)
+        patterns = patterns or pattern_registry.get()
         
-        # Si le chargement a échoué, utiliser les patterns codés en dur
-        if not patterns:
-            # Extraire le numéro de facture
-            invoice_patterns = [
-                r'(?i)(?:facture|invoice|n°|numéro|ref)[\s:]*([A-Z0-9-]{5,})',
-                r'(?i)(?:facture|invoice)[^\n]*?(?:n°|numéro|ref)[^\n]*?([A-Z0-9-]{5,})'
-            ]
-            
-            # Extraire le numéro de commande
-            order_patterns = [
-                r'(?i)(?:commande|order|n°\s*commande|numéro\s*commande)[\s:]*([A-Z0-9-]{3,})',
-                r'(?i)(?:bon\s*de\s*commande)[^\n]*?(?:n°|numéro)[^\n]*?([A-Z0-9-]{3,})'
-            ]
-            
-            # Extraire le numéro de contrat
-            contract_patterns = [
-                r'(?i)(?:contrat|contract|n°\s*contrat|numéro\s*contrat)[\s:]*([A-Z0-9-]{3,})',
-            ]
-            
-            # Extraire les dates
-            date_patterns = {
-                "datePiece": [
-                    r'(?i)(?:date|émission|facturé le|date\s*facture)[\s:]*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
-                    r'(?i)(?:date|émission)[^\n]*?(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})'
-                ],
-                "dateCommande": [
-                    r'(?i)(?:date\s*commande|date\s*de\s*commande)[\s:]*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
-                ],
-                "dateLivraison": [
-                    r'(?i)(?:date\s*livraison|date\s*de\s*livraison|livré\s*le)[\s:]*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
-                ]
-            }
-            
-            # Si aucune date spécifique n'est trouvée, utiliser la première date du document
-            general_date_pattern = r'(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})'
-            
-            # Extraire les informations du client
-            client_patterns = {
-                "societe": [
-                    r'(?i)(?:client|customer|acheteur|destinataire)[\s:]*([A-Za-z0-9\s]{3,50})',
-                    r'(?i)(?:facturer\s*à|facturé\s*à)[\s:]*([A-Za-z0-9\s]{3,50})'
-                ],
-                "code": [
-                    r'(?i)(?:code\s*client|customer\s*code|référence\s*client)[\s:]*([A-Za-z0-9-]{2,20})'
-                ],
-                "tva": [
-                    r'(?i)(?:TVA\s*client|TVA\s*intra|n°\s*TVA)[\s:]*([A-Z0-9]{2,14})'
-                ],
-                "siret": [
-                    r'(?i)(?:SIRET\s*client)[\s:]*(\d{14})'
-                ],
-                "ville": [
-                    r'(?i)(?:ville|city)[\s:]*([A-Za-z\s-]{2,30})',
-                    r'(?i)\b([A-Z][A-Za-z\s-]{2,25})\s+\d{5}\b'
-                ],
-                "pays": [
-                    r'(?i)(?:pays|country)[\s:]*([A-Za-z\s-]{3,20})'
-                ]
-            }
-            
-            # Extraire les montants
-            amount_patterns = {
-                "totalTTC": [
-                    r'(?i)(?:total\s*ttc|montant\s*ttc|net\s*à\s*payer|total\s*à\s*payer)[\s:]*(\d+[,.]\d{2})',
-                    r'(?i)(?:ttc)[^\n]*?(\d+[,.]\d{2})\s*(?:€|EUR|EURO|EUROS)?'
-                ],
-                "totalHT": [
-                    r'(?i)(?:total\s*ht|montant\s*ht|prix\s*ht)[\s:]*(\d+[,.]\d{2})',
-                    r'(?i)(?:ht)[^\n]*?(\d+[,.]\d{2})\s*(?:€|EUR|EURO|EUROS)?'
-                ],
-                "totalTVA": [
-                    r'(?i)(?:total\s*tva|montant\s*tva|tva)[\s:]*(\d+[,.]\d{2})',
-                    r'(?i)(?:tva)[^\n]*?(\d+[,.]\d{2})\s*(?:€|EUR|EURO|EUROS)?'
-                ]
-            }
-        else:
-            # Utiliser les patterns du fichier YAML
-            invoice_patterns = patterns.get('invoice_patterns', [])
-            order_patterns = patterns.get('order_patterns', [])
-            contract_patterns = patterns.get('contract_patterns', [])
-            date_patterns = patterns.get('date_patterns', {})
-            general_date_pattern = patterns.get('general_date_pattern', r'(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})')
-            client_patterns = patterns.get('client_patterns', {})
-            amount_patterns = patterns.get('amount_patterns', {})
+        # Résoudre tous les champs en partageant la recherche des libellés
+        matches = patterns.scanner.scan(text)
         
-        return data, invoice_patterns, order_patterns, contract_patterns, date_patterns, general_date_pattern, client_patterns, amount_patterns
+        # Extraire les numéros de facture, de commande, de contrat et les dates
+        for field in ("numeroFacture", "numeroCommande", "numeroContrat"):
+            if matches[field]:
+                data[field] = matches[field].group(1).strip()
         
-    @staticmethod
-    def extract_structured_data(text):
-        data = {
-            "numeroFacture": None,
-            "numeroCommande": None,
-            "numeroContrat": None,
-            "datePiece": None,
-            "dateCommande": None,
-            "dateLivraison": None,
-            "client": {
-                "societe": None,
-                "code": None,
-                "tva": None,
-                "siret": None,
-                "ville": None,
-                "pays": None
-            },
-            "totalTTC": None,
-            "totalHT": None,
-            "totalTVA": None,
-            "articles": []
-        }
-        
-        # Charger les patterns regex depuis le fichier YAML
-        patterns = load_regex_patterns()
-        if not patterns:
-            # Fallback en cas d'erreur de chargement du fichier YAML
-            print("Utilisation des patterns regex par défaut")
-            data, invoice_patterns, order_patterns, contract_patterns, date_patterns, general_date_pattern, client_patterns, amount_patterns = TextProcessor._extract_structured_data_fallback(text)
-        else:
-            # Utiliser les patterns du fichier YAML
-            invoice_patterns = patterns.get('invoice_patterns', [])
-            order_patterns = patterns.get('order_patterns', [])
-            contract_patterns = patterns.get('contract_patterns', [])
-            date_patterns = patterns.get('date_patterns', {})
-            general_date_pattern = patterns.get('general_date_pattern', r'(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})')
-            client_patterns = patterns.get('client_patterns', {})
-            amount_patterns = patterns.get('amount_patterns', {})
-        
-        # Extraire le numéro de facture
-        for pattern in invoice_patterns:
-            invoice_match = re.search(pattern, text)
-            if invoice_match:
-                data["numeroFacture"] = invoice_match.group(1).strip()
-                break
-        
-        # Extraire le numéro de commande
-        for pattern in order_patterns:
-            order_match = re.search(pattern, text)
-            if order_match:
-                data["numeroCommande"] = order_match.group(1).strip()
-                break
-        
-        # Extraire le numéro de contrat
-        for pattern in contract_patterns:
-            contract_match = re.search(pattern, text)
-            if contract_match:
-                data["numeroContrat"] = contract_match.group(1).strip()
-                break
-        
-        # Extraire les dates
-        for date_field, date_field_patterns in date_patterns.items():
-            for pattern in date_field_patterns:
-                date_match = re.search(pattern, text)
-                if date_match:
-                    data[date_field] = date_match.group(1).strip()
-                    break
+        for date_field in patterns.date_patterns:
+            if matches[date_field]:
+                data[date_field] = matches[date_field].group(1).strip()
         
         # Si datePiece est toujours null, chercher une date générique
         if data["datePiece"] is None:
-            date_match = re.search(general_date_pattern, text)
+            date_match = patterns.general_date_pattern.search(text)
             if date_match:
                 data["datePiece"] = date_match.group(1).strip()
         
         # Extraire les informations du client
-        for field, field_patterns in client_patterns.items():
-            for pattern in field_patterns:
-                match = re.search(pattern, text)
-                if match:
-                    data["client"][field] = match.group(1).strip()
-                    break
+        for field in patterns.client_patterns:
+            match = matches[("client", field)]
+            if match:
+                data["client"][field] = match.group(1).strip()
         
         # Extraire les montants
-        for amount_field, amount_field_patterns in amount_patterns.items():
-            for pattern in amount_field_patterns:
-                amount_match = re.search(pattern, text)
-                if amount_match:
-                    data[amount_field] = amount_match.group(1).replace(',', '.')
-                    break
-        
-        # Extraire les articles/lignes de produits
-        # Recherche de tableaux ou de listes d'articles
-        product_lines_pattern = patterns.get('product_lines_pattern', 
-            r'(?i)(?:Désignation|Article|Produit|Description).*?(?:Quantité|Qté|Qte).*?(?:Prix|Montant|Total)')
-        if re.search(product_lines_pattern, text):
-            # Présence probable d'un tableau de produits
-            lines = text.split('\n')
-            product_section = False
-            product_lines = []
-            
-            for line in lines:
-                if re.search(product_lines_pattern, line):
-                    product_section = True
-                    continue
-                
-                if product_section and re.search(r'(?i)(?:Total|Sous-total)', line):
-                    product_section = False
-                    
-                if product_section and re.search(r'\d+[,.]\d{2}', line):
-                    # Ligne contenant probablement un prix
-                    product_lines.append(line.strip())
-            
-            # Essayer d'extraire des informations structurées pour chaque ligne de produit
-            for line in product_lines:
-                article = {
-                    "nom": line,  # Par défaut, utiliser la ligne complète comme nom
-                    "quantite": None,
-                    "prixHT": None,
-                    "remise": None,
-                    "totalHT": None,
-                    "totalTTC": None
-                }
-                
-                # Essayer d'extraire la quantité
-                qty_match = re.search(r'\b(\d+(?:[,.]\d+)?)\s*(?:x|pcs|u|unités?)\b', line)
-                if qty_match:
-                    article["quantite"] = qty_match.group(1).replace(',', '.')
-                
-                # Essayer d'extraire le prix unitaire HT
-                price_match = re.search(r'\b(\d+[,.]\d{2})\s*(?:€|EUR)?\s*(?:HT|H\.T\.)\b', line)
-                if price_match:
-                    article["prixHT"] = price_match.group(1).replace(',', '.')
-                
-                # Essayer d'extraire le total HT
-                total_ht_match = re.search(r'\b(\d+[,.]\d{2})\s*(?:€|EUR)?\s*(?:HT|H\.T\.)\b', line)
-                if total_ht_match and article["prixHT"] is None:  # Si pas déjà trouvé comme prix unitaire
-                    article["totalHT"] = total_ht_match.group(1).replace(',', '.')
-                
-                # Ajouter l'article à la liste
-                data["articles"].append(article)
+        for amount_field in patterns.amount_patterns:
+            if matches[amount_field]:
+                data[amount_field] = matches[amount_field].group(1).replace(',', '.')
+        
+        # Extraire les articles/lignes de produits (voir line_items.py)
+        data["articles"] = parse_line_items(text, patterns.product_lines_pattern)
         
         return data
     
+    @staticmethod
+    def _flatten_fields(structured_data):
+        """Aplatit les données structurées pour le décompte des champs trouvés"""
+        fields = {}
+        for key, value in structured_data.items():
+            if isinstance(value, dict):
+                for sub_key, sub_value in value.items():
+                    fields[f"{key}.{sub_key}"] = sub_value
+            else:
+                fields[key] = value
+        return fields
+    
+    @staticmethod
+    def apply_layout_fields(structured_data, layout_fields):
+        """
+        Remplace les champs trouvés à côté de leur libellé dans la page
+        
+        Args:
+            structured_data: Données structurées extraites du texte (modifiées)
+            layout_fields: Champs localisés (voir layout.locate_fields)
+        """
+        for field, located in layout_fields.items():
+            value = located["value"].strip()
+            if field.startswith("total"):
+                value = normalize_number(value.replace(' ', '\u00a0'))
+            structured_data[field] = value
+    
     @staticmethod
     def process_extracted_text(extraction_result):
         if "error" in extraction_result:
@@ -344,20 +131,33 @@ class TextProcessor:
             
         raw_text = extraction_result.get("text", "")
         
-        # Nettoyer le texte
-        cleaned_text = TextProcessor.clean_text(raw_text)
+        # Nettoyer puis formater le texte (voir normalizer)
+        with metrics.stage('normalize_text'):
+            cleaned_text, formatted_text = normalizer.normalize_text(raw_text)
         
-        # Formater le texte
-        formatted_text = TextProcessor.format_invoice_text(cleaned_text)
+        # Extraire des données structurées (le résultat porte la version des
+        # patterns utilisés : voir restructure.py)
+        patterns = pattern_registry.get()
+        with metrics.stage('structured_data'):
+            structured_data = TextProcessor.extract_structured_data(cleaned_text, patterns)
         
-        # Extraire des données structurées
-        structured_data = TextProcessor.extract_structured_data(cleaned_text)
+        # Valeurs trouvées par la position des libellés (mode mise en page)
+        layout = extraction_result.get("layout")
+        if layout:
+            TextProcessor.apply_layout_fields(structured_data, layout["fields"])
+        metrics.record_field_hits(TextProcessor._flatten_fields(structured_data))
+        
+        # Empreinte du texte pour la détection des doublons (voir fingerprints.py)
+        with metrics.stage('fingerprint'):
+            signature = compute_signature(cleaned_text)
         
         # Ajouter les résultats au dictionnaire d'origine
         result = extraction_result.copy()
         result["cleaned_text"] = cleaned_text
         result["formatted_text"] = formatted_text
         result["structured_data"] = structured_data
+        result["pattern_version"] = patterns.version
+        result["fingerprint"] = signature.hex() if signature else None
         
         return result
 
@@ -366,88 +166,282 @@ class TextExtractor:
     """Classe pour extraire du texte à partir de différents types de documents"""
     
     @staticmethod
-    def extract_from_file(file_path):
-        file_ext = os.path.splitext(file_path)[1].lower()
-        
-        extraction_result = {}
-        if file_ext == '.pdf':
-            extraction_result = TextExtractor.extract_from_pdf(file_path)
-        elif file_ext in ['.jpg', '.jpeg', '.png', '.tiff', '.bmp']:
-            extraction_result = TextExtractor.extract_from_image(file_path)
-        else:
+    def extract_from_file(source):
+        """
+        Extrait le texte d'un document (PDF ou image)
+        
+        Le type est déterminé par la signature du contenu, à défaut par
+        l'extension. Le contenu est lu une seule fois et partagé entre les
+        étapes (voir storage.py).
+        
+        Args:
+            source: Chemin local ou StoredDocument (fichier d'un stockage Django)
+        
+        Returns:
+            dict: Résultat de l'extraction (texte, données structurées, métriques)
+        """
+        with open_document(source) as document:
+            return TextExtractor._extract_document(document)
+    
+    @staticmethod
+    def _extract_document(document):
+        file_ext = document.extension
+        if file_ext not in SUPPORTED_EXTENSIONS:
             return {"error": "Format de fichier non pris en charge"}
+        
+        # Durées par étape et compteurs, joints au résultat puis agrégés (voir metrics.py)
+        with metrics.record_extraction() as recorded:
+            try:
+                metrics.count('bytes', document.size)
+                sniffed = document.sniff()
+            except OSError:
+                sniffed = None
+            
+            if sniffed and sniffed[0] in ('pdf', 'image'):
+                kind = sniffed[0]
+            else:
+                kind = 'pdf' if file_ext == '.pdf' else 'image'
+            if kind == 'pdf':
+                extraction_result = TextExtractor.extract_from_pdf(document)
+            else:
+                extraction_result = TextExtractor.extract_from_image(document)
             
-        # Traiter le texte extrait pour le nettoyer et le formater
-        return TextProcessor.process_extracted_text(extraction_result)
+            # Traiter le texte extrait pour le nettoyer et le formater
+            result = TextProcessor.process_extracted_text(extraction_result)
+        
+        result["metrics"] = recorded.as_dict()
+        metrics.observe_extraction(recorded, result)
+        return result
     
     @staticmethod
-    def extract_from_pdf(pdf_path):
+    def extract_from_pdf(source):
+        """
+        Extrait le texte d'un PDF page par page
+        
+        Le texte de chaque page est lu directement ; seules les pages dont le
+        texte est vide ou trop court (OCR_MIN_PAGE_CHARS) passent par l'OCR.
+        Avec PDF_LAYOUT_EXTRACTION, la position des fragments de texte est
+        relevée pendant la même lecture (voir layout.py).
+        L'OCR démarre dès la première page concernée, pendant la lecture des
+        pages suivantes. Un PDF mixte (pages textuelles et annexes scannées)
+        est ainsi extrait en entier.
+        
+        Args:
+            source: Chemin local ou StoredDocument
+        
+        Returns:
+            dict: Texte extrait, méthode, type de document et détail par page
+        """
         # Vérifier si PyPDF2 est disponible
         if not PYPDF2_AVAILABLE:
             return {"error": "PyPDF2 n'est pas installé. Impossible d'extraire le texte du PDF."}
         
-        # Essayer d'extraire le texte directement du PDF
-        pdf_reader = PdfReader(pdf_path)
-        text = ""
-        
-        for page in pdf_reader.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text + "\n"
+        with open_document(source) as document:
+            return TextExtractor._extract_pdf_document(document)
+    
+    @staticmethod
+    def _extract_pdf_document(document):
+        # PyPDF2 lit le contenu partagé (projection mmap) au lieu d'en copier le fichier
+        with metrics.stage('pdf_parse'):
+            pdf_reader = PdfReader(document.stream())
+        ocr_available = PDF2IMAGE_AVAILABLE and OCR_AVAILABLE
+        with_layout = get_setting('PDF_LAYOUT_EXTRACTION')
+        pages = []
+        ocr_pages = []
+        ocr_error = None
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            page_images = TextExtractor._iter_pdf_pages(
+                pdf_reader, document, temp_dir, pages, ocr_pages, ocr_available, with_layout)
+            try:
+                ocr_results = ocr_page_images(
+                    page_images, remove_files=True, document_type="pdf_scanned",
+                    dpi=get_setting('OCR_DPI'))
+            except Exception as e:
+                ocr_error = str(e)
+                ocr_results = []
+                page_images.close()
+                # Terminer la lecture directe des pages restantes
+                for page_number in range(len(pages) + 1, len(pdf_reader.pages) + 1):
+                    pages.append(TextExtractor._read_pdf_page(pdf_reader, page_number, with_layout))
+        
+        for page_number, ocr_result in zip(ocr_pages, ocr_results):
+            page = pages[page_number - 1]
+            ocr_text = ocr_result["text"].strip()
+            # Conserver la couche texte si l'OCR n'apporte rien de plus
+            if len("".join(ocr_text.split())) > len("".join(page["text"].split())):
+                page["text"] = ocr_text
+                page["method"] = "ocr"
+                page["layout"] = None
+            page["seconds"] = round(page["seconds"] + ocr_result["seconds"], 3)
+        
+        text = "\n".join(page["text"] for page in pages if page["text"]).strip()
+        ocr_count = len(ocr_results)
+        metrics.count('pages', len(pages))
         
-        # Si du texte a été extrait, c'est un PDF textuel
-        if text.strip():
-            return {
-                "text": text.strip(),
-                "extraction_method": "text_extraction",
-                "document_type": "pdf_text"
-            }
+        if not text:
+            if not ocr_available:
+                return {
+                    "error": "PDF scanné détecté mais les bibliothèques nécessaires pour l'OCR ne sont pas disponibles.",
+                    "required_packages": ["pdf2image", "pytesseract"]
+                }
+            if ocr_error:
+                return {"error": f"Erreur lors de l'extraction OCR: {ocr_error}"}
         
-        # Sinon, c'est probablement un PDF scanné, utiliser OCR si disponible
-        if PDF2IMAGE_AVAILABLE and TESSERACT_AVAILABLE:
-            return TextExtractor.extract_from_scanned_pdf(pdf_path)
+        if pages and ocr_count == len(pages):
+            extraction_method, document_type = "ocr", "pdf_scanned"
+        elif ocr_count:
+            extraction_method, document_type = "mixed", "pdf_mixed"
         else:
-            return {
-                "error": "PDF scanné détecté mais les bibliothèques nécessaires pour l'OCR ne sont pas disponibles.",
-                "required_packages": ["pdf2image", "pytesseract"]
-            }
+            extraction_method, document_type = "text_extraction", "pdf_text"
+        
+        result = {
+            "text": text,
+            "extraction_method": extraction_method,
+            "document_type": document_type,
+            "page_count": len(pages),
+            "pages": [
+                {
+                    "page": page["page"],
+                    "method": page["method"],
+                    "text": page["text"].strip(),
+                    "seconds": page["seconds"]
+                }
+                for page in pages
+            ]
+        }
+        if with_layout:
+            with metrics.stage('pdf_layout'):
+                layouts = [page["layout"] for page in pages if page.get("layout")]
+                result["layout"] = {
+                    "pages": [layout.to_dict() for layout in layouts],
+                    "fields": locate_fields(layouts),
+                }
+        if ocr_error:
+            result["warning"] = f"Pages non traitées par l'OCR: {ocr_error}"
+        elif not ocr_available and any(TextExtractor._is_thin_page(page["text"]) for page in pages):
+            result["warning"] = "Pages scannées ignorées : bibliothèques OCR non disponibles"
+        return result
     
     @staticmethod
-    def extract_from_scanned_pdf(pdf_path):
+    def _is_thin_page(page_text):
+        """Indique si le texte d'une page est vide ou trop court pour être exploité"""
+        return len("".join(page_text.split())) < get_setting('OCR_MIN_PAGE_CHARS')
+    
+    @staticmethod
+    def _read_pdf_page(pdf_reader, page_number, with_layout=False):
+        """
+        Lit directement le texte d'une page (numérotée à partir de 1)
+        
+        Avec `with_layout`, la page lue porte aussi ses fragments positionnés
+        (clé "layout", PageLayout).
+        """
+        start = time.perf_counter()
+        layout = None
+        with metrics.stage('pdf_text'):
+            pdf_page = pdf_reader.pages[page_number - 1]
+            if with_layout:
+                collector = PageRunCollector(pdf_page)
+                page_text = pdf_page.extract_text(**collector.visitors()) or ""
+                layout = collector.layout(page_number)
+            else:
+                page_text = pdf_page.extract_text() or ""
+        return {
+            "page": page_number,
+            "method": "text_extraction",
+            "text": page_text,
+            "layout": layout,
+            "seconds": round(time.perf_counter() - start, 3)
+        }
+    
+    @staticmethod
+    def _iter_pdf_pages(pdf_reader, document, temp_dir, pages, ocr_pages, ocr_available, with_layout=False):
+        """
+        Lit le texte de chaque page et rastérise les pages à passer par l'OCR
+        
+        Les pages consécutives à rastériser sont regroupées par fenêtres de
+        OCR_RASTER_WINDOW pages ; chaque fenêtre est produite dès qu'elle est
+        complète ou interrompue par une page textuelle.
+        
+        Args:
+            pdf_reader: PdfReader du document
+            document: StoredDocument du PDF (pdftoppm lit son chemin local)
+            temp_dir: Dossier temporaire recevant les images
+            pages: Liste complétée avec le texte lu directement pour chaque page
+            ocr_pages: Liste complétée avec les numéros des pages rastérisées
+            ocr_available: Rastériser les pages trop courtes
+            with_layout: Relever la position des fragments de texte
+        
+        Yields:
+            str: Chemin de l'image de chaque page à passer par l'OCR
+        """
+        window = max(1, get_setting('OCR_RASTER_WINDOW'))
+        run = []
+        
+        def flush():
+            ocr_pages.extend(run)
+            paths = rasterize_page_range(document.local_path(), temp_dir, run[0], run[-1])
+            run.clear()
+            return paths
+        
+        for page_number in range(1, len(pdf_reader.pages) + 1):
+            page = TextExtractor._read_pdf_page(pdf_reader, page_number, with_layout)
+            pages.append(page)
+            
+            if ocr_available and TextExtractor._is_thin_page(page["text"]):
+                run.append(page_number)
+                if len(run) >= window:
+                    yield from flush()
+            elif run:
+                yield from flush()
+        
+        if run:
+            yield from flush()
+    
+    @staticmethod
+    def extract_from_scanned_pdf(source):
         try:
-            # Convertir le PDF en images
-            with tempfile.TemporaryDirectory() as temp_dir:
-                images = convert_from_path(pdf_path, output_folder=temp_dir)
+            # Convertir le PDF en images par petites fenêtres de pages, chaque image
+            # étant supprimée dès son OCR terminé : la mémoire et l'espace disque
+            # utilisés dépendent de la fenêtre et non du nombre de pages
+            with open_document(source) as document, tempfile.TemporaryDirectory() as temp_dir:
+                page_images = iter_page_images(document.local_path(), temp_dir)
                 
-                full_text = ""
-                for i, image in enumerate(images):
-                    # Appliquer OCR directement sur l'image PIL
-                    text = pytesseract.image_to_string(image, lang='fra+eng')
-                    full_text += text + "\n"
+                # Appliquer l'OCR aux pages en parallèle, dans l'ordre du document
+                pages = ocr_page_images(
+                    page_images, remove_files=True, document_type="pdf_scanned",
+                    dpi=get_setting('OCR_DPI'))
                 
                 return {
-                    "text": full_text.strip(),
+                    "text": "\n".join(page["text"] for page in pages).strip(),
                     "extraction_method": "ocr",
                     "document_type": "pdf_scanned",
-                    "page_count": len(images)
+                    "page_count": len(pages),
+                    "pages": [
+                        {
+                            "page": page["page"],
+                            "text": page["text"].strip(),
+                            "seconds": page["seconds"]
+                        }
+                        for page in pages
+                    ]
                 }
         except Exception as e:
             return {"error": f"Erreur lors de l'extraction OCR: {str(e)}"}
     
     @staticmethod
-    def extract_from_image(image_path):
-        if not TESSERACT_AVAILABLE:
-            return {"error": "pytesseract n'est pas installé. Impossible d'extraire le texte de l'image."}
+    def extract_from_image(source):
+        if not OCR_AVAILABLE:
+            return {"error": "Ni tesserocr ni pytesseract n'est installé. Impossible d'extraire le texte de l'image."}
         
         try:
-            # Charger l'image avec PIL
-            image = Image.open(image_path)
-            
-            # Appliquer OCR
-            text = pytesseract.image_to_string(image, lang='fra+eng')
+            # Appliquer l'OCR dans le pool, dont les processus gardent le moteur chargé
+            # (ils lisent l'image depuis son chemin local)
+            with open_document(source) as document:
+                page = ocr_page_images([document.local_path()], document_type="image")[0]
             
             return {
-                "text": text.strip(),
+                "text": page["text"].strip(),
                 "extraction_method": "ocr",
                 "document_type": "image"
             }
@@ -0,0 +1,107 @@
+"""
+Empreintes de similarité des textes de factures (MinHash) et index LSH
+
+Une même facture renvoyée sous forme de nouveau scan a une empreinte SHA-256
+différente : elle est reconnue par la ressemblance de son texte nettoyé.
+- L'empreinte MinHash résume l'ensemble des séquences de SHINGLE_SIZE
+  caractères du texte normalisé (minuscules, ponctuation retirée) : la
+  proportion de valeurs égales entre deux empreintes estime la similarité de
+  Jaccard des deux textes, peu sensible aux erreurs d'OCR isolées.
+- L'empreinte est découpée en LSH_BANDS bandes ; chaque bande donne une clé
+  entière indexée en base. Deux textes similaires partagent au moins une
+  clé avec une forte probabilité (1 − (1 − s⁵)²⁵ pour une similarité s,
+  soit 99 % à 0,7 et 2,4 % à 0,25) : la recherche des doublons lit les
+  factures partageant une clé (requêtes sur index), sans parcourir le corpus,
+  puis compare leurs empreintes complètes.
+"""
+import hashlib
+import re
+import zlib
+
+import numpy as np
+
+SHINGLE_SIZE = 5
+LSH_BANDS = 25
+ROWS_PER_BAND = 5
+NUM_PERMUTATIONS = LSH_BANDS * ROWS_PER_BAND
+# Textes trop courts : empreinte non significative (reçus vides, erreurs d'OCR)
+MIN_SHINGLES = 50
+# Factures comparées au plus par recherche (celles qui partagent le plus de bandes)
+MAX_CANDIDATES = 200
+
+_PRIME = (1 << 31) - 1
+# Permutations h → (a·h + b) mod p, tirées une fois pour toutes (graine fixe :
+# empreintes comparables d'un processus et d'une version à l'autre)
+_random = np.random.RandomState(20240312)
+_A = _random.randint(1, _PRIME, NUM_PERMUTATIONS).astype(np.uint64)
+_B = _random.randint(0, _PRIME, NUM_PERMUTATIONS).astype(np.uint64)
+# Séquences traitées par bloc (mémoire bornée pour les longs documents)
+_BLOCK = 2048
+
+_NON_WORD_RE = re.compile(r'[\W_]+')
+
+
+def compute_signature(text):
+    """
+    Calcule l'empreinte MinHash d'un texte
+
+    Args:
+        text: Texte nettoyé de la facture
+
+    Returns:
+        bytes: Empreinte (NUM_PERMUTATIONS entiers de 32 bits), ou None si le
+               texte est trop court pour être comparé
+    """
+    normalized = _NON_WORD_RE.sub(' ', (text or '').lower()).strip()
+    shingles = {zlib.crc32(normalized[i:i + SHINGLE_SIZE].encode('utf-8')) & _PRIME
+                for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+    if len(shingles) < MIN_SHINGLES:
+        return None
+
+    hashes = np.fromiter(shingles, dtype=np.uint64, count=len(shingles))
+    signature = np.full(NUM_PERMUTATIONS, _PRIME, dtype=np.uint64)
+    for start in range(0, len(hashes), _BLOCK):
+        block = hashes[start:start + _BLOCK]
+        permuted = (_A[:, None] * block[None, :] + _B[:, None]) % _PRIME
+        np.minimum(signature, permuted.min(axis=1), out=signature)
+    return signature.astype('>u4').tobytes()
+
+
+def band_keys(signature):
+    """
+    Clés LSH d'une empreinte : une par bande, numéro de bande compris
+
+    Returns:
+        list: LSH_BANDS entiers signés de 64 bits
+    """
+    size = ROWS_PER_BAND * 4
+    return [
+        int.from_bytes(hashlib.blake2b(bytes([band]) + signature[band * size:(band + 1) * size],
+                                       digest_size=8).digest(), 'big', signed=True)
+        for band in range(LSH_BANDS)
+    ]
+
+
+def similarity(signature, other):
+    """
+    Similarité de Jaccard estimée entre deux textes
+
+    Returns:
+        float: Proportion des valeurs égales des deux empreintes (0 à 1)
+    """
+    first = np.frombuffer(signature, dtype='>u4')
+    second = np.frombuffer(other, dtype='>u4')
+    return float(np.count_nonzero(first == second)) / NUM_PERMUTATIONS
+
+
+def result_signature(result):
+    """
+    Empreinte d'un résultat d'extraction
+
+    Returns:
+        bytes: Empreinte calculée par process_extracted_text ("fingerprint"),
+               ou à défaut à partir du texte nettoyé ; None si le texte est trop court
+    """
+    if "fingerprint" in result:
+        return bytes.fromhex(result["fingerprint"]) if result["fingerprint"] else None
+    return compute_signature(result.get("cleaned_text"))
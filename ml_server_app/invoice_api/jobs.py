@@ -0,0 +1,242 @@
+"""
+File d'attente des extractions, stockée dans la base de données
+
+Les tâches sont réservées par les workers locaux lancés avec
+`python manage.py run_extraction_workers`. Aucun broker externe n'est
+nécessaire : PostgreSQL utilise `SELECT ... FOR UPDATE SKIP LOCKED`, SQLite une
+mise à jour conditionnelle du statut.
+"""
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from datetime import timedelta
+
+from django.db import connection, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .cache import extract_with_cache
+from .conf import get_setting
+from .models import ExtractionJob
+from .storage import StoredDocument
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_extraction(invoice):
+    """
+    Ajoute une tâche d'extraction pour une facture
+
+    Args:
+        invoice: Instance du modèle Invoice
+
+    Returns:
+        ExtractionJob: Tâche créée
+    """
+    return ExtractionJob.objects.create(
+        invoice=invoice,
+        max_attempts=get_setting('EXTRACTION_JOB_MAX_ATTEMPTS'),
+    )
+
+
+def claim_next_job(worker_name):
+    """
+    Réserve la prochaine tâche disponible pour un worker
+
+    Args:
+        worker_name: Identifiant du worker
+
+    Returns:
+        ExtractionJob: Tâche réservée (statut `running`) ou None
+    """
+    now = timezone.now()
+    queued = ExtractionJob.objects.filter(
+        status=ExtractionJob.STATUS_QUEUED, available_at__lte=now
+    ).order_by('available_at', 'id')
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            job = queued.select_for_update(skip_locked=True).first()
+            if job is None:
+                return None
+            job.status = ExtractionJob.STATUS_RUNNING
+            job.worker = worker_name
+            job.started_at = now
+            job.attempts += 1
+            job.save(update_fields=['status', 'worker', 'started_at', 'attempts'])
+            return job
+
+    # SQLite : la mise à jour conditionnelle garantit qu'un seul worker réserve la tâche
+    for job_id in queued.values_list('id', flat=True)[:10]:
+        claimed = ExtractionJob.objects.filter(
+            id=job_id, status=ExtractionJob.STATUS_QUEUED
+        ).update(
+            status=ExtractionJob.STATUS_RUNNING,
+            worker=worker_name,
+            started_at=now,
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return ExtractionJob.objects.select_related('invoice').get(id=job_id)
+    return None
+
+
+def _retry_or_fail(job, error):
+    """Remet la tâche en file avec un délai croissant, ou la marque en échec"""
+    job.error = error
+    if job.attempts < job.max_attempts:
+        delay = get_setting('EXTRACTION_JOB_RETRY_DELAY') * (2 ** (job.attempts - 1))
+        job.status = ExtractionJob.STATUS_QUEUED
+        job.available_at = timezone.now() + timedelta(seconds=delay)
+        job.save(update_fields=['status', 'error', 'available_at'])
+    else:
+        job.status = ExtractionJob.STATUS_FAILED
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'finished_at'])
+
+
+def run_job(job):
+    """
+    Exécute une tâche réservée et enregistre son résultat
+
+    Les exceptions inattendues sont réessayées ; une extraction qui renvoie une
+    erreur (format non pris en charge, bibliothèque OCR absente...) échoue
+    directement puisqu'un nouvel essai donnerait le même résultat.
+    """
+    invoice = job.invoice
+
+    start = time.perf_counter()
+    try:
+        with StoredDocument.from_field(invoice.file) as document:
+            extracted_data, cached = extract_with_cache(document, invoice.sha256 or None)
+        invoice.set_extracted_text(extracted_data)
+    except Exception as e:
+        logger.exception("Tâche %s (facture %s) : erreur inattendue", job.id, invoice.id)
+        _retry_or_fail(job, f"{type(e).__name__}: {str(e)}")
+        return job
+    
+    logger.info("Tâche %s (facture %s) traitée en %.2f s%s", job.id, invoice.id,
+                time.perf_counter() - start, " (cache)" if cached else "")
+
+    job.finished_at = timezone.now()
+    if "error" in extracted_data:
+        job.status = ExtractionJob.STATUS_FAILED
+        job.error = extracted_data["error"]
+    else:
+        job.status = ExtractionJob.STATUS_DONE
+        job.error = None
+    job.save(update_fields=['status', 'error', 'finished_at'])
+    return job
+
+
+def requeue_stale_jobs():
+    """
+    Remet en file les tâches `running` abandonnées par un worker arrêté
+    brutalement
+
+    Returns:
+        int: Nombre de tâches traitées
+    """
+    timeout = get_setting('EXTRACTION_JOB_TIMEOUT')
+    limit = timezone.now() - timedelta(seconds=timeout)
+    stale = ExtractionJob.objects.filter(status=ExtractionJob.STATUS_RUNNING, started_at__lt=limit)
+    count = 0
+    for job in stale:
+        _retry_or_fail(job, "Délai d'exécution dépassé")
+        count += 1
+    return count
+
+
+def run_worker(worker_name, stop_event=None, poll_interval=None, max_jobs=None):
+    """
+    Boucle d'un worker : réserve et exécute les tâches jusqu'à l'arrêt
+
+    Args:
+        worker_name: Identifiant du worker
+        stop_event: Événement signalant l'arrêt demandé
+        poll_interval: Attente (secondes) lorsque la file est vide
+        max_jobs: Nombre maximal de tâches à traiter (None pour illimité)
+
+    Returns:
+        int: Nombre de tâches traitées
+    """
+    if poll_interval is None:
+        poll_interval = get_setting('EXTRACTION_WORKER_POLL_INTERVAL')
+
+    processed = 0
+    while not (stop_event and stop_event.is_set()):
+        job = claim_next_job(worker_name)
+        if job is None:
+            if max_jobs is not None:
+                break
+            time.sleep(poll_interval)
+            continue
+
+        run_job(job)
+        processed += 1
+        if max_jobs is not None and processed >= max_jobs:
+            break
+    return processed
+
+
+def _worker_process(worker_name, stop_event, poll_interval):
+    # Le processus parent gère l'arrêt ; les workers terminent leur tâche en cours
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        run_worker(worker_name, stop_event, poll_interval)
+    finally:
+        connections.close_all()
+
+
+def run_worker_pool(workers=None, poll_interval=None):
+    """
+    Lance un pool de processus workers et le supervise jusqu'à l'interruption
+
+    Args:
+        workers: Nombre de processus (EXTRACTION_WORKERS par défaut)
+        poll_interval: Attente (secondes) lorsque la file est vide
+    """
+    if workers is None:
+        workers = get_setting('EXTRACTION_WORKERS')
+    if poll_interval is None:
+        poll_interval = get_setting('EXTRACTION_WORKER_POLL_INTERVAL')
+
+    requeue_stale_jobs()
+
+    stop_event = multiprocessing.Event()
+    prefix = f"{socket.gethostname()}-{os.getpid()}"
+    processes = {}
+
+    def start(index):
+        # Les connexions ne doivent pas être partagées entre processus
+        connections.close_all()
+        process = multiprocessing.Process(
+            target=_worker_process,
+            args=(f"{prefix}-{index}", stop_event, poll_interval),
+        )
+        process.start()
+        processes[index] = process
+
+    for index in range(workers):
+        start(index)
+
+    def request_stop(signum, frame):
+        stop_event.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    try:
+        while not stop_event.is_set():
+            time.sleep(poll_interval)
+            for index, process in list(processes.items()):
+                # Relancer un worker mort sans attendre l'arrêt du pool
+                if not process.is_alive():
+                    start(index)
+            requeue_stale_jobs()
+    except KeyboardInterrupt:
+        stop_event.set()
+    finally:
+        for process in processes.values():
+            process.join()
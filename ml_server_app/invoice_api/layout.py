@@ -0,0 +1,410 @@
+"""
+Texte des PDF avec la position de chaque fragment
+
+`page.extract_text()` aplatit la mise en page : un libellé et sa valeur
+peuvent se retrouver loin l'un de l'autre dans le texte. En mode mise en page
+(PDF_LAYOUT_EXTRACTION), la lecture de chaque page relève aussi, pendant le
+même appel à extract_text, la position des fragments de texte (un fragment
+par opérateur d'affichage Tj, TJ, ' ou ").
+
+Les fragments d'une page sont rangés dans une grille (index spatial) : la
+valeur d'un libellé (« Total TTC » → le montant à sa droite ou juste en
+dessous) est trouvée par une recherche du plus proche voisin dans les cases
+voisines, au lieu d'un parcours du texte entier.
+
+Les coordonnées sont en points PDF, origine en haut à gauche de la page. La
+largeur d'un fragment est estimée (largeur moyenne d'un caractère) : les
+métriques des polices ne sont pas lues.
+"""
+import math
+import re
+
+try:
+    # Tables de caractères des polices, construites comme le fait extract_text.
+    # Module privé de PyPDF2 : la version est bornée dans requirements.txt
+    # (3.0.x, celle dont la signature est utilisée ci-dessous) ; si la fonction
+    # change, les fragments d'une ligne ne sont plus séparés (voir _split).
+    from PyPDF2._cmap import build_char_map
+    CHAR_MAPS_AVAILABLE = True
+except ImportError:
+    CHAR_MAPS_AVAILABLE = False
+
+# Côté d'une case de la grille, en points (un peu plus que l'interligne courant)
+GRID_CELL = 48
+
+# Distance maximale entre un libellé et sa valeur, en points
+MAX_VALUE_DISTANCE = 300
+
+# Largeur moyenne d'un caractère, en proportion de la taille de police
+CHAR_WIDTH = 0.5
+
+# Opérateurs d'affichage passant d'abord à la ligne suivante
+NEXT_LINE_OPERATORS = (b"'", b'"')
+
+AMOUNT_VALUE = r'\d{1,3}(?:[ \u00a0\u202f.]\d{3})+(?:[.,]\d{2})?|\d+[.,]\d{2}(?!\d)'
+DATE_VALUE = r'\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}|\d{4}-\d{2}-\d{2}'
+REFERENCE_VALUE = r'[A-Z0-9][A-Z0-9/_.-]*\d[A-Z0-9/_.-]*'
+
+# Champs recherchés par libellé : (libellé, valeur)
+LAYOUT_FIELDS = {
+    'numeroFacture': (r'(?i)\b(?:facture|invoice)\s*(?:n[°o]\.?|num[ée]ro|number|#)',
+                      REFERENCE_VALUE),
+    'datePiece': (r'(?i)\bdate(?:\s+(?:de\s+)?(?:la\s+)?facture)?\b', DATE_VALUE),
+    'totalTTC': (r'(?i)\b(?:total|montant)\s*T\.?T\.?C\.?|\bnet\s+[àa]\s+payer\b', AMOUNT_VALUE),
+    'totalHT': (r'(?i)\b(?:total|montant)\s*H\.?T\.?(?![a-z])', AMOUNT_VALUE),
+    'totalTVA': (r'(?i)\b(?:total|montant)\s*T\.?V\.?A\.?(?![a-z])|^T\.?V\.?A\.?(?![a-z])', AMOUNT_VALUE),
+}
+
+# Séparateurs tolérés entre un libellé et sa valeur dans un même fragment
+LABEL_GAP_RE = re.compile(r'[\s:=.°#-]*(?:(?:EUR|€)\s*)?$')
+
+
+def _mult(m, n):
+    return [
+        m[0] * n[0] + m[1] * n[2],
+        m[0] * n[1] + m[1] * n[3],
+        m[2] * n[0] + m[3] * n[2],
+        m[2] * n[1] + m[3] * n[3],
+        m[4] * n[0] + m[5] * n[2] + n[4],
+        m[4] * n[1] + m[5] * n[3] + n[5],
+    ]
+
+
+class TextRun:
+    """Fragment de texte positionné (boîte en points, origine en haut à gauche)"""
+
+    __slots__ = ('text', 'x', 'y', 'width', 'height')
+
+    def __init__(self, text, x, y, width, height):
+        self.text = text
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+
+    @property
+    def right(self):
+        return self.x + self.width
+
+    @property
+    def bottom(self):
+        return self.y + self.height
+
+    def box(self):
+        return [round(self.x, 1), round(self.y, 1), round(self.width, 1), round(self.height, 1)]
+
+    def to_dict(self):
+        return {"text": self.text, "box": self.box()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["text"], *data["box"])
+
+
+class PageRunCollector:
+    """
+    Relève les fragments d'une page pendant `page.extract_text()`
+
+    PyPDF2 transmet le texte à `visitor_text` par lignes (au changement de
+    ligne, de police, en fin de bloc BT/ET) avec la matrice courante, déjà
+    déplacée. La position de chaque opérateur d'affichage est donc relevée
+    séparément, puis associée au texte transmis.
+
+    Usage :
+        collector = PageRunCollector(page)
+        text = page.extract_text(**collector.visitors())
+        layout = collector.layout(page_number)
+    """
+
+    def __init__(self, page):
+        self.page = page
+        self.char_maps = {}
+        self.char_map = None
+        box = page.mediabox
+        self.left = float(box.left)
+        self.top = float(box.top)
+        self.width = float(box.width)
+        self.height = float(box.height)
+        self.runs = []
+        # Opérateurs affichés depuis le dernier texte transmis : (x, y, échelle, chaînes)
+        self.pending = []
+
+    def visitors(self):
+        return {
+            "visitor_operand_before": self.before_operator,
+            "visitor_operand_after": self.after_operator,
+            "visitor_text": self.on_text,
+        }
+
+    def _record(self, operator, operands, cm, tm):
+        m = _mult(tm, cm)
+        scale = math.sqrt(abs(m[0] * m[3]) + abs(m[1] * m[2])) or 1.0
+        if operator == b'TJ':
+            strings = [item for item in operands[0] if isinstance(item, (str, bytes))]
+        else:
+            strings = operands[-1:]
+        self.pending.append((m[4], m[5], scale, [self._decode(item) for item in strings]))
+
+    def _select_font(self, name):
+        if name not in self.char_maps:
+            try:
+                _, _, encoding, map_dict, _ = build_char_map(name, 200.0, self.page)
+                self.char_maps[name] = (encoding, map_dict)
+            except Exception:
+                self.char_maps[name] = None
+        self.char_map = self.char_maps[name]
+
+    def _decode(self, item):
+        """
+        Décode une chaîne comme extract_text, pour la retrouver dans le texte transmis
+
+        Returns:
+            str: Texte de la chaîne, ou None si la police n'a pas pu être lue
+        """
+        if isinstance(item, str):
+            return item
+        if self.char_map is None:
+            return None
+        encoding, map_dict = self.char_map
+        try:
+            if isinstance(encoding, str):
+                try:
+                    text = item.decode(encoding, 'surrogatepass')
+                except Exception:
+                    text = item.decode('utf-16-be' if encoding == 'charmap' else 'charmap', 'surrogatepass')
+            else:
+                text = "".join(encoding[code] if code in encoding else bytes((code,)).decode()
+                               for code in item)
+        except Exception:
+            return None
+        return "".join(map_dict.get(char, char) for char in text)
+
+    def before_operator(self, operator, operands, cm, tm):
+        if operator == b'Tf' and CHAR_MAPS_AVAILABLE:
+            self._select_font(operands[0])
+        elif operator in (b'Tj', b'TJ'):
+            self._record(operator, operands, cm, tm)
+
+    def after_operator(self, operator, operands, cm, tm):
+        # ' et " passent à la ligne (et transmettent la ligne précédente) avant
+        # d'afficher : la position est relevée une fois l'opérateur exécuté
+        if operator in NEXT_LINE_OPERATORS:
+            self._record(operator, operands, cm, tm)
+
+    def on_text(self, text, cm, tm, font_dict, font_size):
+        if not text.strip() or not self.pending:
+            return
+        pending, self.pending = self.pending, []
+        for run_text, x, y, scale in self._split(text, pending):
+            size = font_size * scale
+            self.runs.append(TextRun(
+                run_text,
+                x - self.left,
+                # Haut de la boîte : ligne de base moins la hauteur des majuscules
+                self.top - y - 0.8 * size,
+                len(run_text) * size * CHAR_WIDTH,
+                size,
+            ))
+
+    @staticmethod
+    def _split(text, pending):
+        """
+        Répartit le texte transmis entre les opérateurs relevés
+
+        Returns:
+            list: (texte, x, y, échelle) par opérateur, ou un seul fragment à la
+                  position du premier opérateur si le découpage est impossible
+        """
+        first = next((op for op in pending if any(string is None or string.strip() for string in op[3])),
+                     pending[0])
+        whole = [(text.strip(), *first[:3])]
+        runs = []
+        position = 0
+        for x, y, scale, strings in pending:
+            start = None
+            for string in strings:
+                if string is None:
+                    return whole
+                if not string.strip():
+                    continue
+                index = text.find(string, position)
+                # Seuls des espaces (ajoutés par PyPDF2) peuvent séparer deux chaînes
+                if index == -1 or text[position:index].strip():
+                    return whole
+                start = index if start is None else start
+                position = index + len(string)
+            if start is not None and text[start:position].strip():
+                runs.append((text[start:position].strip(), x, y, scale))
+        if text[position:].strip() or not runs:
+            return whole
+        return runs
+
+    def layout(self, page_number):
+        return PageLayout(page_number, self.width, self.height, self.runs)
+
+
+class PageLayout:
+    """Fragments d'une page rangés dans une grille de cases de GRID_CELL points"""
+
+    def __init__(self, page_number, width, height, runs):
+        self.page = page_number
+        self.width = width
+        self.height = height
+        self.runs = runs
+        self.grid = {}
+        for index, run in enumerate(runs):
+            for cell in self._cells(run.x, run.y, run.right, run.bottom):
+                self.grid.setdefault(cell, []).append(index)
+
+    @staticmethod
+    def _cells(left, top, right, bottom):
+        for column in range(int(left // GRID_CELL), int(right // GRID_CELL) + 1):
+            for row in range(int(top // GRID_CELL), int(bottom // GRID_CELL) + 1):
+                yield column, row
+
+    def _ring(self, column, row, radius):
+        """Indices des fragments des cases à `radius` cases de (column, row)"""
+        found = set()
+        for dx in range(-radius, radius + 1):
+            for dy in range(-radius, radius + 1):
+                if max(abs(dx), abs(dy)) == radius:
+                    found.update(self.grid.get((column + dx, row + dy), ()))
+        return found
+
+    def nearest_value(self, label, value_re, max_distance=MAX_VALUE_DISTANCE, below=True):
+        """
+        Fragment le plus proche à droite du libellé (même ligne) ou juste en dessous
+
+        La recherche parcourt les cases par anneaux autour de la fin du
+        libellé et s'arrête dès qu'aucune case plus éloignée ne peut contenir
+        de candidat plus proche.
+
+        Returns:
+            tuple: (fragment, correspondance de `value_re`), ou None
+        """
+        origin_x, origin_y = label.right, label.y + label.height / 2
+        column, row = int(origin_x // GRID_CELL), int(origin_y // GRID_CELL)
+        best = None
+        seen = set()
+        for radius in range(int(max_distance // GRID_CELL) + 2):
+            for index in self._ring(column, row, radius) - seen:
+                seen.add(index)
+                run = self.runs[index]
+                if run is label:
+                    continue
+                distance = self._distance(label, run, below)
+                if distance is None or distance > max_distance:
+                    continue
+                if best is not None and distance >= best[0]:
+                    continue
+                match = value_re.search(run.text)
+                if match:
+                    best = (distance, run, match)
+            # Les cases de l'anneau suivant sont à plus de radius * GRID_CELL points
+            if best is not None and best[0] <= radius * GRID_CELL:
+                break
+        return best[1:] if best else None
+
+    @staticmethod
+    def _distance(label, run, below):
+        middle = label.y + label.height / 2
+        # À droite, sur la même ligne
+        if abs(run.y + run.height / 2 - middle) <= label.height * 0.6 and run.x >= label.x + label.width * 0.5:
+            return max(0.0, run.x - label.right)
+        # Juste en dessous, dans la même colonne (pénalisé par rapport à la même ligne)
+        if below and run.y > label.y and run.x < label.right and run.right > label.x:
+            return (run.y - label.bottom) * 1.5
+        return None
+
+    def same_line(self, run):
+        """Fragments de la ligne d'un fragment (hors lui-même)"""
+        middle = run.y + run.height / 2
+        row = int(middle // GRID_CELL)
+        indices = set()
+        for column in range(int(self.width // GRID_CELL) + 1):
+            indices.update(self.grid.get((column, row), ()))
+        return [self.runs[index] for index in sorted(indices)
+                if self.runs[index] is not run
+                and abs(self.runs[index].y + self.runs[index].height / 2 - middle) <= run.height * 0.6]
+
+    def to_dict(self):
+        return {
+            "page": self.page,
+            "width": round(self.width, 1),
+            "height": round(self.height, 1),
+            "runs": [run.to_dict() for run in self.runs],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["page"], data["width"], data["height"],
+                   [TextRun.from_dict(run) for run in data["runs"]])
+
+
+def _compiled_fields():
+    return {field: (re.compile(label), re.compile(value)) for field, (label, value) in LAYOUT_FIELDS.items()}
+
+
+_FIELDS = _compiled_fields()
+
+
+def locate_value(layout, label_re, value_re):
+    """
+    Cherche la valeur d'un libellé sur une page
+
+    La valeur est prise, par ordre de préférence : dans le même fragment,
+    juste après le libellé ; dans le fragment le plus proche à droite ; dans
+    le fragment juste en dessous, si le libellé est seul sur sa ligne (un
+    libellé d'en-tête de tableau n'a pas sa valeur en dessous).
+
+    Returns:
+        list: Candidats (rang, libellé, fragment de la valeur, valeur), le plus
+              petit rang étant le meilleur
+    """
+    candidates = []
+    for run in layout.runs:
+        label = label_re.search(run.text)
+        if not label:
+            continue
+        rest = run.text[label.end():]
+        value = value_re.search(rest)
+        if value and LABEL_GAP_RE.match(rest[:value.start()]):
+            candidates.append((0, run, run, value.group()))
+            continue
+        alone = not run.text[:label.start()].strip() and not rest.strip(' :') \
+            and not layout.same_line(run)
+        found = layout.nearest_value(run, value_re, below=alone)
+        if found:
+            value_run, value = found
+            rank = 2 if value_run.y > run.y + run.height * 0.6 else 1
+            candidates.append((rank, run, value_run, value.group()))
+    return candidates
+
+
+def locate_fields(layouts):
+    """
+    Cherche les champs de LAYOUT_FIELDS dans les pages d'un document
+
+    À rang égal, la dernière occurrence l'emporte (les totaux sont en fin de
+    document) ; pour le numéro et la date, la première.
+
+    Returns:
+        dict: Champ → valeur, page et boîtes du libellé et de la valeur
+    """
+    fields = {}
+    for field, (label_re, value_re) in _FIELDS.items():
+        best = None
+        for layout in layouts:
+            for rank, label, value_run, value in locate_value(layout, label_re, value_re):
+                last_wins = field.startswith('total')
+                if best is None or rank < best[0] or (rank == best[0] and last_wins):
+                    best = (rank, layout.page, label, value_run, value)
+        if best:
+            _, page, label, value_run, value = best
+            fields[field] = {
+                "value": value,
+                "page": page,
+                "label_box": label.box(),
+                "value_box": value_run.box(),
+            }
+    return fields
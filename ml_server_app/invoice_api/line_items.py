@@ -0,0 +1,179 @@
+"""
+Lecture des lignes d'articles d'un tableau de facture
+
+L'en-tête du tableau est repéré une seule fois pour tout le texte (une
+recherche par page lorsqu'il est répété), et ses libellés donnent l'ordre
+des colonnes numériques : quantité, prix unitaire, remise, taux de TVA,
+total HT, total TTC. Chaque ligne du tableau est ensuite découpée en jetons
+en une seule passe : la désignation est la partie initiale, les nombres de
+fin de ligne sont attribués aux colonnes dans l'ordre de l'en-tête. Le coût
+est linéaire en nombre de lignes.
+
+Le texte nettoyé ne conserve pas l'alignement des colonnes (espaces
+multiples réduits) : les colonnes sont déduites de l'ordre des valeurs, et
+une colonne facultative vide (remise, taux de TVA) est ignorée lorsque la
+ligne compte moins de valeurs que l'en-tête. Pour la même raison, seuls les
+séparateurs de milliers insécables ou ponctués ("1 234,56", "1.234,56") sont
+reconnus : "1 234,56" avec une espace simple se lit comme deux valeurs.
+"""
+import re
+
+# Libellés des colonnes de l'en-tête, dans l'ordre de priorité des alternatives
+HEADER_COLUMNS_RE = re.compile(r"""(?ix)
+      (?P<totalTTC>(?:total|montant)\s*T\.?T\.?C\.?|\bTTC\b)
+    | (?P<prixHT>prix\s*unit(?:aire)?(?:\s*H\.?T\.?)?|\bP\.?\s?U\.?(?:\s*H\.?T\.?)?(?=\s|$)|unit\s*price
+                 |\bprix\b(?:\s*H\.?T\.?)?|\bprice\b|\btarif\b)
+    | (?P<remise>\bremise\b|\brabais\b|\bdiscount\b|\br[ée]duction\b)
+    | (?P<tauxTVA>(?:(?:total|montant|taux)\s*)?\bTVA\b|\bVAT\b)
+    | (?P<totalHT>(?:total|montant)(?:\s*H\.?T\.?)?|\bamount\b)
+    | (?P<quantite>\bquantit[ée]\b|\bqt[ée]\b|\bquantity\b|\bqty\b)
+""")
+
+# Colonnes pouvant rester vides sur une ligne (ignorées en cas de valeurs manquantes)
+OPTIONAL_COLUMNS = ('remise', 'tauxTVA', 'totalTTC')
+
+# Ligne qui termine le tableau
+SECTION_END_RE = re.compile(
+    r'(?i)\s*(?:sous[- ]?total|total|net\s+[àa]\s+payer|montant\s+(?:total|net))\b')
+
+# Jetons d'une ligne : nombre (avec % éventuel), devise, ou autre mot
+TOKEN_RE = re.compile(
+    r'(?P<number>[-+]?\d[\d\u00a0\u202f.,]*(?<=\d)%?)(?=[ \t]|$)'
+    r'|(?P<currency>€|EUR|EUROS?)(?=[ \t]|$)'
+    r'|\S+'
+)
+
+# Une ligne d'article contient au moins un montant à deux décimales
+AMOUNT_RE = re.compile(r'\d[,.]\d{2}(?!\d)')
+
+
+def normalize_number(token):
+    """
+    Normalise un nombre écrit à la française ou à l'anglaise
+
+    "1 234,56" (espace insécable) → "1234.56", "1,234.56" → "1234.56", "10%" → "10%"
+    """
+    percent = token.endswith('%')
+    value = token.rstrip('%').replace('\u00a0', '').replace('\u202f', '')
+    if ',' in value and '.' in value:
+        # Le dernier séparateur est le séparateur décimal
+        if value.rfind(',') > value.rfind('.'):
+            value = value.replace('.', '').replace(',', '.')
+        else:
+            value = value.replace(',', '')
+    else:
+        value = value.replace(',', '.')
+        # "1.234.567" : points de milliers uniquement
+        if value.count('.') > 1:
+            value = value.replace('.', '')
+    return value + ('%' if percent else '')
+
+
+def parse_header(line):
+    """
+    Colonnes numériques d'un en-tête de tableau, dans l'ordre d'apparition
+
+    Returns:
+        list: Noms des colonnes (clés des articles)
+    """
+    columns = []
+    for match in HEADER_COLUMNS_RE.finditer(line):
+        column = match.lastgroup
+        if column not in columns:
+            columns.append(column)
+    return columns
+
+
+def _fit_columns(columns, count):
+    # Moins de valeurs que de colonnes : les colonnes facultatives sont
+    # retirées d'abord, puis l'alignement se fait à droite (totaux en fin de ligne)
+    columns = list(columns)
+    for optional in OPTIONAL_COLUMNS:
+        if len(columns) <= count:
+            break
+        if optional in columns:
+            columns.remove(optional)
+    return columns[-count:] if count else []
+
+
+def parse_line(line, columns):
+    """
+    Découpe une ligne d'article selon les colonnes de l'en-tête
+
+    Returns:
+        dict: Article (nom, quantite, prixHT, remise, totalHT, totalTTC), ou None
+              si la ligne ne contient pas de montant
+    """
+    tokens = [(match.lastgroup, match.group()) for match in TOKEN_RE.finditer(line)]
+
+    # Nombres de fin de ligne (les symboles de devise sont ignorés)
+    values = []
+    index = len(tokens)
+    while index > 0:
+        kind, token = tokens[index - 1]
+        if kind == 'number':
+            values.append(token)
+        elif kind != 'currency':
+            break
+        index -= 1
+    values.reverse()
+    # Les nombres en trop appartiennent à la désignation ("Lot 2 ...")
+    extra = max(0, len(values) - len(columns))
+    values = values[extra:]
+    name_tokens = [token for _, token in tokens[:index]] + [
+        token for kind, token in tokens[index:] if kind == 'number'][:extra]
+
+    if not values or not any(AMOUNT_RE.search(value) for value in values):
+        return None
+
+    article = {
+        "nom": " ".join(name_tokens) or line.strip(),
+        "quantite": None,
+        "prixHT": None,
+        "remise": None,
+        "totalHT": None,
+        "totalTTC": None,
+    }
+    for column, value in zip(_fit_columns(columns, len(values)), values):
+        if column in article:
+            article[column] = normalize_number(value)
+    return article
+
+
+def parse_line_items(text, header_pattern):
+    """
+    Extrait les lignes d'articles de tous les tableaux du texte
+
+    Args:
+        text: Texte de la facture
+        header_pattern: Expression compilée reconnaissant une ligne d'en-tête
+                        (product_lines_pattern du jeu de patterns)
+
+    Returns:
+        list: Articles, dans l'ordre du texte
+    """
+    articles = []
+    # Un en-tête par ligne (le motif peut correspondre plusieurs fois sur la même)
+    headers = []
+    for header in header_pattern.finditer(text):
+        line_start = text.rfind('\n', 0, header.start()) + 1
+        if not headers or headers[-1][0] != line_start:
+            headers.append((line_start, header))
+
+    for number, (line_start, header) in enumerate(headers):
+        body_start = text.find('\n', header.end())
+        if body_start == -1:
+            continue
+        # Le tableau s'arrête à la ligne de total ou à l'en-tête suivant (page suivante)
+        body_end = headers[number + 1][0] - 1 if number + 1 < len(headers) else len(text)
+        columns = parse_header(text[line_start:body_start])
+        if not columns:
+            columns = ['totalHT']
+
+        for line in text[body_start + 1:body_end].split('\n'):
+            if SECTION_END_RE.match(line):
+                break
+            article = parse_line(line, columns)
+            if article is not None:
+                articles.append(article)
+    return articles
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from invoice_api.bulk import BulkExtractionError, add_arguments, format_progress, run_from_options
+
+
+class Command(BaseCommand):
+    help = "Extrait le texte d'un ensemble de fichiers (sortie JSON Lines), sans passer par l'API"
+
+    def add_arguments(self, parser):
+        add_arguments(parser)
+
+    def handle(self, *args, **options):
+        try:
+            stats = run_from_options(options, lambda stats: self.stderr.write(format_progress(stats)))
+        except BulkExtractionError as e:
+            raise CommandError(str(e))
+        except KeyboardInterrupt:
+            raise CommandError("Interrompu : relancer avec --resume pour continuer")
+
+        self.stderr.write(self.style.SUCCESS(
+            f"{stats['done']} fichier(s) traité(s), {stats['errors']} erreur(s), "
+            f"{stats['skipped']} déjà présent(s) dans la sortie"))
+        if options['update_invoices']:
+            self.stderr.write(f"{stats['invoices_updated']} facture(s) mise(s) à jour")
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from invoice_api.restructure import format_progress, run_restructure
+
+
+class Command(BaseCommand):
+    help = ("Recalcule les données structurées des factures extraites avec une autre version "
+            "de regex_patterns.yaml, à partir du texte nettoyé enregistré")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Factures par lot (lecture et mise à jour)")
+        parser.add_argument('--limit', type=int, default=None,
+                            help="Nombre maximal de factures traitées")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size doit être un entier positif")
+        try:
+            stats = run_restructure(
+                batch_size=options['batch_size'],
+                limit=options['limit'],
+                progress=lambda stats: self.stderr.write(format_progress(stats)),
+            )
+        except KeyboardInterrupt:
+            raise CommandError("Interrompu : les lots déjà enregistrés sont conservés, relancer pour continuer")
+
+        self.stderr.write(self.style.SUCCESS(
+            f"{stats['done']} facture(s) traitée(s), {stats['changed']} modifiée(s) "
+            f"(patterns {stats['pattern_version']})"))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from invoice_api.jobs import run_worker, run_worker_pool
+
+
+class Command(BaseCommand):
+    help = "Lance les workers qui traitent la file d'attente des extractions"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Nombre de processus workers (EXTRACTION_WORKERS par défaut)")
+        parser.add_argument('--poll-interval', type=float, default=None,
+                            help="Attente en secondes lorsque la file est vide")
+        parser.add_argument('--once', action='store_true',
+                            help="Traiter les tâches en attente dans ce processus puis s'arrêter")
+
+    def handle(self, *args, **options):
+        if options['once']:
+            processed = run_worker('once', poll_interval=options['poll_interval'], max_jobs=float('inf'))
+            self.stdout.write(self.style.SUCCESS(f"{processed} tâche(s) traitée(s)"))
+            return
+
+        self.stdout.write("Démarrage des workers d'extraction (Ctrl+C pour arrêter)")
+        run_worker_pool(options['workers'], options['poll_interval'])
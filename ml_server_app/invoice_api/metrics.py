@@ -0,0 +1,522 @@
+"""
+Mesures de la chaîne d'extraction
+
+Chaque extraction enregistre la durée de ses étapes (lecture du PDF,
+rastérisation, OCR, nettoyage, mise en forme, données structurées) et des
+compteurs (pages, octets, caractères reconnus, champs trouvés). Ces mesures
+sont jointes au résultat puis agrégées en histogrammes par processus.
+
+Les extractions ont lieu dans les workers : chaque processus écrit un
+instantané de ses agrégats dans METRICS_DIR, et l'endpoint `metrics` les
+additionne au format texte de Prometheus. Les instantanés sont nommés par PID
+et instant de démarrage du processus ; ceux des processus terminés sont
+additionnés dans un fichier consolidé puis supprimés, pour que les compteurs
+exposés ne diminuent jamais.
+"""
+import atexit
+import contextlib
+import contextvars
+import cProfile
+import io
+import json
+import os
+import pstats
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de consolidation des instantanés
+    fcntl = None
+
+from .conf import get_setting
+
+# Bornes (secondes) des histogrammes de durée
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_current = contextvars.ContextVar('extraction_metrics', default=None)
+
+
+class ExtractionMetrics:
+    """Mesures d'une extraction : durées cumulées par étape, compteurs et champs trouvés"""
+
+    def __init__(self):
+        self.stages = {}
+        self.counters = {}
+        self.field_hits = {}
+
+    def add_stage(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def as_dict(self):
+        return {
+            "stages": {name: round(seconds, 4) for name, seconds in self.stages.items()},
+            "counters": dict(self.counters),
+            "field_hits": dict(self.field_hits),
+        }
+
+
+@contextlib.contextmanager
+def stage(name):
+    """
+    Mesure la durée d'une étape de l'extraction en cours
+
+    Sans extraction en cours (appel direct d'un extracteur), rien n'est enregistré.
+    Les durées d'une même étape appelée plusieurs fois s'additionnent.
+    """
+    current = _current.get()
+    if current is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        current.add_stage(name, time.perf_counter() - start)
+
+
+def add_stage(name, seconds):
+    """Ajoute une durée mesurée ailleurs (processus OCR, par exemple) à l'extraction en cours"""
+    current = _current.get()
+    if current is not None:
+        current.add_stage(name, seconds)
+
+
+def count(name, value=1):
+    """Incrémente un compteur de l'extraction en cours"""
+    current = _current.get()
+    if current is not None:
+        current.count(name, value)
+
+
+def record_field_hits(fields):
+    """Enregistre les champs structurés trouvés (valeur non vide) par l'extraction en cours"""
+    current = _current.get()
+    if current is not None:
+        for field, value in fields.items():
+            current.field_hits[field] = current.field_hits.get(field, 0) + (1 if value else 0)
+
+
+@contextlib.contextmanager
+def record_extraction():
+    """
+    Ouvre l'enregistrement des mesures d'une extraction
+
+    Yields:
+        ExtractionMetrics: Mesures, complétées pendant le bloc
+    """
+    current = ExtractionMetrics()
+    token = _current.set(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    finally:
+        current.add_stage('total', time.perf_counter() - start)
+        _current.reset(token)
+
+
+class Histogram:
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+
+    def as_dict(self):
+        return {"counts": list(self.counts), "sum": self.sum}
+
+
+class MetricsRegistry:
+    """Agrégats des extractions du processus courant"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.extractions = {}
+        self.counters = {}
+        self.field_hits = {}
+
+    def observe(self, metrics, document_type, failed):
+        with self._lock:
+            for name, seconds in metrics.stages.items():
+                self.stages.setdefault(name, Histogram()).observe(seconds)
+            key = f"{document_type or 'unknown'}|{'error' if failed else 'ok'}"
+            self.extractions[key] = self.extractions.get(key, 0) + 1
+            for name, value in metrics.counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            for field, hits in metrics.field_hits.items():
+                self.field_hits[field] = self.field_hits.get(field, 0) + hits
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "stages": {name: histogram.as_dict() for name, histogram in self.stages.items()},
+                "extractions": dict(self.extractions),
+                "counters": dict(self.counters),
+                "field_hits": dict(self.field_hits),
+            }
+
+
+registry = MetricsRegistry()
+
+SNAPSHOT_PREFIX = 'metrics-'
+# Agrégats des processus terminés, additionnés dans un seul fichier
+CONSOLIDATED_NAME = 'metrics-consolidated.json'
+_CONSOLIDATE_LOCK = 'metrics-consolidate.lock'
+
+# Identité du processus dans le nom de son instantané : (PID, instant de démarrage).
+# Un PID réutilisé par un nouveau processus ne remplace pas l'instantané de l'ancien.
+_process = None
+_flush_lock = threading.Lock()
+_flush_timer = None
+
+
+def _process_key():
+    global _process
+    pid = os.getpid()
+    if _process is None or _process[0] != pid:
+        _process = (pid, time.time_ns())
+    return _process
+
+
+def _after_fork():
+    # Le processus enfant repart de zéro : les agrégats hérités restent ceux du parent
+    global _process, _flush_lock, _flush_timer
+    _process = None
+    _flush_lock = threading.Lock()
+    _flush_timer = None
+    registry.__init__()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def _snapshot_path():
+    directory = get_setting('METRICS_DIR')
+    if not directory:
+        return None
+    pid, started = _process_key()
+    return os.path.join(str(directory), f"{SNAPSHOT_PREFIX}{pid}-{started}.json")
+
+
+def _write_json(path, data):
+    # Écriture atomique : un lecteur voit l'ancien ou le nouveau contenu
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as file:
+            json.dump(data, file)
+        os.replace(temp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temp_path)
+        raise
+
+
+def save_snapshot():
+    """Écrit les agrégats du processus dans METRICS_DIR (écriture atomique)"""
+    path = _snapshot_path()
+    if path is None:
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    _write_json(path, registry.snapshot())
+
+
+def _save_quietly():
+    try:
+        save_snapshot()
+    except OSError:
+        pass
+
+
+def _flush(path):
+    global _flush_timer
+    with _flush_lock:
+        _flush_timer = None
+    # Dossier supprimé entre-temps : il n'est pas recréé
+    if os.path.isdir(os.path.dirname(path)):
+        with contextlib.suppress(OSError):
+            _write_json(path, registry.snapshot())
+
+
+def _schedule_flush():
+    """Programme l'écriture de l'instantané après METRICS_SNAPSHOT_INTERVAL secondes"""
+    global _flush_timer
+    interval = get_setting('METRICS_SNAPSHOT_INTERVAL')
+    if not interval:
+        _save_quietly()
+        return
+    path = _snapshot_path()
+    if path is None:
+        return
+    with _flush_lock:
+        if _flush_timer is not None:
+            return
+        with contextlib.suppress(OSError):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        _flush_timer = threading.Timer(interval, _flush, args=(path,))
+        _flush_timer.daemon = True
+        _flush_timer.start()
+
+
+def observe_extraction(metrics, result):
+    """
+    Agrège les mesures d'une extraction terminée et met à jour l'instantané du processus
+    """
+    registry.observe(metrics, result.get("document_type"), "error" in result)
+    _save_quietly()
+
+
+def increment(name, value=1):
+    """
+    Incrémente un compteur global (succès du cache, par exemple)
+
+    L'instantané n'est pas réécrit à chaque appel : les incréments sont
+    regroupés et écrits par un thread au plus toutes les
+    METRICS_SNAPSHOT_INTERVAL secondes, ainsi qu'à la fin du processus.
+    """
+    registry.increment(name, value)
+    _schedule_flush()
+
+
+atexit.register(_save_quietly)
+
+
+def _merge(total, snapshot):
+    for name, histogram in snapshot.get("stages", {}).items():
+        merged = total["stages"].setdefault(
+            name, {"counts": [0] * (len(DURATION_BUCKETS) + 1), "sum": 0.0})
+        merged["counts"] = [a + b for a, b in zip(merged["counts"], histogram["counts"])]
+        merged["sum"] += histogram["sum"]
+    for section in ("extractions", "counters", "field_hits"):
+        for key, value in snapshot.get(section, {}).items():
+            total[section][key] = total[section].get(key, 0) + value
+
+
+def _empty_total():
+    return {"stages": {}, "extractions": {}, "counters": {}, "field_hits": {}}
+
+
+def _parse_snapshot_name(name):
+    """
+    Returns:
+        tuple: (PID, instant de démarrage) d'un instantané de processus, ou None
+    """
+    if not name.startswith(SNAPSHOT_PREFIX) or not name.endswith('.json'):
+        return None
+    try:
+        pid, started = name[len(SNAPSHOT_PREFIX):-len('.json')].split('-')
+        return int(pid), int(started)
+    except ValueError:
+        return None
+
+
+def _pid_alive(pid):
+    if os.name == 'nt':
+        # os.kill terminerait le processus sous Windows : considéré comme actif
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Processus d'un autre utilisateur
+        return True
+    return True
+
+
+def _dead_snapshots(names):
+    """
+    Instantanés des processus terminés : PID disparu, ou réutilisé par un
+    processus plus récent (un PID ne désigne qu'un processus vivant à la fois)
+    """
+    own = _process_key()
+    latest = {own[0]: own[1]}
+    for name in names:
+        key = _parse_snapshot_name(name)
+        if key is not None and key[1] > latest.get(key[0], -1):
+            latest[key[0]] = key[1]
+    dead = []
+    for name in names:
+        key = _parse_snapshot_name(name)
+        if key is None or key == own:
+            continue
+        if key[1] < latest[key[0]] or not _pid_alive(key[0]):
+            dead.append(name)
+    return dead
+
+
+def _consolidate(directory, names):
+    """
+    Additionne les instantanés des processus terminés dans CONSOLIDATED_NAME
+    puis les supprime : le total reste croissant et le dossier ne grossit pas
+
+    Un seul processus consolide à la fois (verrou non bloquant) ; les noms
+    consolidés sont conservés pour ne pas compter deux fois un fichier dont la
+    suppression aurait échoué.
+    """
+    dead = _dead_snapshots(names)
+    if not dead or fcntl is None:
+        return
+    with open(os.path.join(directory, _CONSOLIDATE_LOCK), 'a') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return
+        try:
+            path = os.path.join(directory, CONSOLIDATED_NAME)
+            try:
+                with open(path, 'r', encoding='utf-8') as file:
+                    consolidated = json.load(file)
+            except (OSError, ValueError):
+                consolidated = {"total": _empty_total(), "merged": []}
+            merged = set(consolidated["merged"])
+            for name in dead:
+                if name in merged:
+                    continue
+                try:
+                    with open(os.path.join(directory, name), 'r', encoding='utf-8') as file:
+                        _merge(consolidated["total"], json.load(file))
+                except (OSError, ValueError):
+                    continue
+                merged.add(name)
+            # Seuls les noms dont le fichier existe encore restent utiles
+            present = set(os.listdir(directory))
+            consolidated["merged"] = sorted(name for name in merged if name in present)
+            _write_json(path, consolidated)
+            for name in dead:
+                with contextlib.suppress(OSError):
+                    os.remove(os.path.join(directory, name))
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def collect():
+    """
+    Additionne les agrégats de tous les processus (instantanés de METRICS_DIR)
+
+    Les instantanés des processus terminés sont d'abord consolidés.
+
+    Returns:
+        dict: Histogrammes par étape, extractions, compteurs et champs trouvés
+    """
+    total = _empty_total()
+    own_path = _snapshot_path()
+    directory = get_setting('METRICS_DIR')
+    if directory and os.path.isdir(str(directory)):
+        directory = str(directory)
+        try:
+            _consolidate(directory, os.listdir(directory))
+        except OSError:
+            pass
+        consolidated = None
+        names = os.listdir(directory)
+        if CONSOLIDATED_NAME in names:
+            try:
+                with open(os.path.join(directory, CONSOLIDATED_NAME), 'r', encoding='utf-8') as file:
+                    consolidated = json.load(file)
+                _merge(total, consolidated["total"])
+            except (OSError, ValueError, KeyError):
+                consolidated = None
+        already_merged = set(consolidated["merged"]) if consolidated else set()
+        for name in names:
+            path = os.path.join(directory, name)
+            if (_parse_snapshot_name(name) is None or path == own_path
+                    or name in already_merged):
+                continue
+            try:
+                with open(path, 'r', encoding='utf-8') as file:
+                    _merge(total, json.load(file))
+            except (OSError, ValueError):
+                continue
+    # Le processus courant est lu en mémoire (son instantané peut être en retard)
+    _merge(total, registry.snapshot())
+    return total
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(total=None):
+    """
+    Met en forme les agrégats au format texte de Prometheus
+
+    Returns:
+        str: Exposition des métriques
+    """
+    total = total if total is not None else collect()
+    lines = [
+        "# HELP invoice_extraction_stage_seconds Durée des étapes de l'extraction",
+        "# TYPE invoice_extraction_stage_seconds histogram",
+    ]
+    for name in sorted(total["stages"]):
+        histogram = total["stages"][name]
+        cumulative = 0
+        for bound, bucket_count in zip(DURATION_BUCKETS + ('+Inf',), histogram["counts"]):
+            cumulative += bucket_count
+            lines.append(f'invoice_extraction_stage_seconds_bucket{{stage="{_label(name)}",le="{bound}"}} {cumulative}')
+        lines.append(f'invoice_extraction_stage_seconds_sum{{stage="{_label(name)}"}} {histogram["sum"]:.6f}')
+        lines.append(f'invoice_extraction_stage_seconds_count{{stage="{_label(name)}"}} {cumulative}')
+
+    lines += [
+        "# HELP invoice_extractions_total Extractions terminées",
+        "# TYPE invoice_extractions_total counter",
+    ]
+    for key in sorted(total["extractions"]):
+        document_type, outcome = key.split('|', 1)
+        lines.append(f'invoice_extractions_total{{document_type="{_label(document_type)}",'
+                     f'outcome="{outcome}"}} {total["extractions"][key]}')
+
+    for name in sorted(total["counters"]):
+        metric = f"invoice_extraction_{name}_total"
+        lines += [f"# TYPE {metric} counter", f"{metric} {total['counters'][name]}"]
+
+    lines += [
+        "# HELP invoice_extraction_field_hits_total Champs structurés trouvés",
+        "# TYPE invoice_extraction_field_hits_total counter",
+    ]
+    for field in sorted(total["field_hits"]):
+        lines.append(f'invoice_extraction_field_hits_total{{field="{_label(field)}"}} {total["field_hits"][field]}')
+    return "\n".join(lines) + "\n"
+
+
+def profile_call(func, *args, **kwargs):
+    """
+    Exécute une fonction sous cProfile
+
+    Le profil complet est écrit dans METRICS_DIR/profiles lorsque le dossier est défini.
+
+    Returns:
+        tuple: (valeur renvoyée, résumé des fonctions les plus coûteuses, chemin du profil ou None)
+    """
+    profiler = cProfile.Profile()
+    value = profiler.runcall(func, *args, **kwargs)
+
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(25)
+
+    path = None
+    directory = get_setting('METRICS_DIR')
+    if directory:
+        profile_dir = os.path.join(str(directory), 'profiles')
+        os.makedirs(profile_dir, exist_ok=True)
+        path = os.path.join(profile_dir, f"extraction-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.prof")
+        profiler.dump_stats(path)
+    return value, summary.getvalue(), path
@@ -0,0 +1,245 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:44
+
+import json
+import re
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Copie figée des conversions de structured_fields.py à la date de cette
+# migration : leurs évolutions ultérieures ne doivent pas la modifier
+_TEXT_KEYS = ('text', 'cleaned_text', 'formatted_text')
+_STRING_FIELDS = (
+    ('numeroFacture', 'numero_facture', 100),
+    ('numeroCommande', 'numero_commande', 100),
+    ('numeroContrat', 'numero_contrat', 100),
+)
+_CLIENT_FIELDS = (
+    ('societe', 'client_societe', 255),
+    ('code', 'client_code', 50),
+    ('tva', 'client_tva', 32),
+    ('siret', 'client_siret', 32),
+    ('ville', 'client_ville', 100),
+    ('pays', 'client_pays', 100),
+)
+_DATE_FIELDS = (
+    ('datePiece', 'date_piece'),
+    ('dateCommande', 'date_commande'),
+    ('dateLivraison', 'date_livraison'),
+)
+_AMOUNT_FIELDS = (
+    ('totalTTC', 'total_ttc'),
+    ('totalHT', 'total_ht'),
+    ('totalTVA', 'total_tva'),
+)
+_METADATA_FIELDS = (
+    ('extraction_method', 'extraction_method', 32),
+    ('document_type', 'document_type', 32),
+)
+_DATE_RE = re.compile(r'^(\d{1,2})[/.-](\d{1,2})[/.-](\d{2}|\d{4})$')
+_AMOUNT_QUANTUM = Decimal('0.01')
+_MAX_AMOUNT = Decimal('999999999999.99')
+
+
+def _parse_date(value):
+    if not value:
+        return None
+    match = _DATE_RE.match(value.strip())
+    if not match:
+        return None
+    day, month, year = (int(part) for part in match.groups())
+    if len(match.group(3)) == 2:
+        # Même convention que strptime('%y') : 69-99 → 19xx, 00-68 → 20xx
+        year += 1900 if year >= 69 else 2000
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+def _parse_amount(value):
+    if not value:
+        return None
+    try:
+        amount = Decimal(str(value).replace(',', '.')).quantize(_AMOUNT_QUANTUM)
+    except (InvalidOperation, ValueError):
+        return None
+    if not amount.is_finite() or abs(amount) > _MAX_AMOUNT:
+        return None
+    return amount
+
+
+def _truncate(value, max_length):
+    if value is None:
+        return None
+    return str(value)[:max_length]
+
+
+def _structured_columns(result):
+    result = result or {}
+    structured = result.get('structured_data') or {}
+    client = structured.get('client') or {}
+    columns = {}
+    for key, column, max_length in _STRING_FIELDS:
+        columns[column] = _truncate(structured.get(key), max_length)
+    for key, column, max_length in _CLIENT_FIELDS:
+        columns[column] = _truncate(client.get(key), max_length)
+    for key, column in _DATE_FIELDS:
+        columns[column] = _parse_date(structured.get(key))
+    for key, column in _AMOUNT_FIELDS:
+        columns[column] = _parse_amount(structured.get(key))
+    for key, column, max_length in _METADATA_FIELDS:
+        columns[column] = _truncate(result.get(key), max_length)
+    return columns
+
+
+def _split_result(result):
+    result = dict(result or {})
+    content = {key: result.pop(key, None) for key in _TEXT_KEYS}
+    content['data'] = result
+    return content
+
+
+def _join_result(text, cleaned_text, formatted_text, data):
+    result = dict(data or {})
+    for key, value in zip(_TEXT_KEYS, (text, cleaned_text, formatted_text)):
+        if value is not None:
+            result[key] = value
+    return result
+
+
+def split_extracted_text(apps, schema_editor):
+    """Répartit le JSON de `extracted_text` entre les colonnes et InvoiceContent"""
+    Invoice = apps.get_model('invoice_api', 'Invoice')
+    InvoiceContent = apps.get_model('invoice_api', 'InvoiceContent')
+    invoices = Invoice.objects.exclude(extracted_text__isnull=True).exclude(extracted_text='')
+    for invoice in invoices.iterator():
+        try:
+            result = json.loads(invoice.extracted_text)
+        except ValueError:
+            result = {'text': invoice.extracted_text}
+        for column, value in _structured_columns(result).items():
+            setattr(invoice, column, value)
+        invoice.save()
+        InvoiceContent.objects.create(invoice=invoice, **_split_result(result))
+
+
+def join_extracted_text(apps, schema_editor):
+    """Reconstitue `extracted_text` à partir de InvoiceContent"""
+    InvoiceContent = apps.get_model('invoice_api', 'InvoiceContent')
+    for content in InvoiceContent.objects.select_related('invoice').iterator():
+        result = _join_result(content.text, content.cleaned_text, content.formatted_text, content.data)
+        content.invoice.extracted_text = json.dumps(result)
+        content.invoice.save(update_fields=['extracted_text'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice_api', '0003_extractionjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceContent',
+            fields=[
+                ('invoice', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='content', serialize=False, to='invoice_api.invoice')),
+                ('text', models.TextField(blank=True, null=True)),
+                ('cleaned_text', models.TextField(blank=True, null=True)),
+                ('formatted_text', models.TextField(blank=True, null=True)),
+                ('data', models.JSONField(blank=True, default=dict)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='client_code',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='client_pays',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='client_siret',
+            field=models.CharField(blank=True, db_index=True, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='client_societe',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='client_tva',
+            field=models.CharField(blank=True, db_index=True, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='client_ville',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='date_commande',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='date_livraison',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='date_piece',
+            field=models.DateField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='document_type',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='extraction_method',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='numero_commande',
+            field=models.CharField(blank=True, db_index=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='numero_contrat',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='numero_facture',
+            field=models.CharField(blank=True, db_index=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='total_ht',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='total_ttc',
+            field=models.DecimalField(blank=True, db_index=True, decimal_places=2, max_digits=14, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='total_tva',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True),
+        ),
+        migrations.RunPython(split_extracted_text, join_extracted_text),
+        migrations.RemoveField(
+            model_name='invoice',
+            name='extracted_text',
+        ),
+    ]
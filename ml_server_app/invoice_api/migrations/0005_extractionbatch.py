@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice_api', '0004_invoice_structured_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExtractionBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('skipped', models.JSONField(blank=True, default=list)),
+            ],
+            options={
+                'ordering': ['-created_at', '-id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='batch',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='invoices', to='invoice_api.extractionbatch'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:52
+
+import hashlib
+import json
+
+from django.db import migrations, models
+
+# Copie figée des fonctions de structured_fields.py à la date de cette
+# migration : leurs évolutions ultérieures ne doivent pas la modifier
+_TEXT_KEYS = ('text', 'cleaned_text', 'formatted_text')
+
+
+def _join_result(text, cleaned_text, formatted_text, data):
+    result = dict(data or {})
+    for key, value in zip(_TEXT_KEYS, (text, cleaned_text, formatted_text)):
+        if value is not None:
+            result[key] = value
+    return result
+
+
+def _result_etag(result):
+    if not result or "error" in result:
+        return ""
+    payload = json.dumps(result, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+
+def compute_etags(apps, schema_editor):
+    """Calcule l'empreinte des résultats déjà enregistrés"""
+    InvoiceContent = apps.get_model('invoice_api', 'InvoiceContent')
+    for content in InvoiceContent.objects.iterator():
+        result = _join_result(content.text, content.cleaned_text, content.formatted_text, content.data)
+        content.etag = _result_etag(result)
+        content.save(update_fields=['etag'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice_api', '0005_extractionbatch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoicecontent',
+            name='etag',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='invoicecontent',
+            name='render_version',
+            field=models.CharField(blank=True, max_length=16, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoicecontent',
+            name='rendered_html',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoicecontent',
+            name='rendered_json',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoicecontent',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(compute_etags, migrations.RunPython.noop),
+    ]
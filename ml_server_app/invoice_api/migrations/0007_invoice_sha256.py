@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:20
+
+import hashlib
+import os
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def compute_hashes(apps, schema_editor):
+    """Calcule l'empreinte des fichiers déjà téléchargés (fichiers absents ignorés)"""
+    Invoice = apps.get_model('invoice_api', 'Invoice')
+    for invoice in Invoice.objects.filter(sha256='').only('id', 'file').iterator():
+        digest = hashlib.sha256()
+        try:
+            with open(os.path.join(settings.MEDIA_ROOT, invoice.file.name), 'rb') as file:
+                for chunk in iter(lambda: file.read(1024 * 1024), b''):
+                    digest.update(chunk)
+        except OSError:
+            continue
+        Invoice.objects.filter(id=invoice.id).update(sha256=digest.hexdigest())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice_api', '0006_invoicecontent_rendering'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='sha256',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+        migrations.RunPython(compute_hashes, migrations.RunPython.noop),
+    ]
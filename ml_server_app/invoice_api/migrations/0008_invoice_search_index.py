@@ -0,0 +1,118 @@
+from django.conf import settings
+from django.db import migrations
+
+SQLITE_CREATE = [
+    """
+    CREATE VIRTUAL TABLE invoice_api_invoicesearch USING fts5(
+        reference, client, amounts, text,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    # La ligne d'une facture supprimée est retirée de l'index
+    """
+    CREATE TRIGGER invoice_api_invoicesearch_delete AFTER DELETE ON invoice_api_invoice
+    BEGIN
+        DELETE FROM invoice_api_invoicesearch WHERE rowid = old.id;
+    END
+    """,
+]
+SQLITE_DROP = [
+    'DROP TRIGGER IF EXISTS invoice_api_invoicesearch_delete',
+    'DROP TABLE IF EXISTS invoice_api_invoicesearch',
+]
+
+POSTGRES_CREATE = [
+    """
+    CREATE TABLE invoice_api_invoicesearch (
+        invoice_id bigint PRIMARY KEY
+            REFERENCES invoice_api_invoice (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        document tsvector NOT NULL
+    )
+    """,
+    'CREATE INDEX invoice_api_invoicesearch_document ON invoice_api_invoicesearch USING GIN (document)',
+]
+POSTGRES_DROP = ['DROP TABLE IF EXISTS invoice_api_invoicesearch']
+
+# Copie figée de l'indexation de search.py à la date de cette migration : ses
+# évolutions ultérieures ne doivent pas la modifier
+_SEARCH_COLUMNS = ('reference', 'client', 'amounts', 'text')
+_POSTGRES_WEIGHTS = ('A', 'B', 'B', 'D')
+
+
+def _search_document(invoice, cleaned_text):
+    def join(*values):
+        return ' '.join(str(value) for value in values if value not in (None, ''))
+
+    return {
+        'reference': join(invoice.numero_facture, invoice.numero_commande, invoice.numero_contrat),
+        'client': join(invoice.client_societe, invoice.client_code, invoice.client_siret,
+                       invoice.client_tva, invoice.client_ville, invoice.client_pays),
+        'amounts': join(invoice.total_ttc, invoice.total_ht, invoice.total_tva),
+        'text': cleaned_text or '',
+    }
+
+
+def _index_invoices(connection, items):
+    if not items:
+        return
+    rows = [(invoice.pk, _search_document(invoice, cleaned_text)) for invoice, cleaned_text in items]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.executemany(
+                f'INSERT INTO invoice_api_invoicesearch (rowid, {", ".join(_SEARCH_COLUMNS)}) '
+                f'VALUES (%s, {", ".join(["%s"] * len(_SEARCH_COLUMNS))})',
+                [(pk, *(document[column] for column in _SEARCH_COLUMNS)) for pk, document in rows],
+            )
+        else:
+            config = getattr(settings, 'SEARCH_TEXT_CONFIG', 'french')
+            vectors = ' || '.join(
+                f"setweight(to_tsvector(%s::regconfig, %s), '{weight}')"
+                for weight in _POSTGRES_WEIGHTS
+            )
+            cursor.executemany(
+                f'INSERT INTO invoice_api_invoicesearch (invoice_id, document) VALUES (%s, {vectors})',
+                [(pk, *(value for column in _SEARCH_COLUMNS for value in (config, document[column])))
+                 for pk, document in rows],
+            )
+
+
+def create_search_index(apps, schema_editor):
+    """Crée l'index (FTS5 ou tsvector) et y ajoute les factures déjà extraites"""
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        statements = SQLITE_CREATE
+    elif connection.vendor == 'postgresql':
+        statements = POSTGRES_CREATE
+    else:
+        # Autre base : la recherche plein texte n'est pas disponible
+        return
+    for statement in statements:
+        schema_editor.execute(statement)
+
+    InvoiceContent = apps.get_model('invoice_api', 'InvoiceContent')
+    contents = InvoiceContent.objects.using(connection.alias).select_related('invoice')
+    items = []
+    for content in contents.iterator(chunk_size=500):
+        items.append((content.invoice, content.cleaned_text))
+        if len(items) == 500:
+            _index_invoices(connection, items)
+            items = []
+    _index_invoices(connection, items)
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    statements = {'sqlite': SQLITE_DROP, 'postgresql': POSTGRES_DROP}.get(connection.vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice_api', '0007_invoice_sha256'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,102 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:34
+
+import hashlib
+import re
+import zlib
+
+import django.db.models.deletion
+import numpy as np
+from django.db import migrations, models
+
+# Copie figée du calcul des empreintes de fingerprints.py à la date de cette
+# migration : ses évolutions ultérieures ne doivent pas la modifier
+_SHINGLE_SIZE = 5
+_LSH_BANDS = 25
+_ROWS_PER_BAND = 5
+_NUM_PERMUTATIONS = _LSH_BANDS * _ROWS_PER_BAND
+_MIN_SHINGLES = 50
+_PRIME = (1 << 31) - 1
+_BLOCK = 2048
+_NON_WORD_RE = re.compile(r'[\W_]+')
+
+
+def _permutations():
+    random = np.random.RandomState(20240312)
+    a = random.randint(1, _PRIME, _NUM_PERMUTATIONS).astype(np.uint64)
+    b = random.randint(0, _PRIME, _NUM_PERMUTATIONS).astype(np.uint64)
+    return a, b
+
+
+def _compute_signature(text, a, b):
+    normalized = _NON_WORD_RE.sub(' ', (text or '').lower()).strip()
+    shingles = {zlib.crc32(normalized[i:i + _SHINGLE_SIZE].encode('utf-8')) & _PRIME
+                for i in range(len(normalized) - _SHINGLE_SIZE + 1)}
+    if len(shingles) < _MIN_SHINGLES:
+        return None
+
+    hashes = np.fromiter(shingles, dtype=np.uint64, count=len(shingles))
+    signature = np.full(_NUM_PERMUTATIONS, _PRIME, dtype=np.uint64)
+    for start in range(0, len(hashes), _BLOCK):
+        block = hashes[start:start + _BLOCK]
+        permuted = (a[:, None] * block[None, :] + b[:, None]) % _PRIME
+        np.minimum(signature, permuted.min(axis=1), out=signature)
+    return signature.astype('>u4').tobytes()
+
+
+def _band_keys(signature):
+    size = _ROWS_PER_BAND * 4
+    return [
+        int.from_bytes(hashlib.blake2b(bytes([band]) + signature[band * size:(band + 1) * size],
+                                       digest_size=8).digest(), 'big', signed=True)
+        for band in range(_LSH_BANDS)
+    ]
+
+
+def compute_fingerprints(apps, schema_editor):
+    """Calcule l'empreinte des textes déjà extraits (les doublons ne sont pas marqués)"""
+    a, b = _permutations()
+    InvoiceContent = apps.get_model('invoice_api', 'InvoiceContent')
+    InvoiceFingerprint = apps.get_model('invoice_api', 'InvoiceFingerprint')
+    FingerprintBand = apps.get_model('invoice_api', 'FingerprintBand')
+    contents = InvoiceContent.objects.only('invoice_id', 'cleaned_text')
+    for content in contents.iterator(chunk_size=500):
+        signature = _compute_signature(content.cleaned_text, a, b)
+        if signature is None:
+            continue
+        fingerprint = InvoiceFingerprint.objects.create(invoice_id=content.invoice_id, signature=signature)
+        FingerprintBand.objects.bulk_create(
+            [FingerprintBand(fingerprint=fingerprint, key=key) for key in _band_keys(signature)])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice_api', '0008_invoice_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvoiceFingerprint',
+            fields=[
+                ('invoice', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fingerprint', serialize=False, to='invoice_api.invoice')),
+                ('signature', models.BinaryField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='invoice_api.invoice'),
+        ),
+        migrations.CreateModel(
+            name='FingerprintBand',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.BigIntegerField()),
+                ('fingerprint', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bands', to='invoice_api.invoicefingerprint')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['key', 'fingerprint'], name='invoice_api_key_d93cac_idx')],
+            },
+        ),
+        migrations.RunPython(compute_fingerprints, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoice_api', '0009_invoice_fingerprints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='pattern_version',
+            field=models.CharField(blank=True, db_index=True, max_length=16, null=True),
+        ),
+    ]
@@ -1,26 +1,233 @@
-from django.db import models
-import json
+from django.db import models, transaction
 from django.urls import reverse
+from django.utils import timezone
+
+from . import search
+from .conf import get_setting
+from .fingerprints import MAX_CANDIDATES, band_keys, result_signature, similarity
+from .structured_fields import (
+    STRUCTURED_COLUMNS, join_result, result_etag, split_result, structured_columns,
+)
+from .text_utils import RENDER_VERSION, create_formatted_text_json, create_invoice_html
+
+class ExtractionBatch(models.Model):
+    """
+    Lot de factures téléchargées ensemble (plusieurs fichiers ou une archive ZIP)
+    """
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Fichiers ignorés : [{"name": ..., "reason": ...}]
+    skipped = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+
+    def __str__(self):
+        return f"ExtractionBatch {self.id} - {self.created_at}"
+
+    def get_progress(self):
+        """
+        Calcule l'avancement des extractions du lot
+
+        Returns:
+            dict: Nombre de factures, nombre de tâches par statut et indicateur de fin
+        """
+        counts = dict(
+            ExtractionJob.objects.filter(invoice__batch=self)
+            .values_list('status')
+            .annotate(count=models.Count('id'))
+        )
+        progress = {'total': self.invoices.count()}
+        for status, _ in ExtractionJob.STATUS_CHOICES:
+            progress[status] = counts.get(status, 0)
+        progress['finished'] = (
+            progress[ExtractionJob.STATUS_DONE] + progress[ExtractionJob.STATUS_FAILED]
+            >= progress['total']
+        )
+        return progress
 
 class Invoice(models.Model):
     file = models.FileField(upload_to='invoices/')
     uploaded_at = models.DateTimeField(auto_now_add=True)
     processed = models.BooleanField(default=False)
-    extracted_text = models.TextField(blank=True, null=True)
+    batch = models.ForeignKey(ExtractionBatch, related_name='invoices', blank=True, null=True,
+                              on_delete=models.SET_NULL)
+    # Empreinte SHA-256 du fichier, calculée à la réception (doublons, clé du cache)
+    sha256 = models.CharField(max_length=64, blank=True, default='', db_index=True)
+    
+    # Données structurées recopiées du résultat de l'extraction, interrogeables en SQL
+    numero_facture = models.CharField(max_length=100, blank=True, null=True, db_index=True)
+    numero_commande = models.CharField(max_length=100, blank=True, null=True, db_index=True)
+    numero_contrat = models.CharField(max_length=100, blank=True, null=True)
+    date_piece = models.DateField(blank=True, null=True, db_index=True)
+    date_commande = models.DateField(blank=True, null=True)
+    date_livraison = models.DateField(blank=True, null=True)
+    total_ttc = models.DecimalField(max_digits=14, decimal_places=2, blank=True, null=True, db_index=True)
+    total_ht = models.DecimalField(max_digits=14, decimal_places=2, blank=True, null=True)
+    total_tva = models.DecimalField(max_digits=14, decimal_places=2, blank=True, null=True)
+    client_societe = models.CharField(max_length=255, blank=True, null=True)
+    client_code = models.CharField(max_length=50, blank=True, null=True)
+    client_tva = models.CharField(max_length=32, blank=True, null=True, db_index=True)
+    client_siret = models.CharField(max_length=32, blank=True, null=True, db_index=True)
+    client_ville = models.CharField(max_length=100, blank=True, null=True)
+    client_pays = models.CharField(max_length=100, blank=True, null=True)
+    extraction_method = models.CharField(max_length=32, blank=True, null=True)
+    document_type = models.CharField(max_length=32, blank=True, null=True)
+    # Facture antérieure dont celle-ci est probablement un doublon (même numéro et
+    # même total TTC, ou texte similaire : voir find_duplicates)
+    duplicate_of = models.ForeignKey('self', related_name='duplicates', blank=True, null=True,
+                                     on_delete=models.SET_NULL)
+    # Version du jeu de patterns regex des données structurées (voir restructure.py)
+    pattern_version = models.CharField(max_length=16, blank=True, null=True, db_index=True)
     
     def __str__(self):
         return f"Invoice {self.id} - {self.uploaded_at}"
     
     def set_extracted_text(self, text_data):
         """
-        Stocke les données de texte extraites au format JSON
+        Stocke les données de texte extraites
+        
+        Les champs structurés sont recopiés dans les colonnes de la facture,
+        les textes et le reste du résultat dans InvoiceContent ; l'index de
+        recherche plein texte et l'empreinte du texte sont mis à jour dans la
+        même transaction, et la facture est marquée si elle double une facture
+        antérieure (duplicate_of).
         
         Args:
             text_data: Dictionnaire contenant le texte extrait et les métadonnées
         """
-        self.extracted_text = json.dumps(text_data)
+        self._apply_columns(text_data)
+        signature = result_signature(text_data)
+        
+        with transaction.atomic():
+            self.duplicate_of_id = self._find_original(signature)
+            self.save()
+            content, _ = InvoiceContent.objects.update_or_create(
+                invoice=self, defaults=self._content_fields(text_data))
+            search.index_invoices([(self, text_data.get('cleaned_text'))])
+            InvoiceFingerprint.store([(self, signature)])
+        self.content = content
+    
+    def find_duplicates(self, signature=None, limit=10):
+        """
+        Recherche les factures qui sont probablement la même facture que celle-ci
+        
+        Deux critères : même numéro de facture et même total TTC, ou texte
+        similaire (empreintes partageant une bande LSH, puis similarité estimée
+        au moins égale à DUPLICATE_SIMILARITY_THRESHOLD).
+        
+        Args:
+            signature: Empreinte MinHash du texte (par défaut, celle enregistrée)
+            limit: Nombre maximal de factures retournées
+            
+        Returns:
+            list: {"invoice_id", "similarity", "match"} ("reference" ou "text"),
+                  correspondances par numéro d'abord, puis par similarité décroissante
+        """
+        if signature is None:
+            stored = InvoiceFingerprint.objects.filter(invoice_id=self.pk).values_list('signature', flat=True).first()
+            signature = bytes(stored) if stored is not None else None
+        
+        same_reference = []
+        if self.numero_facture and self.total_ttc is not None:
+            same_reference = list(
+                Invoice.objects.filter(numero_facture=self.numero_facture, total_ttc=self.total_ttc)
+                .exclude(pk=self.pk).order_by('id').values_list('id', flat=True)[:limit])
+        
+        # Candidats : factures partageant au moins une bande, les plus proches d'abord
+        candidates = []
+        if signature is not None:
+            candidates = list(
+                FingerprintBand.objects.filter(key__in=band_keys(signature))
+                .exclude(fingerprint_id=self.pk).values('fingerprint_id')
+                .annotate(shared=models.Count('id')).order_by('-shared', 'fingerprint_id')
+                .values_list('fingerprint_id', flat=True)[:MAX_CANDIDATES])
+        signatures = {
+            invoice_id: bytes(stored) for invoice_id, stored in
+            InvoiceFingerprint.objects.filter(invoice_id__in=set(same_reference) | set(candidates))
+            .values_list('invoice_id', 'signature')
+        } if signature is not None else {}
+        
+        def text_similarity(invoice_id):
+            other = signatures.get(invoice_id)
+            return round(similarity(signature, other), 3) if other is not None else None
+        
+        duplicates = [{'invoice_id': invoice_id, 'similarity': text_similarity(invoice_id), 'match': 'reference'}
+                      for invoice_id in same_reference]
+        threshold = get_setting('DUPLICATE_SIMILARITY_THRESHOLD')
+        near = []
+        for invoice_id in candidates:
+            score = text_similarity(invoice_id)
+            if invoice_id not in same_reference and score is not None and score >= threshold:
+                near.append({'invoice_id': invoice_id, 'similarity': score, 'match': 'text'})
+        near.sort(key=lambda duplicate: (-duplicate['similarity'], duplicate['invoice_id']))
+        return (duplicates + near)[:limit]
+    
+    def _find_original(self, signature):
+        # Seule une facture antérieure peut être l'original
+        for duplicate in self.find_duplicates(signature, limit=MAX_CANDIDATES):
+            if duplicate['invoice_id'] < self.pk:
+                return duplicate['invoice_id']
+        return None
+    
+    def _apply_columns(self, text_data):
+        for column, value in structured_columns(text_data).items():
+            setattr(self, column, value)
+        self.pattern_version = text_data.get('pattern_version')
         self.processed = True
-        self.save()
+    
+    @staticmethod
+    def _content_fields(text_data):
+        # Les rendus stockés sont invalidés et seront recalculés à la demande
+        content_fields = split_result(text_data)
+        # L'empreinte est stockée à part (InvoiceFingerprint)
+        content_fields['data'].pop('fingerprint', None)
+        content_fields.update(
+            etag=result_etag(text_data),
+            rendered_html=None,
+            rendered_json=None,
+            render_version=None,
+        )
+        return content_fields
+    
+    @classmethod
+    def bulk_set_extracted_text(cls, items, batch_size=500):
+        """
+        Stocke les résultats d'extraction de plusieurs factures en quelques requêtes
+        
+        Équivalent de set_extracted_text pour chaque facture : colonnes mises à
+        jour par bulk_update, contenus et empreintes insérés ou remplacés par
+        bulk_create.
+        
+        Args:
+            items: Liste de couples (facture, résultat de l'extraction)
+            batch_size: Nombre de lignes par requête
+        """
+        invoices = []
+        contents = []
+        indexed = []
+        signatures = []
+        for invoice, text_data in items:
+            invoice._apply_columns(text_data)
+            invoices.append(invoice)
+            contents.append(InvoiceContent(invoice=invoice, **cls._content_fields(text_data)))
+            indexed.append((invoice, text_data.get('cleaned_text')))
+            signatures.append((invoice, result_signature(text_data)))
+        if not invoices:
+            return
+        
+        content_columns = list(cls._content_fields({}).keys()) + ['updated_at']
+        with transaction.atomic():
+            cls.objects.bulk_update(invoices, list(STRUCTURED_COLUMNS) + ['pattern_version', 'processed'],
+                                    batch_size=batch_size)
+            InvoiceContent.objects.bulk_create(
+                contents, batch_size=batch_size, update_conflicts=True,
+                unique_fields=['invoice'], update_fields=content_columns)
+            search.index_invoices(indexed)
+            # Doublons : une recherche par facture, une fois toutes les empreintes enregistrées
+            InvoiceFingerprint.store(signatures)
+            for invoice, signature in signatures:
+                invoice.duplicate_of_id = invoice._find_original(signature)
+            cls.objects.bulk_update(invoices, ['duplicate_of'], batch_size=batch_size)
     
     def get_extracted_text(self):
         """
@@ -29,9 +236,11 @@ class Invoice(models.Model):
         Returns:
             dict: Dictionnaire contenant le texte extrait et les métadonnées
         """
-        if self.extracted_text:
-            return json.loads(self.extracted_text)
-        return None
+        try:
+            content = self.content
+        except InvoiceContent.DoesNotExist:
+            return None
+        return content.to_result()
         
     def get_formatted_text_url(self):
         """
@@ -49,4 +258,145 @@ class Invoice(models.Model):
         Returns:
             str: URL du texte formaté en HTML
         """
-        return f"{reverse('invoice-formatted-text', kwargs={'pk': self.pk})}?format=html"
\ No newline at end of file
+        return f"{reverse('invoice-formatted-text', kwargs={'pk': self.pk})}?format=html"
+
+class InvoiceContent(models.Model):
+    """
+    Textes extraits d'une facture et résultat complet de l'extraction,
+    séparés d'Invoice pour n'être chargés qu'à la demande
+    """
+    invoice = models.OneToOneField(Invoice, related_name='content', primary_key=True,
+                                   on_delete=models.CASCADE)
+    text = models.TextField(blank=True, null=True)
+    cleaned_text = models.TextField(blank=True, null=True)
+    formatted_text = models.TextField(blank=True, null=True)
+    # Données structurées d'origine, métadonnées, pages, erreur éventuelle...
+    data = models.JSONField(default=dict, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Empreinte du résultat (vide pour une extraction en erreur), base des ETag
+    etag = models.CharField(max_length=64, blank=True, default='')
+    # Rendus de formatted_text, calculés une fois par résultat et par RENDER_VERSION
+    rendered_html = models.TextField(blank=True, null=True)
+    rendered_json = models.TextField(blank=True, null=True)
+    render_version = models.CharField(max_length=16, blank=True, null=True)
+
+    def __str__(self):
+        return f"InvoiceContent {self.invoice_id}"
+
+    def http_etag(self, kind):
+        """ETag HTTP d'un rendu : empreinte du résultat, version des rendus et format"""
+        return f'"{self.etag}-{RENDER_VERSION}-{kind}"'
+
+    def get_rendered(self, kind):
+        """
+        Retourne un rendu du texte formaté, calculé et stocké au premier appel
+
+        Args:
+            kind: 'html' ou 'json'
+
+        Returns:
+            str: Document rendu
+        """
+        if self.render_version != RENDER_VERSION or self.rendered_html is None:
+            # Une seule requête pour les champs éventuellement différés
+            self.refresh_from_db(fields=['text', 'cleaned_text', 'formatted_text', 'data'])
+            result = self.to_result()
+            self.rendered_html = create_invoice_html(result)
+            self.rendered_json = create_formatted_text_json(result)
+            self.render_version = RENDER_VERSION
+            # Ne pas écraser un résultat enregistré entre-temps par une nouvelle extraction
+            InvoiceContent.objects.filter(pk=self.pk, etag=self.etag).update(
+                rendered_html=self.rendered_html,
+                rendered_json=self.rendered_json,
+                render_version=self.render_version,
+            )
+        return self.rendered_html if kind == 'html' else self.rendered_json
+
+    def to_result(self):
+        """
+        Reconstitue le dictionnaire renvoyé par l'extraction
+
+        Returns:
+            dict: Texte extrait et métadonnées
+        """
+        return join_result(self.text, self.cleaned_text, self.formatted_text, self.data)
+
+class InvoiceFingerprint(models.Model):
+    """
+    Empreinte MinHash du texte nettoyé d'une facture (voir fingerprints.py)
+    """
+    invoice = models.OneToOneField(Invoice, related_name='fingerprint', primary_key=True,
+                                   on_delete=models.CASCADE)
+    signature = models.BinaryField()
+
+    def __str__(self):
+        return f"InvoiceFingerprint {self.invoice_id}"
+
+    @classmethod
+    def store(cls, items):
+        """
+        Remplace les empreintes et les bandes LSH de plusieurs factures
+
+        Args:
+            items: Liste de couples (facture, empreinte ou None)
+        """
+        ids = [invoice.pk for invoice, _ in items]
+        cls.objects.filter(invoice_id__in=ids).delete()
+        fingerprints = [cls(invoice=invoice, signature=signature)
+                        for invoice, signature in items if signature is not None]
+        cls.objects.bulk_create(fingerprints)
+        FingerprintBand.objects.bulk_create([
+            FingerprintBand(fingerprint=fingerprint, key=key)
+            for fingerprint in fingerprints for key in band_keys(fingerprint.signature)
+        ], batch_size=1000)
+
+class FingerprintBand(models.Model):
+    """
+    Clé d'une bande LSH d'une empreinte : les factures partageant une clé sont
+    candidates à la comparaison
+    """
+    fingerprint = models.ForeignKey(InvoiceFingerprint, related_name='bands', on_delete=models.CASCADE)
+    key = models.BigIntegerField()
+
+    class Meta:
+        indexes = [models.Index(fields=['key', 'fingerprint'])]
+
+    def __str__(self):
+        return f"FingerprintBand {self.fingerprint_id} - {self.key}"
+
+class ExtractionJob(models.Model):
+    """
+    Tâche d'extraction exécutée en arrière-plan par les workers
+    (voir la commande `run_extraction_workers`)
+    """
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'En attente'),
+        (STATUS_RUNNING, 'En cours'),
+        (STATUS_DONE, 'Terminée'),
+        (STATUS_FAILED, 'Échouée'),
+    ]
+
+    invoice = models.ForeignKey(Invoice, related_name='jobs', on_delete=models.CASCADE)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED, db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    error = models.TextField(blank=True, null=True)
+    worker = models.CharField(max_length=100, blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    available_at = models.DateTimeField(default=timezone.now, db_index=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['created_at', 'id']
+
+    def __str__(self):
+        return f"ExtractionJob {self.id} - Invoice {self.invoice_id} ({self.status})"
+
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_DONE, self.STATUS_FAILED)
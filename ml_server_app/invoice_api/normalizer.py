@@ -0,0 +1,201 @@
+"""
+Nettoyage et mise en forme du texte extrait
+
+Le marquage des montants, dates et numéros de facture était fait par trois
+`re.sub` successifs, chacun relisant tout le texte produit par le précédent.
+Il est fait ici par une seule expression, dont les alternatives sont
+essayées dans l'ordre des anciennes passes. L'expression commence par une
+classe de caractères (chiffre ou première lettre d'un libellé de numéro) :
+le moteur `re` saute directement aux positions candidates au lieu d'essayer
+chaque alternative à chaque position. Le premier caractère étant consommé
+par cette classe, les alternatives le vérifient par une assertion arrière.
+
+Le résultat est identique, caractère pour caractère, à celui des passes
+successives (`clean_text_sequential`, `format_text_sequential`). Les
+passes successives voyaient le texte déjà transformé par les précédentes ;
+l'expression unique reproduit ces interactions :
+- une date ne doit pas chevaucher un montant (« 1/2/2024,50 ») ;
+- le numéro de facture s'arrête où commencerait un montant ou une date ; s'il
+  est suivi d'une date, le « Date » inséré devant elle prolongeait le numéro,
+  qui n'a alors besoin que d'un caractère.
+
+Le nettoyage garde des passes séparées : chacune commence par un caractère
+fixe que le moteur recherche sans coût d'alternative, ce qui reste plus
+rapide qu'une expression combinée.
+
+`iter_normalized` traite un texte reçu par morceaux (pages, flux OCR) : le
+texte est découpé aux sauts de ligne qu'aucune correspondance ne peut
+franchir.
+"""
+import re
+
+# Caractères de contrôle supprimés (sauf \n et \r)
+CONTROL_CHARS_RE = re.compile(r'[\x00-\x09\x0b\x0c\x0e-\x1f\x7f]+')
+# Espaces multiples → une espace ; trois sauts de ligne ou plus → deux
+SPACES_RE = re.compile(r' {2,}')
+NEWLINES_RE = re.compile(r'\n{3,}')
+
+# Date qui ne chevauche pas un montant (celui-ci était marqué avant les dates)
+_DATE = r'\d{1,2}[/-]\d{1,2}[/-]\d{2,4}(?!\d*[,.]\d{2})'
+# Caractère d'un numéro de facture, hors début de montant ou de date
+_CODE = rf'(?:[A-Z-]|(?!\d+[,.]\d{{2}}|{_DATE})[0-9])'
+
+# Premier caractère : chiffre, ou f, i, n sans tenir compte de la casse (İ et ı compris)
+MARKUP_RE = re.compile(
+    r'[\dFINfinİı]'
+    r'(?:(?<=\d)(?P<amount>\d*[,.]\d{2})\s*(?:€|EUR|EURO|EUROS)?'
+    rf'|(?<=\d)(?P<date>\d?[/-]\d{{1,2}}[/-]\d{{2,4}}(?!\d*[,.]\d{{2}}))'
+    rf'|(?i:(?:(?<=f)acture|(?<=i)nvoice|(?<=n)(?:°|uméro))[\s:]*'
+    rf'(?:(?P<number>{_CODE}{{5,}})|(?P<number_before_date>{_CODE}+)(?={_DATE}))))'
+)
+
+# Fins de ligne qu'une correspondance peut prolonger sur la ligne suivante
+_AMOUNT_END_RE = re.compile(r'\d[,.]\d{2}$')
+_NUMBER_LABEL_END_RE = re.compile(r'(?i:facture|invoice|n°|numéro)$')
+
+
+def _markup(match):
+    index = match.lastindex
+    if index == 1:
+        # Montant et date : le premier chiffre précède le groupe
+        return f"→ {match.string[match.start():match.end(1)]} € ←"
+    if index == 2:
+        return f"Date: {match.string[match.start():match.end(2)]}"
+    return f"Numéro de facture: {match.group(index)}"
+
+
+def _collapse_whitespace(text):
+    return NEWLINES_RE.sub('\n\n', SPACES_RE.sub(' ', text))
+
+
+def _underline_headers(text):
+    # Lignes qui semblent être des en-têtes : entourées de sauts de ligne et soulignées
+    return '\n'.join([
+        '\n' + line + '\n' + '-' * len(line) if line.isupper() and len(line) > 5 else line
+        for line in text.split('\n')
+    ])
+
+
+def clean_text(text):
+    """
+    Retire les caractères de contrôle et réduit les espaces et sauts de ligne multiples
+
+    Returns:
+        str: Texte nettoyé, sans espaces en début ni en fin
+    """
+    if not text:
+        return ""
+    return _collapse_whitespace(CONTROL_CHARS_RE.sub('', text)).strip()
+
+
+def format_text(text):
+    """
+    Marque les montants, dates et numéros de facture et souligne les en-têtes
+
+    Returns:
+        str: Texte formaté
+    """
+    if not text:
+        return ""
+    return _underline_headers(MARKUP_RE.sub(_markup, text))
+
+
+def normalize_text(text):
+    """
+    Nettoie puis met en forme un texte extrait
+
+    Returns:
+        tuple: (texte nettoyé, texte formaté)
+    """
+    cleaned = clean_text(text)
+    return cleaned, format_text(cleaned)
+
+
+def _is_safe_cut(text, position):
+    """
+    Indique si le texte peut être découpé au saut de ligne `position`
+
+    Aucune correspondance ne franchit ce saut de ligne : il est entouré de
+    caractères visibles et ne suit ni un montant (espaces et devise
+    consommés à sa suite) ni un libellé de numéro de facture.
+    """
+    if position == 0 or position + 1 >= len(text):
+        return False
+    if text[position - 1].isspace() or text[position + 1].isspace():
+        return False
+    if _AMOUNT_END_RE.search(text, max(0, position - 4), position):
+        return False
+    end = position
+    while end and (text[end - 1] == ':' or text[end - 1].isspace()):
+        end -= 1
+    return not _NUMBER_LABEL_END_RE.search(text, max(0, end - 7), end)
+
+
+def iter_normalized(chunks):
+    """
+    Nettoie et met en forme un texte reçu par morceaux
+
+    Args:
+        chunks: Itérable de chaînes, découpées n'importe où
+
+    Yields:
+        tuple: (texte nettoyé, texte formaté) par bloc ; la concaténation des
+               blocs est égale au résultat de `normalize_text` sur le texte entier
+    """
+    buffer = ""
+    searched = 0
+    started = False
+    for chunk in chunks:
+        buffer += CONTROL_CHARS_RE.sub('', chunk)
+        if not started and buffer[:1].isspace():
+            buffer = buffer.lstrip()
+            searched = 0
+        if not buffer:
+            continue
+
+        # Dernier saut de ligne où le texte peut être découpé
+        cut = buffer.rfind('\n', searched, len(buffer) - 1)
+        while cut != -1 and not _is_safe_cut(buffer, cut):
+            cut = buffer.rfind('\n', searched, cut)
+        if cut == -1:
+            searched = max(0, len(buffer) - 1)
+            continue
+
+        block, buffer = buffer[:cut], buffer[cut + 1:]
+        searched = 0
+        cleaned = _collapse_whitespace(block)
+        separator = '\n' if started else ''
+        started = True
+        yield separator + cleaned, separator + format_text(cleaned)
+
+    cleaned = _collapse_whitespace(buffer).strip()
+    if cleaned:
+        separator = '\n' if started else ''
+        yield separator + cleaned, separator + format_text(cleaned)
+
+
+def clean_text_sequential(text):
+    """Nettoyage d'origine (trois re.sub successifs), référence des tests et benchmarks"""
+    if not text:
+        return ""
+    text = re.sub(r'[\x00-\x09\x0b\x0c\x0e-\x1f\x7f]', '', text)
+    text = re.sub(r' +', ' ', text)
+    text = re.sub(r'\n{3,}', '\n\n', text)
+    return text.strip()
+
+
+def format_text_sequential(text):
+    """Mise en forme d'origine (trois re.sub successifs), référence des tests et benchmarks"""
+    if not text:
+        return ""
+    formatted_text = re.sub(r'(\d+[,.]\d{2})\s*(€|EUR|EURO|EUROS)?', r'→ \1 € ←', text)
+    formatted_text = re.sub(r'(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})', r'Date: \1', formatted_text)
+    formatted_text = re.sub(r'(?i)(facture|invoice|n°|numéro)[\s:]*([A-Z0-9-]{5,})',
+                            r'Numéro de facture: \2', formatted_text)
+    result = []
+    for line in formatted_text.split('\n'):
+        if line.isupper() and len(line) > 5:
+            result.append('\n' + line + '\n' + '-' * len(line))
+        else:
+            result.append(line)
+    return '\n'.join(result)
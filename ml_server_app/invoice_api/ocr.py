@@ -0,0 +1,327 @@
+"""
+OCR des pages de documents scannés, réparti sur un pool de processus
+
+Deux moteurs sont disponibles (paramètre OCR_BACKEND) :
+- `tesserocr` : API C de Tesseract ; chaque processus du pool garde ses
+  modèles de langue chargés d'une image à l'autre ;
+- `pytesseract` : un processus `tesseract` par image (repli lorsque tesserocr
+  n'est pas installé ou ne peut pas charger les langues demandées).
+"""
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image
+
+from . import metrics
+from .conf import get_setting
+from .preprocessing import preprocess_image
+
+try:
+    import pytesseract
+    TESSERACT_AVAILABLE = True
+except ImportError:
+    TESSERACT_AVAILABLE = False
+
+try:
+    import tesserocr
+    TESSEROCR_AVAILABLE = True
+except ImportError:
+    TESSEROCR_AVAILABLE = False
+
+OCR_AVAILABLE = TESSERACT_AVAILABLE or TESSEROCR_AVAILABLE
+
+try:
+    from pdf2image import convert_from_path, pdfinfo_from_path
+    PDF2IMAGE_AVAILABLE = True
+except ImportError:
+    PDF2IMAGE_AVAILABLE = False
+
+class PytesseractBackend:
+    """OCR par le binaire `tesseract`, lancé pour chaque image"""
+    name = 'pytesseract'
+
+    def image_to_string(self, image, lang):
+        return pytesseract.image_to_string(image, lang=lang)
+
+
+class TesserocrBackend:
+    """
+    OCR par l'API C de Tesseract
+
+    Une instance PyTessBaseAPI est conservée par thread et par combinaison de
+    langues : les modèles ne sont chargés qu'à la première image traitée par
+    le thread. Une instance ne doit pas être partagée entre threads, l'image
+    courante étant un état de l'API (SetImage … Clear).
+    """
+    name = 'tesserocr'
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def load(self, lang):
+        """Charge (une seule fois par thread) les modèles d'une combinaison de langues"""
+        apis = getattr(self._local, 'apis', None)
+        if apis is None:
+            apis = self._local.apis = {}
+        api = apis.get(lang)
+        if api is None:
+            api = tesserocr.PyTessBaseAPI(lang=lang)
+            apis[lang] = api
+        return api
+
+    def image_to_string(self, image, lang):
+        api = self.load(lang)
+        try:
+            api.SetImage(image)
+            return api.GetUTF8Text()
+        finally:
+            api.Clear()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_ocr_backend():
+    """
+    Retourne le moteur OCR du processus courant (voir OCR_BACKEND)
+
+    En mode `auto`, tesserocr est utilisé s'il est installé et parvient à
+    charger les langues OCR_LANG ; sinon pytesseract sert de repli.
+
+    Returns:
+        PytesseractBackend | TesserocrBackend: Moteur OCR
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = _create_ocr_backend(get_setting('OCR_BACKEND'))
+        return _backend
+
+
+def _create_ocr_backend(name):
+    if name == 'pytesseract':
+        return PytesseractBackend()
+    if name == 'tesserocr':
+        backend = TesserocrBackend()
+        backend.load(get_setting('OCR_LANG'))
+        return backend
+
+    if TESSEROCR_AVAILABLE:
+        backend = TesserocrBackend()
+        try:
+            backend.load(get_setting('OCR_LANG'))
+            return backend
+        except RuntimeError:
+            # Données de langue introuvables pour tesserocr
+            pass
+    return PytesseractBackend()
+
+
+def _init_ocr_worker():
+    global _backend, _backend_lock
+    # Ne pas réutiliser un moteur hérité du processus parent par fork
+    _backend = None
+    _backend_lock = threading.Lock()
+    # Charger les modèles de langue dès le démarrage du processus du pool ; une
+    # erreur de configuration sera remontée par la première image traitée
+    try:
+        get_ocr_backend()
+    except Exception:
+        pass
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_ocr_executor():
+    """
+    Retourne le pool de processus OCR partagé par le processus courant
+
+    Returns:
+        ProcessPoolExecutor: Pool partagé, ou None si l'OCR doit rester séquentiel
+    """
+    global _executor
+    processes = get_setting('OCR_PROCESSES') or os.cpu_count() or 1
+    if processes <= 1:
+        return None
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=processes, initializer=_init_ocr_worker)
+        return _executor
+
+
+def limit_ocr_processes(processes):
+    """
+    Fixe le nombre de processus OCR du processus courant
+
+    Appelé au démarrage des processus des pools d'extraction (extraction en
+    masse, vues asynchrones) : les documents y sont déjà répartis entre
+    processus, l'OCR de chacun n'ouvre pas un pool de la taille de la machine.
+    """
+    from django.conf import ENVIRONMENT_VARIABLE, settings
+
+    if not settings.configured and not os.environ.get(ENVIRONMENT_VARIABLE):
+        settings.configure()
+    settings.OCR_PROCESSES = processes
+
+
+def _reset_ocr_executor(executor):
+    """Abandonne un pool devenu inutilisable (processus tué, par exemple)"""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def ocr_image_file(image_path, lang, document_type=None, dpi=None):
+    """
+    Applique l'OCR à une image stockée sur disque (exécuté dans un processus du pool)
+
+    Seul le chemin de l'image transite entre processus ; le processus du pool
+    la relit, la prétraite selon le profil du type de document puis la
+    transmet au moteur OCR déjà chargé.
+
+    Args:
+        image_path: Chemin de l'image
+        lang: Langues Tesseract
+        document_type: Type de document, pour le profil de prétraitement
+        dpi: Résolution de l'image si elle est connue
+
+    Returns:
+        dict: Texte reconnu et durée de l'OCR
+    """
+    start = time.perf_counter()
+    with Image.open(image_path) as image:
+        image = preprocess_image(image, document_type, dpi)
+        text = get_ocr_backend().image_to_string(image, lang)
+    return {"text": text, "seconds": round(time.perf_counter() - start, 3)}
+
+
+def iter_page_images(pdf_path, output_folder, window=None, dpi=None):
+    """
+    Rastérise un PDF par fenêtres de quelques pages
+
+    Seules les pages de la fenêtre courante sont converties (pdftoppm avec
+    `first_page`/`last_page`) ; la fenêtre suivante n'est produite que lorsque
+    le consommateur a besoin de nouvelles pages.
+
+    Args:
+        pdf_path: Chemin du fichier PDF
+        output_folder: Dossier temporaire recevant les images
+        window: Nombre de pages par fenêtre (OCR_RASTER_WINDOW par défaut)
+        dpi: Résolution de rastérisation (OCR_DPI par défaut)
+
+    Yields:
+        str: Chemin de l'image de chaque page, dans l'ordre du document
+    """
+    window = max(1, window or get_setting('OCR_RASTER_WINDOW'))
+    page_count = pdfinfo_from_path(pdf_path)["Pages"]
+
+    for first_page in range(1, page_count + 1, window):
+        last_page = min(first_page + window - 1, page_count)
+        yield from rasterize_page_range(pdf_path, output_folder, first_page, last_page, dpi)
+
+
+def rasterize_page_range(pdf_path, output_folder, first_page, last_page, dpi=None):
+    """
+    Rastérise les pages `first_page` à `last_page` (incluses) d'un PDF
+
+    Returns:
+        list: Chemins des images, dans l'ordre des pages
+    """
+    with metrics.stage('rasterize'):
+        return convert_from_path(
+            pdf_path,
+            dpi=dpi or get_setting('OCR_DPI'),
+            output_folder=output_folder,
+            first_page=first_page,
+            last_page=last_page,
+            paths_only=True,
+        )
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def ocr_page_images(image_paths, lang=None, max_in_flight=None, remove_files=False,
+                    document_type=None, dpi=None):
+    """
+    Applique l'OCR aux images des pages d'un document, en parallèle
+
+    Au plus `max_in_flight` pages du document sont soumises simultanément au
+    pool, pour qu'un document volumineux ne monopolise pas les processus au
+    détriment des autres extractions. Les chemins sont consommés au fur et à
+    mesure : avec `iter_page_images`, la rastérisation avance au rythme de l'OCR.
+
+    Args:
+        image_paths: Chemins (ou itérateur de chemins) des images des pages, dans l'ordre
+        lang: Langues Tesseract (OCR_LANG par défaut)
+        max_in_flight: Plafond de pages simultanées (OCR_MAX_PAGES_IN_FLIGHT par défaut)
+        remove_files: Supprimer chaque image dès que son OCR est terminé
+        document_type: Type de document, pour le profil de prétraitement
+        dpi: Résolution des images si elle est connue
+
+    Returns:
+        list: Un dictionnaire par page (numéro, texte, durée), dans l'ordre des pages
+    """
+    lang = lang or get_setting('OCR_LANG')
+    max_in_flight = max(1, max_in_flight or get_setting('OCR_MAX_PAGES_IN_FLIGHT'))
+    image_paths = iter(image_paths)
+    results = {}
+
+    executor = get_ocr_executor()
+    if executor is None:
+        for index, image_path in enumerate(image_paths):
+            results[index] = ocr_image_file(image_path, lang, document_type, dpi)
+            if remove_files:
+                _remove_file(image_path)
+    else:
+        pending = {}
+        next_index = 0
+        exhausted = False
+        try:
+            while not exhausted or pending:
+                while not exhausted and len(pending) < max_in_flight:
+                    image_path = next(image_paths, None)
+                    if image_path is None:
+                        exhausted = True
+                        break
+                    future = executor.submit(ocr_image_file, image_path, lang, document_type, dpi)
+                    pending[future] = (next_index, image_path)
+                    next_index += 1
+
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, image_path = pending.pop(future)
+                    results[index] = future.result()
+                    if remove_files:
+                        _remove_file(image_path)
+        except BrokenProcessPool:
+            _reset_ocr_executor(executor)
+            raise
+        finally:
+            for future in pending:
+                future.cancel()
+
+    pages = [
+        {"page": index + 1, "text": results[index]["text"], "seconds": results[index]["seconds"]}
+        for index in range(len(results))
+    ]
+    # Durée cumulée dans les processus OCR (prétraitement compris)
+    metrics.add_stage('ocr', sum(page["seconds"] for page in pages))
+    metrics.count('ocr_pages', len(pages))
+    metrics.count('ocr_characters', sum(len(page["text"]) for page in pages))
+    return pages
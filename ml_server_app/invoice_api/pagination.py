@@ -0,0 +1,23 @@
+"""
+Pagination de la liste des factures
+"""
+from rest_framework.pagination import CursorPagination
+
+from .conf import get_setting
+
+
+class InvoiceCursorPagination(CursorPagination):
+    """
+    Pagination par curseur, des factures les plus récentes aux plus anciennes
+
+    Contrairement à la pagination par page, le coût d'une page ne dépend pas
+    de sa position (pas d'OFFSET) et les ajouts concurrents ne décalent pas
+    les résultats.
+    """
+    ordering = '-id'
+    page_size_query_param = 'page_size'
+
+    def get_page_size(self, request):
+        self.page_size = get_setting('INVOICE_PAGE_SIZE')
+        self.max_page_size = get_setting('INVOICE_MAX_PAGE_SIZE')
+        return super().get_page_size(request)
@@ -0,0 +1,440 @@
+"""
+Registre des patterns regex utilisés pour l'extraction des données structurées
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+PATTERNS_FILE = os.path.join(os.path.dirname(__file__), 'regex_patterns.yaml')
+
+# Patterns utilisés lorsque le fichier YAML est absent ou invalide
+DEFAULT_PATTERNS = {
+    "invoice_patterns": [
+        r'(?i)(?:facture|invoice|n°|numéro|ref)[\s:]*([A-Z0-9-]{5,})',
+        r'(?i)(?:facture|invoice)[^\n]*?(?:n°|numéro|ref)[^\n]*?([A-Z0-9-]{5,})'
+    ],
+    "order_patterns": [
+        r'(?i)(?:commande|order|n°\s*commande|numéro\s*commande)[\s:]*([A-Z0-9-]{3,})',
+        r'(?i)(?:bon\s*de\s*commande)[^\n]*?(?:n°|numéro)[^\n]*?([A-Z0-9-]{3,})'
+    ],
+    "contract_patterns": [
+        r'(?i)(?:contrat|contract|n°\s*contrat|numéro\s*contrat)[\s:]*([A-Z0-9-]{3,})',
+    ],
+    "date_patterns": {
+        "datePiece": [
+            r'(?i)(?:date|émission|facturé le|date\s*facture)[\s:]*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
+            r'(?i)(?:date|émission)[^\n]*?(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})'
+        ],
+        "dateCommande": [
+            r'(?i)(?:date\s*commande|date\s*de\s*commande)[\s:]*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
+        ],
+        "dateLivraison": [
+            r'(?i)(?:date\s*livraison|date\s*de\s*livraison|livré\s*le)[\s:]*(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
+        ]
+    },
+    # Si aucune date spécifique n'est trouvée, utiliser la première date du document
+    "general_date_pattern": r'(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
+    "client_patterns": {
+        "societe": [
+            r'(?i)(?:client|customer|acheteur|destinataire)[\s:]*([A-Za-z0-9\s]{3,50})',
+            r'(?i)(?:facturer\s*à|facturé\s*à)[\s:]*([A-Za-z0-9\s]{3,50})'
+        ],
+        "code": [
+            r'(?i)(?:code\s*client|customer\s*code|référence\s*client)[\s:]*([A-Za-z0-9-]{2,20})'
+        ],
+        "tva": [
+            r'(?i)(?:TVA\s*client|TVA\s*intra|n°\s*TVA)[\s:]*([A-Z0-9]{2,14})'
+        ],
+        "siret": [
+            r'(?i)(?:SIRET\s*client)[\s:]*(\d{14})'
+        ],
+        "ville": [
+            r'(?i)(?:ville|city)[\s:]*([A-Za-z\s-]{2,30})',
+            r'(?i)\b([A-Z][A-Za-z\s-]{2,25})\s+\d{5}\b'
+        ],
+        "pays": [
+            r'(?i)(?:pays|country)[\s:]*([A-Za-z\s-]{3,20})'
+        ]
+    },
+    "amount_patterns": {
+        "totalTTC": [
+            r'(?i)(?:total\s*ttc|montant\s*ttc|net\s*à\s*payer|total\s*à\s*payer)[\s:]*(\d+[,.]\d{2})',
+            r'(?i)(?:ttc)[^\n]*?(\d+[,.]\d{2})\s*(?:€|EUR|EURO|EUROS)?'
+        ],
+        "totalHT": [
+            r'(?i)(?:total\s*ht|montant\s*ht|prix\s*ht)[\s:]*(\d+[,.]\d{2})',
+            r'(?i)(?:ht)[^\n]*?(\d+[,.]\d{2})\s*(?:€|EUR|EURO|EUROS)?'
+        ],
+        "totalTVA": [
+            r'(?i)(?:total\s*tva|montant\s*tva|tva)[\s:]*(\d+[,.]\d{2})',
+            r'(?i)(?:tva)[^\n]*?(\d+[,.]\d{2})\s*(?:€|EUR|EURO|EUROS)?'
+        ]
+    },
+    "product_lines_pattern": r'(?i)(?:Désignation|Article|Produit|Description).*?(?:Quantité|Qté|Qte).*?(?:Prix|Montant|Total)',
+}
+
+
+_GLOBAL_FLAGS_RE = re.compile(r'^\(\?([aiLmsux]+)\)')
+_REGEX_METACHARS = set('\\.^$*+?{}[]()|')
+_OPTIONAL_QUANTIFIERS = ('?', '*', '{')
+
+
+def _split_alternatives(pattern, start):
+    """
+    Découpe un groupe non capturant ouvert en `start` en ses alternatives de
+    premier niveau
+
+    Returns:
+        tuple: (liste des alternatives, index suivant la parenthèse fermante)
+               ou (None, None) si le groupe n'est pas fermé
+    """
+    alternatives = []
+    current = []
+    depth = 0
+    i = start
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\':
+            current.append(pattern[i:i + 2])
+            i += 2
+            continue
+        if char == '[':
+            end = i + 1
+            if end < len(pattern) and pattern[end] == '^':
+                end += 1
+            if end < len(pattern) and pattern[end] == ']':
+                end += 1
+            while end < len(pattern) and pattern[end] != ']':
+                end += 2 if pattern[end] == '\\' else 1
+            current.append(pattern[i:end + 1])
+            i = end + 1
+            continue
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            if depth == 0:
+                alternatives.append(''.join(current))
+                return alternatives, i + 1
+            depth -= 1
+        elif char == '|' and depth == 0:
+            alternatives.append(''.join(current))
+            current = []
+            i += 1
+            continue
+        current.append(char)
+        i += 1
+    return None, None
+
+
+def _leading_literal(alternative):
+    """Retourne la séquence littérale obligatoire en tête d'une alternative"""
+    literal = []
+    for char in alternative:
+        if char in _REGEX_METACHARS:
+            if char in _OPTIONAL_QUANTIFIERS and literal:
+                literal.pop()
+            break
+        literal.append(char)
+    return ''.join(literal)
+
+
+def literal_prefixes(pattern):
+    """
+    Extrait les libellés littéraux par lesquels un pattern doit commencer,
+    par exemple ['total', 'montant'] pour `(?i)(?:total ttc|montant ttc)...`
+
+    Returns:
+        tuple: (libellés, insensible à la casse) ou None si le pattern peut
+               commencer n'importe où (il sera alors recherché normalement)
+    """
+    flags = ''
+    position = 0
+    flags_match = _GLOBAL_FLAGS_RE.match(pattern)
+    if flags_match:
+        flags = flags_match.group(1)
+        position = flags_match.end()
+    if 'x' in flags or not pattern.startswith('(?:', position):
+        return None
+
+    alternatives, end = _split_alternatives(pattern, position + 3)
+    if alternatives is None or pattern[end:end + 1] in ('?', '*', '{'):
+        return None
+
+    literals = [_leading_literal(alternative) for alternative in alternatives]
+    if not all(literals):
+        return None
+    return literals, 'i' in flags
+
+
+def _has_ascii_fold(char):
+    """
+    Indique si un caractère non ASCII est équivalent, pour `re.IGNORECASE`, à un
+    caractère ASCII de minuscule différente (par exemple « ſ » et « s »)
+    """
+    if char.isascii():
+        return False
+    return any(
+        ascii_char.lower() != char
+        and re.fullmatch(re.escape(char), ascii_char, re.IGNORECASE)
+        for ascii_char in map(chr, range(128))
+    )
+
+
+class FieldScanner:
+    """
+    Résout tous les champs d'un jeu de patterns avec la même priorité que des
+    `re.search` successifs : le premier pattern qui trouve une correspondance
+    l'emporte, et sa correspondance la plus à gauche est retenue.
+
+    Plutôt que de parcourir le texte entier une fois par pattern, chaque libellé
+    littéral (« total », « facture », « date »...) est localisé une seule fois
+    pour tous les champs ; les patterns ne sont ensuite essayés qu'aux positions
+    où l'un de leurs libellés apparaît.
+    """
+
+    def __init__(self, fields):
+        """
+        Args:
+            fields: Liste ordonnée de couples (clé, liste de patterns)
+        """
+        self.fields = []
+        literal_chars = set()
+        for key, field_patterns in fields:
+            compiled = []
+            for pattern in field_patterns:
+                prefixes = literal_prefixes(pattern)
+                if prefixes is not None:
+                    literals, ignore_case = prefixes
+                    if ignore_case:
+                        literals = sorted(set(literal.lower() for literal in literals))
+                    if ignore_case and any(_has_ascii_fold(char) for char in ''.join(literals)):
+                        prefixes = None
+                    else:
+                        if ignore_case:
+                            literal_chars.update(''.join(literals))
+                        prefixes = (literals, ignore_case)
+                compiled.append((re.compile(pattern), prefixes))
+            self.fields.append((key, compiled))
+        self._literal_chars = frozenset(literal_chars)
+        self._fold_safety = {}
+
+    def _is_casefold_safe(self, text, lowered):
+        """
+        Vérifie que `str.lower()` localise au moins toutes les positions que
+        `re.IGNORECASE` accepterait (caractères comme « ſ » ou le signe Kelvin
+        sont équivalents à « s » et « k » pour le moteur regex)
+        """
+        if len(lowered) != len(text):
+            return False
+        if text.isascii():
+            return True
+        for char in set(text):
+            if char.isascii():
+                continue
+            safe = self._fold_safety.get(char)
+            if safe is None:
+                lowered_char = char.lower()
+                safe = not any(
+                    lowered_char != literal_char
+                    and re.fullmatch(re.escape(literal_char), char, re.IGNORECASE)
+                    for literal_char in self._literal_chars
+                )
+                self._fold_safety[char] = safe
+            if not safe:
+                return False
+        return True
+
+    def scan(self, text):
+        """
+        Recherche tous les champs dans le texte
+
+        Args:
+            text: Texte dans lequel chercher
+
+        Returns:
+            dict: Correspondance retenue (objet Match) ou None pour chaque clé
+        """
+        lowered = text.lower()
+        if not self._is_casefold_safe(text, lowered):
+            return self.scan_sequential(text)
+
+        occurrences = {}
+
+        def positions(literal, ignore_case):
+            key = (literal, ignore_case)
+            found = occurrences.get(key)
+            if found is None:
+                haystack = lowered if ignore_case else text
+                found = []
+                index = haystack.find(literal)
+                while index != -1:
+                    found.append(index)
+                    index = haystack.find(literal, index + 1)
+                occurrences[key] = found
+            return found
+
+        results = {}
+        for key, compiled in self.fields:
+            results[key] = None
+            for pattern, prefixes in compiled:
+                if prefixes is None:
+                    match = pattern.search(text)
+                else:
+                    literals, ignore_case = prefixes
+                    candidates = set()
+                    for literal in literals:
+                        candidates.update(positions(literal, ignore_case))
+                    match = None
+                    for position in sorted(candidates):
+                        match = pattern.match(text, position)
+                        if match:
+                            break
+                if match:
+                    results[key] = match
+                    break
+        return results
+
+    def scan_sequential(self, text):
+        """
+        Implémentation de référence : un `re.search` complet par pattern, dans
+        l'ordre de priorité
+        """
+        results = {}
+        for key, compiled in self.fields:
+            results[key] = None
+            for pattern, _ in compiled:
+                match = pattern.search(text)
+                if match:
+                    results[key] = match
+                    break
+        return results
+
+
+class CompiledPatterns:
+    """
+    Ensemble de patterns compilés, dans l'ordre de priorité du fichier source
+    """
+
+    def __init__(self, patterns, version, source):
+        self.version = version
+        self.source = source
+        self.invoice_patterns = self._compile_list(patterns.get('invoice_patterns', []))
+        self.order_patterns = self._compile_list(patterns.get('order_patterns', []))
+        self.contract_patterns = self._compile_list(patterns.get('contract_patterns', []))
+        self.date_patterns = self._compile_groups(patterns.get('date_patterns', {}))
+        self.general_date_pattern = re.compile(
+            patterns.get('general_date_pattern', DEFAULT_PATTERNS['general_date_pattern']))
+        self.client_patterns = self._compile_groups(patterns.get('client_patterns', {}))
+        self.amount_patterns = self._compile_groups(patterns.get('amount_patterns', {}))
+        self.product_lines_pattern = re.compile(
+            patterns.get('product_lines_pattern', DEFAULT_PATTERNS['product_lines_pattern']))
+        self.scanner = FieldScanner(self._scanner_fields(patterns))
+
+    @staticmethod
+    def _scanner_fields(patterns):
+        """Liste ordonnée des champs à résoudre, indexés par leur clé dans le résultat"""
+        fields = [
+            ('numeroFacture', patterns.get('invoice_patterns', []) or []),
+            ('numeroCommande', patterns.get('order_patterns', []) or []),
+            ('numeroContrat', patterns.get('contract_patterns', []) or []),
+        ]
+        for date_field, date_field_patterns in (patterns.get('date_patterns', {}) or {}).items():
+            fields.append((date_field, date_field_patterns or []))
+        for field, field_patterns in (patterns.get('client_patterns', {}) or {}).items():
+            fields.append((('client', field), field_patterns or []))
+        for amount_field, amount_field_patterns in (patterns.get('amount_patterns', {}) or {}).items():
+            fields.append((amount_field, amount_field_patterns or []))
+        return fields
+
+    @staticmethod
+    def _compile_list(patterns):
+        return [re.compile(pattern) for pattern in patterns or []]
+
+    @staticmethod
+    def _compile_groups(groups):
+        return {
+            field: CompiledPatterns._compile_list(field_patterns)
+            for field, field_patterns in (groups or {}).items()
+        }
+
+
+def load_regex_patterns(patterns_file=PATTERNS_FILE):
+    """Charge les patterns regex depuis le fichier YAML"""
+    try:
+        with open(patterns_file, 'r', encoding='utf-8') as file:
+            return yaml.safe_load(file)
+    except Exception as e:
+        logger.error("Erreur lors du chargement des patterns regex: %s", e)
+        return None
+
+
+def _file_version(patterns_file):
+    with open(patterns_file, 'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()[:16]
+
+
+class PatternRegistry:
+    """
+    Registre partagé par tous les workers d'un processus : le fichier YAML est
+    chargé et compilé une seule fois, puis rechargé uniquement si son mtime change.
+    """
+
+    def __init__(self, patterns_file=PATTERNS_FILE):
+        self.patterns_file = patterns_file
+        self._lock = threading.Lock()
+        self._compiled = None
+        self._stamp = None
+
+    def _current_stamp(self):
+        try:
+            stat = os.stat(self.patterns_file)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def get(self):
+        """
+        Retourne les patterns compilés, rechargés si le fichier a été modifié
+
+        Returns:
+            CompiledPatterns: Patterns compilés prêts à l'emploi
+        """
+        stamp = self._current_stamp()
+        compiled = self._compiled
+        if compiled is not None and stamp == self._stamp:
+            return compiled
+
+        with self._lock:
+            if self._compiled is None or stamp != self._stamp:
+                self._compiled = self._load(self._compiled)
+                self._stamp = stamp
+            return self._compiled
+
+    @property
+    def version(self):
+        """Version (empreinte SHA-256 tronquée) du jeu de patterns actif"""
+        return self.get().version
+
+    def _load(self, previous):
+        patterns = load_regex_patterns(self.patterns_file) if os.path.exists(self.patterns_file) else None
+        if patterns:
+            try:
+                return CompiledPatterns(patterns, _file_version(self.patterns_file), 'yaml')
+            except (re.error, OSError, AttributeError, TypeError) as e:
+                logger.error("Erreur lors de la compilation des patterns regex: %s", e)
+
+        # Conserver le dernier jeu valide plutôt que de revenir aux patterns par défaut
+        if previous is not None and previous.source == 'yaml':
+            return previous
+
+        logger.warning("Utilisation des patterns regex par défaut")
+        return CompiledPatterns(DEFAULT_PATTERNS, 'default', 'default')
+
+
+pattern_registry = PatternRegistry()
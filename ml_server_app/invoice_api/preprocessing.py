@@ -0,0 +1,163 @@
+"""
+Prétraitement des images avant l'OCR (OpenCV / NumPy)
+
+L'image est convertie en niveaux de gris puis traitée selon le profil de son
+type de document (paramètre OCR_PREPROCESSING_PROFILES) :
+- `target_dpi` : réduction à cette résolution lorsque celle de l'image est
+  connue (pages rastérisées d'un PDF) ;
+- `target_char_height` : sinon, réduction pour que la hauteur médiane des
+  caractères approche cette valeur en pixels (photos de téléphone) ;
+- `max_side` : plafond du plus grand côté, appliqué avant toute analyse ;
+- `deskew` : correction de l'inclinaison (au plus `max_skew` degrés) ;
+- `binarize` : `otsu` (seuil global), `adaptive` (éclairage inégal) ou None.
+
+Sans OpenCV, les images sont transmises telles quelles au moteur OCR.
+"""
+from PIL import Image
+
+from .conf import get_setting
+
+try:
+    import cv2
+    import numpy as np
+    CV2_AVAILABLE = True
+except ImportError:
+    CV2_AVAILABLE = False
+
+# Hauteurs (pixels) retenues pour estimer la taille des caractères
+MIN_COMPONENT_HEIGHT = 6
+MAX_COMPONENT_HEIGHT = 400
+
+
+def get_profile(document_type):
+    """
+    Retourne le profil de prétraitement d'un type de document
+
+    Returns:
+        dict: Options du profil, ou None si aucun prétraitement n'est prévu
+    """
+    if not CV2_AVAILABLE or not get_setting('OCR_PREPROCESSING'):
+        return None
+    return get_setting('OCR_PREPROCESSING_PROFILES').get(document_type)
+
+
+def _resize(gray, scale):
+    if scale >= 1:
+        return gray
+    height, width = gray.shape
+    size = (max(1, int(width * scale)), max(1, int(height * scale)))
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+
+
+def _binary_ink(gray):
+    """Masque des pixels d'encre (texte en blanc sur fond noir)"""
+    _, ink = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    return ink
+
+
+def estimate_char_height(gray):
+    """
+    Estime la hauteur médiane des caractères à partir des composantes connexes
+
+    Returns:
+        float: Hauteur en pixels, ou None si l'image ne contient pas de texte exploitable
+    """
+    count, _, stats, _ = cv2.connectedComponentsWithStats(_binary_ink(gray), connectivity=8)
+    heights = stats[1:count, cv2.CC_STAT_HEIGHT]
+    widths = stats[1:count, cv2.CC_STAT_WIDTH]
+    # Écarter le bruit, les traits et les cadres
+    mask = ((heights >= MIN_COMPONENT_HEIGHT) & (heights <= MAX_COMPONENT_HEIGHT)
+            & (widths <= heights * 3))
+    if np.count_nonzero(mask) < 10:
+        return None
+    return float(np.median(heights[mask]))
+
+
+def estimate_skew(gray, max_skew):
+    """
+    Estime l'inclinaison du texte par le rectangle d'aire minimale des pixels d'encre
+
+    Returns:
+        float: Angle en degrés (0 si l'estimation dépasse `max_skew`)
+    """
+    ink = _binary_ink(gray)
+    points = cv2.findNonZero(ink)
+    if points is None or len(points) < 100:
+        return 0.0
+    # Un échantillon suffit à l'estimation sur les grandes pages
+    if len(points) > 200000:
+        points = np.ascontiguousarray(points[::len(points) // 200000 + 1])
+    angle = cv2.minAreaRect(points)[-1]
+    if angle > 45:
+        angle -= 90
+    elif angle < -45:
+        angle += 90
+    return angle if abs(angle) <= max_skew else 0.0
+
+
+def _rotate(gray, angle):
+    height, width = gray.shape
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    return cv2.warpAffine(gray, matrix, (width, height), flags=cv2.INTER_LINEAR,
+                          borderMode=cv2.BORDER_CONSTANT, borderValue=255)
+
+
+def preprocess_array(gray, profile, dpi=None):
+    """
+    Applique un profil de prétraitement à une image en niveaux de gris
+
+    Args:
+        gray: Tableau NumPy (uint8, 2 dimensions)
+        profile: Options du profil (voir le docstring du module)
+        dpi: Résolution de l'image si elle est connue
+
+    Returns:
+        numpy.ndarray: Image prétraitée
+    """
+    max_side = profile.get('max_side')
+    if max_side and max(gray.shape) > max_side:
+        gray = _resize(gray, max_side / max(gray.shape))
+
+    target_dpi = profile.get('target_dpi')
+    target_char_height = profile.get('target_char_height')
+    if dpi and target_dpi:
+        gray = _resize(gray, target_dpi / dpi)
+    elif target_char_height:
+        char_height = estimate_char_height(gray)
+        if char_height:
+            gray = _resize(gray, target_char_height / char_height)
+
+    if profile.get('deskew'):
+        angle = estimate_skew(gray, profile.get('max_skew', 10))
+        if abs(angle) >= 0.1:
+            gray = _rotate(gray, angle)
+
+    binarize = profile.get('binarize')
+    if binarize == 'otsu':
+        _, gray = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    elif binarize == 'adaptive':
+        # Taille de bloc impaire, proportionnelle à la taille de l'image
+        block = max(15, (min(gray.shape) // 40) | 1)
+        gray = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                     cv2.THRESH_BINARY, block, 15)
+    return gray
+
+
+def preprocess_image(image, document_type, dpi=None):
+    """
+    Prépare une image PIL pour l'OCR selon le profil du type de document
+
+    Args:
+        image: Image PIL
+        document_type: Type de document ('image', 'pdf_scanned'...)
+        dpi: Résolution de l'image si elle est connue
+
+    Returns:
+        PIL.Image.Image: Image prétraitée (ou l'image d'origine sans profil)
+    """
+    profile = get_profile(document_type)
+    if profile is None:
+        return image
+
+    gray = np.asarray(image.convert('L'))
+    return Image.fromarray(preprocess_array(gray, profile, dpi))
@@ -0,0 +1,118 @@
+"""
+Nouvelle extraction des données structurées après une modification des patterns
+
+Chaque résultat enregistré porte la version du jeu de patterns regex qui a
+produit ses données structurées (`pattern_version`, recopiée dans la colonne
+Invoice.pattern_version). Après une modification de `regex_patterns.yaml`,
+seules les factures d'une autre version sont reprises, et seule l'étape
+`extract_structured_data` est exécutée sur le texte nettoyé déjà stocké
+(InvoiceContent.cleaned_text) : ni lecture du PDF, ni OCR, ni nouveau calcul
+de l'empreinte. Les factures sont traitées par lots (parcours par identifiant
+croissant) et enregistrées avec `Invoice.bulk_set_extracted_text` :
+
+    python manage.py restructure_invoices --batch-size 500
+"""
+import time
+
+from .extractors import TextProcessor
+from .patterns import pattern_registry
+
+
+def restructure_result(result, patterns):
+    """
+    Recalcule les données structurées d'un résultat d'extraction enregistré
+
+    Args:
+        result: Résultat reconstitué (InvoiceContent.to_result), modifié en place
+        patterns: Jeu de patterns compilés (CompiledPatterns)
+
+    Returns:
+        bool: True si les données structurées ont changé
+    """
+    structured_data = TextProcessor.extract_structured_data(result.get("cleaned_text") or "", patterns)
+    # Les valeurs localisées par la mise en page restent prioritaires
+    layout = result.get("layout")
+    if layout:
+        TextProcessor.apply_layout_fields(structured_data, layout["fields"])
+    changed = structured_data != result.get("structured_data")
+    result["structured_data"] = structured_data
+    result["pattern_version"] = patterns.version
+    return changed
+
+
+def run_restructure(batch_size=500, limit=None, progress=None, progress_interval=2.0):
+    """
+    Recalcule les données structurées des factures extraites avec d'autres patterns
+
+    Le jeu de patterns est lu une fois au début : une facture reprise porte la
+    version effectivement utilisée, et une modification du fichier pendant
+    l'exécution sera prise en compte au lancement suivant.
+
+    Args:
+        batch_size: Nombre de factures par lot (une lecture et une écriture par lot)
+        limit: Nombre maximal de factures traitées (toutes par défaut)
+        progress: Fonction appelée périodiquement avec les compteurs en cours
+        progress_interval: Intervalle (secondes) entre deux appels de `progress`
+
+    Returns:
+        dict: Compteurs (factures à reprendre, traitées, modifiées, durée, version)
+    """
+    from .models import Invoice, InvoiceContent, InvoiceFingerprint
+
+    patterns = pattern_registry.get()
+    # exclude() retient aussi les factures sans version (extraites avant le marquage)
+    stale = (Invoice.objects.filter(processed=True, content__cleaned_text__isnull=False)
+             .exclude(pattern_version=patterns.version).order_by('id'))
+    total = stale.count()
+    stats = {
+        "total": min(total, limit) if limit is not None else total,
+        "done": 0,
+        "changed": 0,
+        "seconds": 0.0,
+        "pattern_version": patterns.version,
+    }
+
+    start = time.perf_counter()
+    last_report = start
+    last_id = 0
+    while stats["done"] < stats["total"]:
+        size = min(batch_size, stats["total"] - stats["done"])
+        invoices = list(stale.filter(id__gt=last_id)[:size])
+        if not invoices:
+            break
+        last_id = invoices[-1].id
+
+        ids = [invoice.id for invoice in invoices]
+        contents = {content.invoice_id: content for content in InvoiceContent.objects.filter(invoice_id__in=ids)}
+        # Le texte nettoyé ne change pas : l'empreinte enregistrée est reprise telle quelle
+        signatures = dict(InvoiceFingerprint.objects.filter(invoice_id__in=ids)
+                          .values_list('invoice_id', 'signature'))
+        items = []
+        for invoice in invoices:
+            result = contents[invoice.id].to_result()
+            stats["changed"] += restructure_result(result, patterns)
+            signature = signatures.get(invoice.id)
+            result["fingerprint"] = bytes(signature).hex() if signature is not None else None
+            items.append((invoice, result))
+        Invoice.bulk_set_extracted_text(items, batch_size=batch_size)
+        stats["done"] += len(items)
+
+        now = time.perf_counter()
+        if progress and now - last_report >= progress_interval:
+            stats["seconds"] = now - start
+            progress(dict(stats))
+            last_report = now
+
+    stats["seconds"] = time.perf_counter() - start
+    if progress:
+        progress(dict(stats))
+    return stats
+
+
+def format_progress(stats):
+    """Met en forme les compteurs d'avancement sur une ligne"""
+    seconds = stats["seconds"] or 1e-9
+    rate = stats["done"] / seconds
+    eta = (stats["total"] - stats["done"]) / rate if rate else 0
+    return (f"{stats['done']}/{stats['total']} facture(s)  {rate:.1f} factures/s  "
+            f"modifiées {stats['changed']}  reste ~{eta:.0f} s")
@@ -0,0 +1,272 @@
+"""
+Index de recherche plein texte des factures
+
+Le texte nettoyé et les champs structurés de chaque facture sont indexés dans
+une table dédiée, créée par la migration 0008 selon la base utilisée :
+- SQLite : table virtuelle FTS5 (rowid = identifiant de la facture), classement
+  bm25 et extraits surlignés par highlight()/snippet() ;
+- PostgreSQL : colonne tsvector pondérée avec index GIN, classement
+  ts_rank_cd et extraits surlignés par ts_headline.
+
+Les extraits sont renvoyés en HTML : la base délimite les passages trouvés
+par des caractères à usage privé, le texte est ensuite échappé et ces
+délimiteurs seuls deviennent des balises <mark> (le texte d'une facture
+peut contenir du balisage).
+
+L'index est mis à jour avec la facture (voir Invoice.set_extracted_text) ; la
+suppression d'une facture retire sa ligne (déclencheur SQLite, clé étrangère
+ON DELETE CASCADE sous PostgreSQL). Sur une autre base, l'indexation est
+ignorée et la recherche n'est pas disponible.
+
+Le calcul du score est proportionnel au nombre de factures contenant les
+mots recherchés : pour un mot très fréquent, seules les SEARCH_MAX_CANDIDATES
+factures les plus récentes qui le contiennent sont classées, ce qui borne la
+durée d'une recherche quelle que soit la taille de l'index.
+"""
+import html
+import re
+
+from django.db import DatabaseError, connections
+
+from .conf import get_setting
+
+SEARCH_TABLE = 'invoice_api_invoicesearch'
+
+# Colonnes indexées, dans l'ordre de la table FTS5, et leur poids dans le classement
+SEARCH_COLUMNS = ('reference', 'client', 'amounts', 'text')
+SQLITE_WEIGHTS = (10.0, 5.0, 5.0, 1.0)
+POSTGRES_WEIGHTS = ('A', 'B', 'B', 'D')
+
+# Balises des passages surlignés, et délimiteurs posés par la base à leur place
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_END = '</mark>'
+_START_SENTINEL = '\ue000'
+_END_SENTINEL = '\ue001'
+SNIPPET_TOKENS = 16
+
+_TERM_RE = re.compile(r'\S+')
+
+# Disponibilité de l'index par base : (alias, nom de la base) → bool
+_available = {}
+
+
+def search_document(invoice, cleaned_text):
+    """
+    Textes indexés d'une facture
+
+    Args:
+        invoice: Facture dont les colonnes structurées sont renseignées
+        cleaned_text: Texte nettoyé de la facture
+
+    Returns:
+        dict: Texte de chaque colonne de l'index (voir SEARCH_COLUMNS)
+    """
+    def join(*values):
+        return ' '.join(str(value) for value in values if value not in (None, ''))
+
+    return {
+        'reference': join(invoice.numero_facture, invoice.numero_commande, invoice.numero_contrat),
+        'client': join(invoice.client_societe, invoice.client_code, invoice.client_siret,
+                       invoice.client_tva, invoice.client_ville, invoice.client_pays),
+        'amounts': join(invoice.total_ttc, invoice.total_ht, invoice.total_tva),
+        'text': cleaned_text or '',
+    }
+
+
+def is_available(using='default'):
+    """
+    Indique si l'index de recherche existe dans la base
+
+    Returns:
+        bool: True si la table de l'index a été créée par la migration
+    """
+    connection = connections[using]
+    key = (using, connection.settings_dict['NAME'])
+    if key not in _available:
+        _available[key] = (
+            connection.vendor in ('sqlite', 'postgresql')
+            and SEARCH_TABLE in connection.introspection.table_names()
+        )
+    return _available[key]
+
+
+def reset_availability(**kwargs):
+    """Oublie la disponibilité de l'index après les migrations (signal post_migrate)"""
+    _available.clear()
+
+
+def index_invoices(items, using='default'):
+    """
+    Ajoute ou remplace les factures dans l'index de recherche
+
+    Args:
+        items: Liste de couples (facture, texte nettoyé)
+        using: Alias de la base de données
+    """
+    if not items or not is_available(using):
+        return
+    connection = connections[using]
+    rows = [(invoice.pk, search_document(invoice, cleaned_text)) for invoice, cleaned_text in items]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            _index_sqlite(cursor, rows)
+        else:
+            _index_postgres(cursor, rows)
+
+
+def _index_sqlite(cursor, rows):
+    cursor.executemany(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [(pk,) for pk, _ in rows])
+    cursor.executemany(
+        f'INSERT INTO {SEARCH_TABLE} (rowid, {", ".join(SEARCH_COLUMNS)}) '
+        f'VALUES (%s, {", ".join(["%s"] * len(SEARCH_COLUMNS))})',
+        [(pk, *(document[column] for column in SEARCH_COLUMNS)) for pk, document in rows],
+    )
+
+
+def _index_postgres(cursor, rows):
+    config = get_setting('SEARCH_TEXT_CONFIG')
+    vectors = ' || '.join(
+        f"setweight(to_tsvector(%s::regconfig, %s), '{weight}')"
+        for weight in POSTGRES_WEIGHTS
+    )
+    cursor.executemany(
+        f'INSERT INTO {SEARCH_TABLE} (invoice_id, document) VALUES (%s, {vectors}) '
+        f'ON CONFLICT (invoice_id) DO UPDATE SET document = EXCLUDED.document',
+        [(pk, *(value for column in SEARCH_COLUMNS for value in (config, document[column])))
+         for pk, document in rows],
+    )
+
+
+def fts5_query(query):
+    """
+    Traduit une saisie libre en requête FTS5
+
+    Chaque mot devient une expression entre guillemets (la syntaxe FTS5 de la
+    saisie n'est pas interprétée) ; un mot terminé par * est recherché comme
+    préfixe ("livr*").
+
+    Returns:
+        str: Requête FTS5, ou chaîne vide si la saisie ne contient aucun mot
+    """
+    terms = []
+    for term in _TERM_RE.findall(query):
+        prefix = len(term) > 1 and term.endswith('*')
+        term = '"' + term.rstrip('*').replace('"', '""') + '"'
+        terms.append(term + ' *' if prefix else term)
+    return ' '.join(terms)
+
+
+def _highlight_html(value):
+    """Échappe un extrait et remplace les délimiteurs des passages trouvés par <mark>"""
+    return (html.escape(value)
+            .replace(_START_SENTINEL, HIGHLIGHT_START)
+            .replace(_END_SENTINEL, HIGHLIGHT_END))
+
+
+def search_invoices(query, limit, using='default'):
+    """
+    Recherche des factures dans l'index plein texte
+
+    Args:
+        query: Saisie libre (mots, référence, montant...)
+        limit: Nombre maximal de résultats
+        using: Alias de la base de données
+
+    Returns:
+        list: Résultats par pertinence décroissante : {"id", "score", "highlights"},
+              highlights contenant les colonnes où la recherche a trouvé un mot
+    """
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            rows = _search_sqlite(cursor, query, limit)
+        else:
+            rows = _search_postgres(cursor, query, limit)
+
+    results = []
+    for pk, score, *highlighted in rows:
+        results.append({
+            'id': pk,
+            'score': round(score, 6),
+            'highlights': {
+                column: _highlight_html(value) for column, value in zip(SEARCH_COLUMNS, highlighted)
+                if value and _START_SENTINEL in value
+            },
+        })
+    return results
+
+
+def _search_sqlite(cursor, query, limit):
+    match = fts5_query(query)
+    if not match:
+        return []
+    markers = f"'{_START_SENTINEL}', '{_END_SENTINEL}'"
+    columns = [f'highlight({SEARCH_TABLE}, {index}, {markers})' for index in range(len(SEARCH_COLUMNS) - 1)]
+    columns.append(f"snippet({SEARCH_TABLE}, {len(SEARCH_COLUMNS) - 1}, {markers}, '…', {SNIPPET_TOKENS})")
+    weights = ', '.join(str(weight) for weight in SQLITE_WEIGHTS)
+    try:
+        # Plus petit identifiant parmi les candidats les plus récents (parcours
+        # de l'index par rowid décroissant, sans calcul de score)
+        first_id = 0
+        max_candidates = get_setting('SEARCH_MAX_CANDIDATES')
+        if max_candidates:
+            cursor.execute(
+                f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s '
+                f'ORDER BY rowid DESC LIMIT 1 OFFSET %s',
+                [match, max_candidates - 1],
+            )
+            row = cursor.fetchone()
+            first_id = row[0] if row else 0
+        cursor.execute(
+            f'SELECT rowid, -bm25({SEARCH_TABLE}, {weights}) AS score, {", ".join(columns)} '
+            f'FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s AND rowid >= %s '
+            f'ORDER BY score DESC LIMIT %s',
+            [match, first_id, limit],
+        )
+    except DatabaseError:
+        # Mot réduit à de la ponctuation par le tokenizer ("*", "-")
+        return []
+    return cursor.fetchall()
+
+
+def _search_postgres(cursor, query, limit):
+    config = get_setting('SEARCH_TEXT_CONFIG')
+    options = (f'StartSel={_START_SENTINEL}, StopSel={_END_SENTINEL}, '
+               f'MaxWords={SNIPPET_TOKENS}, MinWords=4')
+    # Le classement porte sur l'index seul (candidats les plus récents) ; les
+    # extraits ne sont calculés que pour les résultats retenus
+    cursor.execute(
+        f"""
+        WITH query AS (SELECT websearch_to_tsquery(%s::regconfig, %s) AS q),
+        candidates AS (
+            SELECT search.invoice_id, search.document
+            FROM {SEARCH_TABLE} search, query
+            WHERE search.document @@ query.q
+            ORDER BY search.invoice_id DESC
+            LIMIT %s
+        ),
+        ranked AS (
+            SELECT candidates.invoice_id, ts_rank_cd(candidates.document, query.q) AS score
+            FROM candidates, query
+            ORDER BY score DESC
+            LIMIT %s
+        )
+        SELECT ranked.invoice_id, ranked.score,
+               ts_headline(%s::regconfig, concat_ws(' ', invoice.numero_facture, invoice.numero_commande,
+                                                    invoice.numero_contrat), query.q, %s),
+               ts_headline(%s::regconfig, concat_ws(' ', invoice.client_societe, invoice.client_code,
+                                                    invoice.client_siret, invoice.client_tva,
+                                                    invoice.client_ville, invoice.client_pays),
+                           query.q, %s),
+               ts_headline(%s::regconfig, concat_ws(' ', invoice.total_ttc, invoice.total_ht,
+                                                    invoice.total_tva), query.q, %s),
+               ts_headline(%s::regconfig, coalesce(content.cleaned_text, ''), query.q, %s)
+        FROM ranked
+        CROSS JOIN query
+        JOIN invoice_api_invoice invoice ON invoice.id = ranked.invoice_id
+        LEFT JOIN invoice_api_invoicecontent content ON content.invoice_id = ranked.invoice_id
+        ORDER BY ranked.score DESC
+        """,
+        [config, query, get_setting('SEARCH_MAX_CANDIDATES'), limit] + [config, options] * len(SEARCH_COLUMNS),
+    )
+    return cursor.fetchall()
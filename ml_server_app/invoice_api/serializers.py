@@ -1,17 +1,32 @@
 from rest_framework import serializers
-from .models import Invoice
+from .models import Invoice, ExtractionBatch, ExtractionJob
 
-class InvoiceSerializer(serializers.ModelSerializer):
+class DynamicFieldsMixin:
+    """
+    Restreint les champs sérialisés à ceux passés dans l'argument `fields`
+    (les noms inconnus sont ignorés)
+    """
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class InvoiceSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     extracted_content = serializers.SerializerMethodField()
     formatted_text_url = serializers.SerializerMethodField()
     html_formatted_text_url = serializers.SerializerMethodField()
     
     class Meta:
         model = Invoice
-        fields = ['id', 'file', 'uploaded_at', 'processed', 'extracted_content', 
-                 'formatted_text_url', 'html_formatted_text_url']
-        read_only_fields = ['uploaded_at', 'processed', 'extracted_content', 
-                           'formatted_text_url', 'html_formatted_text_url']
+        fields = ['id', 'file', 'uploaded_at', 'processed', 'numero_facture', 'date_piece',
+                 'total_ttc', 'duplicate_of', 'extracted_content', 'formatted_text_url',
+                 'html_formatted_text_url']
+        read_only_fields = ['uploaded_at', 'processed', 'numero_facture', 'date_piece',
+                           'total_ttc', 'duplicate_of', 'extracted_content', 'formatted_text_url',
+                           'html_formatted_text_url']
     
     def get_extracted_content(self, obj):
         """
@@ -53,4 +68,45 @@ class InvoiceSerializer(serializers.ModelSerializer):
         request = self.context.get('request')
         if request and obj.processed:
             return request.build_absolute_uri(obj.get_html_formatted_text_url())
-        return None
\ No newline at end of file
+        return None
+
+
+class InvoiceSummarySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    """
+    Représentation allégée pour les listes : colonnes structurées uniquement,
+    sans le contenu extrait ni les URLs
+    """
+    class Meta:
+        model = Invoice
+        fields = ['id', 'file', 'uploaded_at', 'processed', 'numero_facture', 'numero_commande',
+                  'date_piece', 'total_ttc', 'client_societe', 'document_type', 'duplicate_of']
+        read_only_fields = fields
+
+
+class ExtractionJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ExtractionJob
+        fields = ['id', 'invoice', 'status', 'attempts', 'max_attempts', 'error',
+                  'created_at', 'started_at', 'finished_at']
+        read_only_fields = fields
+
+
+class ExtractionBatchSerializer(serializers.ModelSerializer):
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ExtractionBatch
+        fields = ['id', 'created_at', 'progress', 'skipped', 'invoices']
+        read_only_fields = fields
+
+    def get_progress(self, obj):
+        """
+        Récupère l'avancement des extractions du lot
+
+        Args:
+            obj: Instance du modèle ExtractionBatch
+
+        Returns:
+            dict: Nombre de factures et de tâches par statut
+        """
+        return obj.get_progress()
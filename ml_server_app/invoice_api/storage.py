@@ -0,0 +1,231 @@
+"""
+Accès au contenu des documents, quel que soit le stockage des fichiers
+
+Les extracteurs reçoivent un StoredDocument plutôt qu'un chemin sous
+MEDIA_ROOT : le fichier peut se trouver dans n'importe quel stockage Django
+(STORAGES["default"] : disque local, S3 ou service compatible comme MinIO...).
+Le contenu n'est lu qu'une fois, à la première utilisation, puis partagé par
+l'empreinte SHA-256, l'identification du type, PyPDF2 et l'OCR :
+- un fichier local est projeté en mémoire (mmap) : pas de copie en mémoire du
+  processus, les pages lues sont celles du cache du système ;
+- un fichier distant est téléchargé une fois ; il n'est écrit dans un fichier
+  temporaire que si un outil externe en a besoin (pdftoppm, processus OCR).
+"""
+import contextlib
+import hashlib
+import mmap
+import os
+import tempfile
+from io import BytesIO
+
+# Signatures en tête de fichier : (préfixe, type, extension, type MIME)
+SIGNATURES = (
+    (b'%PDF-', 'pdf', '.pdf', 'application/pdf'),
+    (b'\x89PNG\r\n\x1a\n', 'image', '.png', 'image/png'),
+    (b'\xff\xd8\xff', 'image', '.jpg', 'image/jpeg'),
+    (b'II*\x00', 'image', '.tiff', 'image/tiff'),
+    (b'MM\x00*', 'image', '.tiff', 'image/tiff'),
+    (b'BM', 'image', '.bmp', 'image/bmp'),
+    (b'PK\x03\x04', 'zip', '.zip', 'application/zip'),
+    (b'PK\x05\x06', 'zip', '.zip', 'application/zip'),
+)
+
+# Les lecteurs PDF acceptent l'en-tête %PDF- dans les premiers 1024 octets
+PDF_HEADER_WINDOW = 1024
+
+
+def sniff_file_type(header, complete=False):
+    """
+    Identifie le type d'un fichier d'après ses premiers octets
+
+    Args:
+        header: Début du fichier
+        complete: True si `header` contient tout le fichier
+
+    Returns:
+        tuple: (type, extension, type MIME) ; None si le type n'est pas
+               reconnu ; False s'il faut davantage d'octets pour conclure
+    """
+    for prefix, kind, extension, mime_type in SIGNATURES:
+        if header.startswith(prefix):
+            return kind, extension, mime_type
+    if b'%PDF-' in header[:PDF_HEADER_WINDOW]:
+        return SIGNATURES[0][1:]
+    if len(header) < PDF_HEADER_WINDOW and not complete:
+        return False
+    return None
+
+
+def storage_path(name, storage):
+    """
+    Chemin local d'un fichier d'un stockage Django
+
+    Returns:
+        str: Chemin du fichier, ou None si le stockage n'est pas un disque
+             local (S3, mémoire... : `path()` n'y désigne pas un fichier lisible)
+    """
+    from django.core.files.storage import FileSystemStorage
+
+    if isinstance(storage, FileSystemStorage):
+        return storage.path(name)
+    return None
+
+
+class StoredDocument:
+    """
+    Contenu d'un document, chargé à la demande
+
+    S'utilise comme gestionnaire de contexte : la projection en mémoire et le
+    fichier temporaire éventuel sont libérés à la sortie.
+    """
+
+    def __init__(self, name, path=None, storage=None, data=None):
+        self.name = name
+        self.path = path
+        self.storage = storage
+        self._buffer = data
+        self._mapped = None
+        self._spooled = None
+
+    @classmethod
+    def from_path(cls, path):
+        """Document stocké dans un fichier local"""
+        path = os.fspath(path)
+        return cls(path, path=path)
+
+    @classmethod
+    def from_storage(cls, name, storage=None):
+        """
+        Document enregistré dans un stockage Django
+
+        Args:
+            name: Nom du fichier dans le stockage (FieldFile.name)
+            storage: Stockage Django (default_storage par défaut)
+        """
+        if storage is None:
+            from django.core.files.storage import default_storage
+            storage = default_storage
+        return cls(name, path=storage_path(name, storage), storage=storage)
+
+    @classmethod
+    def from_field(cls, field_file):
+        """Document d'un champ FileField (invoice.file)"""
+        return cls.from_storage(field_file.name, field_file.storage)
+
+    @property
+    def extension(self):
+        return os.path.splitext(self.name)[1].lower()
+
+    def exists(self):
+        if self.path is not None:
+            return os.path.exists(self.path)
+        return self.storage.exists(self.name)
+
+    @property
+    def buffer(self):
+        """Contenu du fichier (mmap en lecture seule, ou bytes)"""
+        if self._buffer is None:
+            if self.path is not None:
+                self._buffer = self._map(self.path)
+            else:
+                with self.storage.open(self.name, 'rb') as file:
+                    self._buffer = file.read()
+        return self._buffer
+
+    def _map(self, path):
+        with open(path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                return b''
+            # La projection reste valide après la fermeture du fichier
+            self._mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._mapped
+
+    @property
+    def size(self):
+        return len(self.buffer)
+
+    def header(self, size):
+        """Premiers octets du fichier"""
+        return bytes(self.buffer[:size])
+
+    def sha256(self):
+        """Empreinte SHA-256 du contenu (hexadécimale)"""
+        return hashlib.sha256(self.buffer).hexdigest()
+
+    def sniff(self):
+        """
+        Type réel du document d'après sa signature
+
+        Returns:
+            tuple: (type, extension, type MIME), ou None si le type n'est pas reconnu
+        """
+        return sniff_file_type(self.header(PDF_HEADER_WINDOW), complete=True)
+
+    def stream(self):
+        """
+        Flux binaire positionné au début du contenu, sans copie (PdfReader)
+
+        Returns:
+            mmap | BytesIO: Objet fichier en lecture
+        """
+        buffer = self.buffer
+        if isinstance(buffer, mmap.mmap):
+            buffer.seek(0)
+            return buffer
+        return BytesIO(buffer)
+
+    def local_path(self):
+        """
+        Chemin local du fichier, pour les outils qui lisent un fichier
+        (pdftoppm, processus OCR) ; un document distant est écrit une fois dans
+        un fichier temporaire, supprimé à la fermeture du document
+
+        Returns:
+            str: Chemin du fichier
+        """
+        if self.path is not None:
+            return self.path
+        if self._spooled is None:
+            fd, self._spooled = tempfile.mkstemp(suffix=self.extension)
+            with os.fdopen(fd, 'wb') as file:
+                file.write(self.buffer)
+        return self._spooled
+
+    def close(self):
+        if self._mapped is not None:
+            self._mapped.close()
+            self._mapped = None
+            self._buffer = None
+        if self._spooled is not None:
+            try:
+                os.remove(self._spooled)
+            except OSError:
+                pass
+            self._spooled = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __repr__(self):
+        return f"StoredDocument({self.name!r})"
+
+
+@contextlib.contextmanager
+def open_document(source):
+    """
+    Ouvre un document à partir d'un chemin local, ou réutilise un StoredDocument
+
+    Un StoredDocument reçu tel quel reste ouvert à la sortie : il appartient à
+    l'appelant.
+
+    Yields:
+        StoredDocument: Document à lire
+    """
+    if isinstance(source, StoredDocument):
+        yield source
+        return
+    with StoredDocument.from_path(source) as document:
+        yield document
@@ -0,0 +1,175 @@
+"""
+Conversion entre le résultat d'une extraction et son stockage en base
+
+Les données structurées sont recopiées dans des colonnes typées et indexées
+du modèle Invoice (pour les filtres SQL), les textes volumineux et le reste du
+résultat dans la table InvoiceContent, chargée uniquement à la demande.
+"""
+import hashlib
+import json
+import re
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+# Textes stockés dans des colonnes dédiées de InvoiceContent
+TEXT_KEYS = ('text', 'cleaned_text', 'formatted_text')
+
+# Champs de `structured_data` recopiés tels quels : (clé, colonne, longueur maximale)
+STRING_FIELDS = (
+    ('numeroFacture', 'numero_facture', 100),
+    ('numeroCommande', 'numero_commande', 100),
+    ('numeroContrat', 'numero_contrat', 100),
+)
+CLIENT_FIELDS = (
+    ('societe', 'client_societe', 255),
+    ('code', 'client_code', 50),
+    ('tva', 'client_tva', 32),
+    ('siret', 'client_siret', 32),
+    ('ville', 'client_ville', 100),
+    ('pays', 'client_pays', 100),
+)
+DATE_FIELDS = (
+    ('datePiece', 'date_piece'),
+    ('dateCommande', 'date_commande'),
+    ('dateLivraison', 'date_livraison'),
+)
+AMOUNT_FIELDS = (
+    ('totalTTC', 'total_ttc'),
+    ('totalHT', 'total_ht'),
+    ('totalTVA', 'total_tva'),
+)
+METADATA_FIELDS = (
+    ('extraction_method', 'extraction_method', 32),
+    ('document_type', 'document_type', 32),
+)
+
+STRUCTURED_COLUMNS = tuple(
+    [column for _, column, _ in STRING_FIELDS + CLIENT_FIELDS + METADATA_FIELDS]
+    + [column for _, column in DATE_FIELDS + AMOUNT_FIELDS]
+)
+
+_DATE_RE = re.compile(r'^(\d{1,2})[/.-](\d{1,2})[/.-](\d{2}|\d{4})$')
+# Forme ISO (AAAA-MM-JJ), acceptée par la recherche par mise en page (voir layout.py)
+_ISO_DATE_RE = re.compile(r'^(\d{4})-(\d{2})-(\d{2})$')
+_AMOUNT_QUANTUM = Decimal('0.01')
+_MAX_AMOUNT = Decimal('999999999999.99')
+
+
+def parse_date(value):
+    """
+    Convertit une date extraite (JJ/MM/AAAA, JJ-MM-AA, JJ.MM.AAAA... ou AAAA-MM-JJ) en date
+
+    Returns:
+        date: Date correspondante, ou None si la valeur n'est pas une date valide
+    """
+    if not value:
+        return None
+    value = value.strip()
+    match = _ISO_DATE_RE.match(value)
+    if match:
+        year, month, day = (int(part) for part in match.groups())
+        try:
+            return date(year, month, day)
+        except ValueError:
+            return None
+    match = _DATE_RE.match(value)
+    if not match:
+        return None
+    day, month, year = (int(part) for part in match.groups())
+    if len(match.group(3)) == 2:
+        # Même convention que strptime('%y') : 69-99 → 19xx, 00-68 → 20xx
+        year += 1900 if year >= 69 else 2000
+    try:
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+
+def parse_amount(value):
+    """
+    Convertit un montant extrait ("1234.56" ou "1234,56") en Decimal
+
+    Returns:
+        Decimal: Montant arrondi au centime, ou None si la valeur est invalide
+    """
+    if not value:
+        return None
+    try:
+        amount = Decimal(str(value).replace(',', '.')).quantize(_AMOUNT_QUANTUM)
+    except (InvalidOperation, ValueError):
+        return None
+    if not amount.is_finite() or abs(amount) > _MAX_AMOUNT:
+        return None
+    return amount
+
+
+def _truncate(value, max_length):
+    if value is None:
+        return None
+    return str(value)[:max_length]
+
+
+def structured_columns(result):
+    """
+    Calcule les valeurs des colonnes structurées d'Invoice pour un résultat
+
+    Args:
+        result: Dictionnaire renvoyé par TextExtractor.extract_from_file
+
+    Returns:
+        dict: Valeur de chaque colonne de STRUCTURED_COLUMNS
+    """
+    result = result or {}
+    structured = result.get('structured_data') or {}
+    client = structured.get('client') or {}
+
+    columns = {}
+    for key, column, max_length in STRING_FIELDS:
+        columns[column] = _truncate(structured.get(key), max_length)
+    for key, column, max_length in CLIENT_FIELDS:
+        columns[column] = _truncate(client.get(key), max_length)
+    for key, column in DATE_FIELDS:
+        columns[column] = parse_date(structured.get(key))
+    for key, column in AMOUNT_FIELDS:
+        columns[column] = parse_amount(structured.get(key))
+    for key, column, max_length in METADATA_FIELDS:
+        columns[column] = _truncate(result.get(key), max_length)
+    return columns
+
+
+def split_result(result):
+    """
+    Sépare un résultat d'extraction en colonnes de textes et données annexes
+
+    Returns:
+        dict: Valeurs des champs de InvoiceContent (text, cleaned_text,
+              formatted_text et data)
+    """
+    result = dict(result or {})
+    content = {key: result.pop(key, None) for key in TEXT_KEYS}
+    content['data'] = result
+    return content
+
+
+def join_result(text, cleaned_text, formatted_text, data):
+    """
+    Reconstitue le dictionnaire d'origine à partir des champs de InvoiceContent
+    """
+    result = dict(data or {})
+    for key, value in zip(TEXT_KEYS, (text, cleaned_text, formatted_text)):
+        if value is not None:
+            result[key] = value
+    return result
+
+
+def result_etag(result):
+    """
+    Empreinte d'un résultat d'extraction, utilisée comme ETag de ses rendus
+
+    Returns:
+        str: Empreinte, ou chaîne vide pour une extraction en erreur (rien à rendre)
+    """
+    if not result or "error" in result:
+        return ""
+    payload = json.dumps(result, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
@@ -1,3 +1,935 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import json
+import mmap
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import zipfile
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from . import ocr
+from .bulk import run_bulk_extraction
+from .extractors import TextExtractor, TextProcessor
+from .jobs import run_worker
+from .line_items import parse_line_items
+from .models import ExtractionJob, Invoice, InvoiceFingerprint
+from .normalizer import clean_text_sequential, format_text_sequential, iter_normalized, normalize_text
+from .patterns import (DEFAULT_PATTERNS, FieldScanner, PatternRegistry, literal_prefixes, load_regex_patterns,
+                       pattern_registry)
+from .restructure import run_restructure
+from .storage import StoredDocument
+
+SAMPLE_INVOICES = [
+    """SOCIETE EXEMPLE SAS
+12 rue des Lilas 75011 Paris
+FACTURE N° FA-2024-00123   Date: 12/03/2024
+Client: Dupont et Fils  Code client: C0042
+N° TVA FR12345678901  SIRET 12345678901234
+Commande n° CMD-7781 du 02/03/2024
+Désignation Qté Prix unitaire Total
+Ramette papier A4 10 x 4,50 EUR HT 45,00
+Stylos bleus 20 u 0,80 EUR HT 16,00
+Total HT 61,00
+TVA 20% 12,20
+Total TTC 73,20 €
+Pays: France""",
+    """Invoice number INV-99812
+Order date 01.02.2023 purchase order PO-5521
+Bill to: ACME Corporation Ltd
+Delivery date 03/02/2023
+Subtotal 1234.56 VAT amount 246.91
+Grand total 1481.47 USD""",
+    "Reçu Uber\nMontant dû 23,40 €\nEmis le 05-06-2024 à LYON 69003",
+    "",
+    "aucun champ reconnaissable ici",
+]
+
+# Vocabulaire utilisé pour générer des textes aléatoires proches de vraies factures
+FUZZ_TOKENS = [
+    "Facture", "FACTURE", "N°", "n°", "numéro", "Ref", "Invoice", "#", "№", "ID",
+    "Date", "date", "12/03/2024", "1-2-24", "05.06.2024", "émission", "Commande",
+    "order", "PO", "Contrat", "contract", "Client", "client:", "Code", "TVA", "VAT",
+    "SIRET", "12345678901234", "Total", "total", "TTC", "HT", "ht", "123,45",
+    "9.99", "EUR", "€", "Paris", "75011", "Ville", "Pays", "France", "ſiret",
+    "K", "İ", "\n", ":", "-", "FA-2024-001", "x", "10",
+]
+
+
+def reference_extract_fields(text, patterns):
+    """Implémentation d'origine : un re.search par pattern, dans l'ordre du YAML"""
+    fields = {}
+    groups = [
+        ("numeroFacture", patterns.get("invoice_patterns", [])),
+        ("numeroCommande", patterns.get("order_patterns", [])),
+        ("numeroContrat", patterns.get("contract_patterns", [])),
+    ]
+    groups += list(patterns.get("date_patterns", {}).items())
+    groups += [(("client", field), field_patterns)
+               for field, field_patterns in patterns.get("client_patterns", {}).items()]
+    groups += list(patterns.get("amount_patterns", {}).items())
+    for key, key_patterns in groups:
+        fields[key] = None
+        for pattern in key_patterns:
+            match = re.search(pattern, text)
+            if match:
+                fields[key] = (match.span(), match.group(1))
+                break
+    return fields
+
+
+def fuzz_corpus(seed=1234, count=400):
+    rnd = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        tokens = [rnd.choice(FUZZ_TOKENS) for _ in range(rnd.randint(1, 80))]
+        separators = [rnd.choice([" ", "", "  ", "\n", ": "]) for _ in tokens]
+        corpus.append("".join(token + sep for token, sep in zip(tokens, separators)))
+    return corpus
+
+
+class FieldScannerTests(SimpleTestCase):
+    def test_literal_prefixes(self):
+        self.assertEqual(
+            literal_prefixes(r'(?i)(?:fact\.?|fac\.?)[\s:]*([A-Z0-9-]{5,})'),
+            (['fact', 'fac'], True),
+        )
+        self.assertEqual(literal_prefixes(r'(?i)(?:n°s?\s*de)[\s:]*(\d+)'), (['n°'], True))
+        self.assertIsNone(literal_prefixes(r'(?i)\b([A-Z][A-Za-z\s-]{2,25})\s+\d{5}\b'))
+        self.assertIsNone(literal_prefixes(r'(\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4})'))
+
+    def test_scan_matches_sequential_search(self):
+        for patterns in (load_regex_patterns(), DEFAULT_PATTERNS):
+            scanner = FieldScanner(
+                [("numeroFacture", patterns["invoice_patterns"])]
+                + list(patterns["date_patterns"].items())
+                + list(patterns["amount_patterns"].items())
+            )
+            for text in SAMPLE_INVOICES + fuzz_corpus():
+                fast = scanner.scan(text)
+                slow = scanner.scan_sequential(text)
+                for key in slow:
+                    expected = slow[key] and (slow[key].span(), slow[key].group(1))
+                    found = fast[key] and (fast[key].span(), fast[key].group(1))
+                    self.assertEqual(found, expected, (key, text))
+
+    def test_structured_data_matches_reference_implementation(self):
+        patterns = load_regex_patterns()
+        for text in SAMPLE_INVOICES + fuzz_corpus(seed=99):
+            data = TextProcessor.extract_structured_data(text)
+            reference = reference_extract_fields(text, patterns)
+            for key, expected in reference.items():
+                value = data["client"][key[1]] if isinstance(key, tuple) else data[key]
+                if expected is None:
+                    if key == "datePiece" and value is not None:
+                        # Repli sur la première date du document
+                        continue
+                    self.assertIsNone(value, (key, text))
+                elif key in patterns["amount_patterns"]:
+                    self.assertEqual(value, expected[1].replace(',', '.'), (key, text))
+                else:
+                    self.assertEqual(value, expected[1].strip(), (key, text))
+
+
+class PatternRegistryTests(SimpleTestCase):
+    def setUp(self):
+        work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work_dir)
+        self.patterns_file = os.path.join(work_dir, 'regex_patterns.yaml')
+        self.patterns = load_regex_patterns(pattern_registry.patterns_file)
+        self.mtime_ns = 1_700_000_000 * 10**9
+
+    def write(self, content):
+        with open(self.patterns_file, 'w', encoding='utf-8') as file:
+            file.write(content if isinstance(content, str) else json.dumps(content))
+        # Horodatage distinct à chaque écriture (résolution du système de fichiers)
+        self.mtime_ns += 10**9
+        os.utime(self.patterns_file, ns=(self.mtime_ns, self.mtime_ns))
+
+    def test_modified_file_is_reloaded(self):
+        self.write(self.patterns)
+        registry = PatternRegistry(self.patterns_file)
+        first = registry.get()
+        self.assertIs(registry.get(), first)
+        self.assertEqual(first.source, 'yaml')
+
+        self.write(dict(self.patterns, invoice_patterns=[r'FACTURE\s+N°\s+(FA-\d{4})']))
+        second = registry.get()
+        self.assertIsNot(second, first)
+        self.assertNotEqual(second.version, first.version)
+        self.assertEqual(TextProcessor.extract_structured_data(SAMPLE_INVOICES[0], second)['numeroFacture'],
+                         'FA-2024')
+
+    def test_broken_file_keeps_the_last_valid_patterns(self):
+        self.write(self.patterns)
+        registry = PatternRegistry(self.patterns_file)
+        valid = registry.get()
+
+        self.write("invoice_patterns: [non fermé\n")
+        with self.assertLogs('invoice_api.patterns', 'ERROR'):
+            self.assertIs(registry.get(), valid)
+        self.write(dict(self.patterns, invoice_patterns=['(groupe non fermé']))
+        with self.assertLogs('invoice_api.patterns', 'ERROR'):
+            self.assertIs(registry.get(), valid)
+
+        # Sans jeu valide antérieur : patterns par défaut
+        with self.assertLogs('invoice_api.patterns', 'WARNING'):
+            fallback = PatternRegistry(self.patterns_file).get()
+        self.assertEqual((fallback.source, fallback.version), ('default', 'default'))
+
+
+class PdfExtractionTests(SimpleTestCase):
+    @override_settings(OCR_PROCESSES=1, OCR_RASTER_WINDOW=4, OCR_MIN_PAGE_CHARS=20)
+    def test_only_thin_pages_are_ocred(self):
+        page_texts = ["Facture FA-2024-001 du 12/03/2024", "", "Annexe 1",
+                      "Total TTC 73,20 EUR, merci de votre confiance"]
+        reader = mock.Mock(pages=[mock.Mock(**{'extract_text.return_value': text})
+                                  for text in page_texts])
+
+        def rasterize(pdf_path, output_folder, first_page, last_page, dpi=None):
+            return [f"page-{number}.png" for number in range(first_page, last_page + 1)]
+
+        def ocr(image_path, lang, document_type=None, dpi=None):
+            return {"text": f"Texte scanné de la {image_path}\n", "seconds": 0.5}
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            pdf_path = os.path.join(temp_dir, 'mixte.pdf')
+            with open(pdf_path, 'wb') as file:
+                file.write(b'%PDF-1.4')
+            with mock.patch('invoice_api.extractors.PdfReader', return_value=reader), \
+                    mock.patch('invoice_api.extractors.rasterize_page_range',
+                               side_effect=rasterize) as rasterize_mock, \
+                    mock.patch('invoice_api.ocr.ocr_image_file', side_effect=ocr):
+                result = TextExtractor.extract_from_pdf(pdf_path)
+
+        rasterize_mock.assert_called_once_with(pdf_path, mock.ANY, 2, 3)
+        self.assertEqual(result['document_type'], 'pdf_mixed')
+        self.assertEqual([page['method'] for page in result['pages']],
+                         ['text_extraction', 'ocr', 'ocr', 'text_extraction'])
+        self.assertEqual(result['text'].splitlines(), [
+            page_texts[0], "Texte scanné de la page-2.png", "Texte scanné de la page-3.png",
+            page_texts[3],
+        ])
+
+
+    def test_layout_mode_reads_values_next_to_their_labels(self):
+        from benchmarks.corpus import make_layout_pdf
+        from .text_utils import create_invoice_html
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            pdf_path = make_layout_pdf(os.path.join(temp_dir, 'facture.pdf'), pages=2, lines_per_page=5)
+            flat = TextExtractor.extract_from_file(pdf_path)
+            with override_settings(PDF_LAYOUT_EXTRACTION=True):
+                result = TextExtractor.extract_from_file(pdf_path)
+
+        # Même texte : les libellés des totaux y précèdent toutes les valeurs
+        self.assertEqual(result['text'], flat['text'])
+        self.assertNotIn('layout', flat)
+        self.assertEqual((flat['structured_data']['totalHT'], flat['structured_data']['totalTTC']),
+                         (None, '92.50'))
+        data = result['structured_data']
+        self.assertEqual(
+            (data['numeroFacture'], data['datePiece'], data['totalHT'], data['totalTVA'], data['totalTTC']),
+            ('FA-2024-00001', '12/03/2024', '92.50', '18.50', '111.00'))
+
+        layout = result['layout']
+        self.assertEqual([page['page'] for page in layout['pages']], [1, 2])
+        self.assertIn({'text': 'Facture N°', 'box': [360.0, 34.8, 45.0, 9.0]}, layout['pages'][0]['runs'])
+        total = layout['fields']['totalTTC']
+        self.assertEqual((total['page'], total['value']), (2, '111,00'))
+        # Valeur sous son libellé, dans la même colonne
+        self.assertEqual(total['value_box'][0], total['label_box'][0])
+        self.assertGreater(total['value_box'][1], total['label_box'][1])
+        self.assertIn('<span class="run value" title="totalTTC"', create_invoice_html(result))
+
+
+class LineItemsTests(SimpleTestCase):
+    TABLE = (
+        "FACTURE N° FA-2024-00001\n"
+        "Référence Désignation Quantité P.U. HT Remise Montant HT TVA\n"
+        "REF-001 Câble HDMI 2m 3 12,50 € 5% 35,63 € 20%\n"
+        "REF-002 Lot de 2 adaptateurs 1 1.234,56 1.234,56 20%\n"
+        "Livraison offerte\n"
+        "Sous-total 1270,19\n"
+        "Page 2\n"
+        "Désignation Qté Prix unitaire Total HT\n"
+        "Clavier total confort 2 14,90 29,80\n"
+        "Total TTC 1560,00 €\n"
+        "Conditions 3 10,00 30,00\n"
+    )
+
+    def test_columns_follow_the_table_header(self):
+        articles = TextProcessor.extract_structured_data(self.TABLE)['articles']
+        self.assertEqual([(a['nom'], a['quantite'], a['prixHT'], a['remise'], a['totalHT']) for a in articles], [
+            ('REF-001 Câble HDMI 2m', '3', '12.50', '5%', '35.63'),
+            # Remise absente : la colonne facultative est ignorée
+            ('REF-002 Lot de 2 adaptateurs', '1', '1234.56', None, '1234.56'),
+            # Désignation contenant « total » : la ligne reste dans le tableau
+            ('Clavier total confort', '2', '14.90', None, '29.80'),
+        ])
+
+    def test_large_tables_are_parsed_line_by_line(self):
+        rows = "\n".join(f"Article {n} 2 1,50 3,00" for n in range(10000))
+        text = f"Désignation Qté Prix Total\n{rows}\nTotal 30000,00"
+        articles = parse_line_items(text, pattern_registry.get().product_lines_pattern)
+        self.assertEqual(len(articles), 10000)
+        self.assertEqual(articles[-1], {'nom': 'Article 9999', 'quantite': '2', 'prixHT': '1.50',
+                                        'remise': None, 'totalHT': '3.00', 'totalTTC': None})
+
+
+class NormalizerTests(SimpleTestCase):
+    # Bruit ajouté au corpus : caractères de contrôle, espaces, montants et dates accolés
+    NOISE = ["\x00", "\t", "\x0c", "\x7f", "\r", "\xa0", "   ", "\n\n\n\n", "12345,50", "1/2/2024,50",
+             "EUROS", "EURO", "FA-12-03-2024", "ABCDE", "ı", "  \n "]
+
+    def corpus(self, seed):
+        rnd = random.Random(seed)
+        texts = SAMPLE_INVOICES + fuzz_corpus(seed=seed)
+        for text in fuzz_corpus(seed=seed + 1):
+            pieces = [rnd.choice(self.NOISE) if rnd.random() < 0.3 else piece for piece in text.split(" ")]
+            texts.append(" ".join(pieces))
+        return texts
+
+    def test_single_pass_matches_sequential_passes(self):
+        for text in self.corpus(seed=21):
+            cleaned = clean_text_sequential(text)
+            self.assertEqual(normalize_text(text), (cleaned, format_text_sequential(cleaned)), text)
+            self.assertEqual(TextProcessor.format_invoice_text(text), format_text_sequential(text), text)
+
+    def test_chunked_input_gives_the_same_text(self):
+        rnd = random.Random(5)
+        for text in self.corpus(seed=34):
+            cleaned = clean_text_sequential(text)
+            expected = (cleaned, format_text_sequential(cleaned))
+            cuts = sorted(rnd.sample(range(len(text) + 1), min(len(text) + 1, rnd.randint(0, 10))))
+            splits = [
+                # Découpage quelconque, caractère par caractère, puis à chaque saut de ligne
+                [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])],
+                list(text),
+                text.splitlines(keepends=True),
+            ]
+            for chunks in splits:
+                blocks = list(iter_normalized(chunks))
+                self.assertEqual(("".join(b[0] for b in blocks), "".join(b[1] for b in blocks)),
+                                 expected, chunks)
+
+
+class OcrBackendTests(SimpleTestCase):
+    def test_tesserocr_keeps_one_api_per_language(self):
+        fake_tesserocr = mock.Mock()
+        with mock.patch.object(ocr, 'tesserocr', fake_tesserocr, create=True), \
+                mock.patch.object(ocr, 'TESSEROCR_AVAILABLE', True):
+            backend = ocr._create_ocr_backend('auto')
+            self.assertIsInstance(backend, ocr.TesserocrBackend)
+            for _ in range(3):
+                backend.image_to_string(mock.Mock(), 'fra+eng')
+            self.assertEqual(fake_tesserocr.PyTessBaseAPI.call_count, 1)
+
+            # Chaque thread dispose de sa propre API (SetImage … Clear)
+            worker = threading.Thread(target=backend.image_to_string, args=(mock.Mock(), 'fra+eng'))
+            worker.start()
+            worker.join()
+            self.assertEqual(fake_tesserocr.PyTessBaseAPI.call_count, 2)
+            backend.image_to_string(mock.Mock(), 'fra+eng')
+            self.assertEqual(fake_tesserocr.PyTessBaseAPI.call_count, 2)
+
+            # Langues introuvables : repli sur pytesseract
+            fake_tesserocr.PyTessBaseAPI.side_effect = RuntimeError('Failed to init API')
+            self.assertIsInstance(ocr._create_ocr_backend('auto'), ocr.PytesseractBackend)
+
+
+class PreprocessingTests(SimpleTestCase):
+    def test_photo_is_downscaled_deskewed_and_binarized(self):
+        from benchmarks.corpus import invoice_lines, render_page
+        from .preprocessing import estimate_char_height, estimate_skew, preprocess_image
+        import numpy as np
+
+        photo = render_page(invoice_lines(1), dpi=600).rotate(4, fillcolor=255)
+        self.assertGreater(estimate_char_height(np.asarray(photo)), 34)
+
+        result = np.asarray(preprocess_image(photo, 'image'))
+        self.assertLess(result.shape[0], photo.height)
+        self.assertLessEqual(estimate_char_height(result), 34)
+        self.assertLess(abs(estimate_skew(result, 10)), 1)
+        self.assertEqual(set(np.unique(result)) - {0, 255}, set())
+        # Type de document sans profil : image inchangée
+        self.assertIs(preprocess_image(photo, 'inconnu'), photo)
+
+
+class MetricsTests(SimpleTestCase):
+    def test_extraction_stages_are_recorded_and_exposed(self):
+        from django.conf import settings
+        metrics_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, metrics_dir, ignore_errors=True)
+        pdf_path = os.path.join(settings.BASE_DIR, 'media', 'invoices', 'Receipt_Uber.pdf')
+
+        with override_settings(METRICS_DIR=metrics_dir):
+            result = TextExtractor.extract_from_file(pdf_path)
+            exposition = APIClient().get('/api/metrics/').content.decode()
+
+        self.assertEqual(result['document_type'], 'pdf_text')
+        stages = result['metrics']['stages']
+        for stage in ('pdf_parse', 'pdf_text', 'normalize_text', 'structured_data', 'total'):
+            self.assertIn(stage, stages)
+        self.assertEqual(result['metrics']['counters']['pages'], result['page_count'])
+        self.assertEqual(result['metrics']['counters']['bytes'], os.path.getsize(pdf_path))
+        self.assertIn('invoice_extraction_stage_seconds_bucket{stage="pdf_parse",le="+Inf"}', exposition)
+        self.assertIn('invoice_extractions_total{document_type="pdf_text",outcome="ok"}', exposition)
+        self.assertTrue(any(name.startswith('metrics-') for name in os.listdir(metrics_dir)))
+
+    def test_dead_worker_snapshots_are_consolidated(self):
+        from . import metrics
+        metrics_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, metrics_dir, ignore_errors=True)
+        # PID d'un processus terminé
+        child = subprocess.Popen([sys.executable, '-c', 'pass'])
+        child.wait()
+
+        def write(pid, started, hits):
+            with open(os.path.join(metrics_dir, f'metrics-{pid}-{started}.json'), 'w') as file:
+                json.dump({'counters': {'cache_hits': hits}}, file)
+
+        write(child.pid, 1, 3)
+        # Ancien processus dont le PID a été réutilisé par le processus courant
+        write(os.getpid(), 1, 2)
+        write(os.getppid(), 5, 4)
+        own_hits = metrics.registry.snapshot()['counters'].get('cache_hits', 0)
+
+        with override_settings(METRICS_DIR=metrics_dir):
+            for _ in range(2):
+                self.assertEqual(metrics.collect()['counters']['cache_hits'], own_hits + 9)
+        self.assertEqual(sorted(os.listdir(metrics_dir)), sorted([
+            metrics.CONSOLIDATED_NAME, 'metrics-consolidate.lock', f'metrics-{os.getppid()}-5.json']))
+
+    def test_counter_increments_are_written_in_batches(self):
+        from . import metrics
+        metrics_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, metrics_dir, ignore_errors=True)
+
+        with override_settings(METRICS_DIR=metrics_dir, METRICS_SNAPSHOT_INTERVAL=60):
+            path = metrics._snapshot_path()
+            for _ in range(3):
+                metrics.increment('cache_hits')
+            timer = metrics._flush_timer
+            self.addCleanup(timer.cancel)
+            self.assertFalse(os.path.exists(path))
+        # Écriture différée, en une fois
+        timer.cancel()
+        metrics._flush(path)
+        with open(path) as file:
+            self.assertEqual(json.load(file)['counters']['cache_hits'],
+                             metrics.registry.snapshot()['counters']['cache_hits'])
+
+
+class ExtractionJobTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            EXTRACTION_CACHE_DIR=os.path.join(self.media_root, 'cache'),
+            METRICS_DIR=os.path.join(self.media_root, 'metrics'),
+            EXTRACTION_JOB_RETRY_DELAY=0,
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        self.client = APIClient()
+
+    def upload(self, name='facture.pdf', content=b'%PDF-1.4 Facture FA-2024-001'):
+        return self.client.post('/api/invoices/', {'file': SimpleUploadedFile(name, content)},
+                                format='multipart')
+
+    def test_upload_is_queued_and_processed_by_worker(self):
+        response = self.upload()
+        self.assertEqual(response.status_code, 202)
+        invoice_id = response.data['invoice']['id']
+        self.assertEqual(response.data['job']['status'], ExtractionJob.STATUS_QUEUED)
+
+        with mock.patch('invoice_api.cache.TextExtractor.extract_from_file',
+                        return_value={'error': 'Document illisible'}):
+            self.assertEqual(run_worker('test', max_jobs=10), 1)
+
+        status_response = self.client.get(f'/api/invoices/{invoice_id}/status/')
+        self.assertEqual(status_response.status_code, 200)
+        # Erreur d'extraction : échec définitif, sans nouvel essai
+        self.assertEqual(status_response.data['job']['status'], ExtractionJob.STATUS_FAILED)
+        self.assertEqual(status_response.data['job']['attempts'], 1)
+        self.assertTrue(status_response.data['invoice']['processed'])
+
+    def test_unexpected_errors_are_retried(self):
+        response = self.upload(name='facture.pdf')
+        job = ExtractionJob.objects.get(id=response.data['job']['id'])
+
+        with mock.patch('invoice_api.cache.TextExtractor.extract_from_file',
+                        side_effect=[RuntimeError('boom'), {'text': 'Facture'}]):
+            run_worker('test', max_jobs=10)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExtractionJob.STATUS_DONE)
+        self.assertEqual(job.attempts, 2)
+
+    def test_zip_batch_is_queued_with_progress(self):
+        archive = BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zip_file:
+            zip_file.writestr('lot/facture-1.pdf', b'%PDF-1.4 un')
+            zip_file.writestr('lot/facture-2.PDF', b'%PDF-1.4 deux')
+            zip_file.writestr('lot/notes.txt', b'ignore')
+            zip_file.writestr('__MACOSX/lot/._facture-1.pdf', b'ignore')
+        upload = SimpleUploadedFile('lot.zip', archive.getvalue())
+
+        response = self.client.post('/api/invoices/batch/', {'files': [upload]}, format='multipart')
+        self.assertEqual(response.status_code, 202)
+        batch = response.data['batch']
+        self.assertEqual(batch['progress']['total'], 2)
+        self.assertEqual(batch['progress']['queued'], 2)
+        self.assertEqual(len(batch['skipped']), 2)
+
+        with mock.patch('invoice_api.cache.TextExtractor.extract_from_file',
+                        side_effect=[{'text': 'un'}, {'text': 'deux'}]):
+            run_worker('test', max_jobs=10)
+
+        progress = self.client.get(response.data['status_url']).data['progress']
+        self.assertEqual(progress['done'], 2)
+        self.assertTrue(progress['finished'])
+
+        invalid = SimpleUploadedFile('invalide.zip', b'pas une archive')
+        response = self.client.post('/api/invoices/batch/', {'files': [invalid]}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+
+    def test_zip_members_are_inspected_and_deduplicated(self):
+        existing = self.upload(name='facture.pdf', content=b'%PDF-1.4 existante')
+        archive = BytesIO()
+        with zipfile.ZipFile(archive, 'w') as zip_file:
+            zip_file.writestr('nouvelle.pdf', b'%PDF-1.4 nouvelle')
+            zip_file.writestr('copie.pdf', b'%PDF-1.4 nouvelle')
+            zip_file.writestr('ancienne.pdf', b'%PDF-1.4 existante')
+            zip_file.writestr('script.pdf', b'<script>alert(1)</script>')
+            zip_file.writestr('enorme.pdf', b'%PDF-1.4 ' + b'0' * 2000)
+        upload = SimpleUploadedFile('lot.zip', archive.getvalue())
+
+        with override_settings(UPLOAD_MAX_FILE_BYTES=1000):
+            response = self.client.post('/api/invoices/batch/', {'files': [upload]}, format='multipart')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['batch']['progress']['total'], 1)
+        skipped = {item['name']: item['reason'] for item in response.data['batch']['skipped']}
+        self.assertEqual(set(skipped), {'copie.pdf', 'ancienne.pdf', 'script.pdf', 'enorme.pdf'})
+        self.assertIn(str(existing.data['invoice']['id']), skipped['ancienne.pdf'])
+        self.assertIn('nouvelle.pdf', skipped['copie.pdf'])
+        self.assertEqual(Invoice.objects.count(), 2)
+        # Seuls les fichiers des deux factures restent dans le stockage
+        self.assertEqual(len(os.listdir(os.path.join(self.media_root, 'invoices'))), 2)
+
+    def test_identical_upload_is_deduplicated_then_served_from_cache(self):
+        content = b'%PDF-1.4 facture identique'
+        first = self.upload(name='facture.pdf', content=content)
+        with mock.patch('invoice_api.cache.TextExtractor.extract_from_file',
+                        return_value={'text': 'Facture FA-2024-001'}) as extract:
+            run_worker('test', max_jobs=10)
+            duplicate = self.upload(name='copie.pdf', content=content)
+            # Facture supprimée : un nouvel envoi est enregistré mais servi par le cache
+            Invoice.objects.filter(id=first.data['invoice']['id']).delete()
+            response = self.upload(name='copie.pdf', content=content)
+
+        self.assertEqual(duplicate.status_code, 200)
+        self.assertTrue(duplicate.data['duplicate'])
+        self.assertEqual(duplicate.data['invoice']['id'], first.data['invoice']['id'])
+        self.assertEqual(Invoice.objects.count(), 1)
+
+        self.assertEqual(extract.call_count, 1)
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.data['cached'])
+        self.assertEqual(response.data['invoice']['extracted_content']['text'], 'Facture FA-2024-001')
+
+    def test_cached_upload_reports_a_finished_extraction(self):
+        content = b'%PDF-1.4 facture en cache'
+        first = self.upload(name='facture.pdf', content=content)
+        with mock.patch('invoice_api.cache.TextExtractor.extract_from_file',
+                        return_value={'text': 'Facture FA-2024-001'}):
+            run_worker('test', max_jobs=10)
+        Invoice.objects.filter(id=first.data['invoice']['id']).delete()
+
+        # Servie par le cache, puis doublon de celle-ci : aucune tâche d'extraction
+        cached = self.upload(name='copie.pdf', content=content)
+        duplicate = self.upload(name='autre.pdf', content=content)
+        self.assertEqual(cached.status_code, 201)
+        self.assertEqual(duplicate.data['invoice']['id'], cached.data['invoice']['id'])
+        self.assertFalse(ExtractionJob.objects.filter(invoice_id=cached.data['invoice']['id']).exists())
+
+        response = self.client.get(f"/api/invoices/{cached.data['invoice']['id']}/status/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['job']['status'], ExtractionJob.STATUS_DONE)
+        self.assertEqual(response.data['invoice']['extracted_content']['text'], 'Facture FA-2024-001')
+
+        # Facture non traitée et sans tâche : rien à suivre
+        invoice = Invoice.objects.create(file='invoices/facture.pdf')
+        self.assertEqual(self.client.get(f'/api/invoices/{invoice.id}/status/').status_code, 404)
+
+    def test_uploads_are_inspected_while_received(self):
+        response = self.upload(name='facture.pdf', content=b'pas un document' * 100)
+        self.assertEqual(response.status_code, 415)
+
+        with override_settings(UPLOAD_MAX_FILE_BYTES=1000):
+            response = self.upload(content=b'%PDF-1.4 ' + b'0' * 2000)
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(Invoice.objects.count(), 0)
+        self.assertEqual(os.listdir(self.media_root), [])
+
+        # Image PNG envoyée avec une extension .pdf : l'extension suit le contenu
+        png = b'\x89PNG\r\n\x1a\n' + b'\0' * 100
+        response = self.upload(name='scan.pdf', content=png)
+        self.assertEqual(response.status_code, 202)
+        invoice = Invoice.objects.get(id=response.data['invoice']['id'])
+        self.assertTrue(invoice.file.name.endswith('.png'))
+        self.assertEqual(invoice.sha256, hashlib.sha256(png).hexdigest())
+
+    async def test_async_endpoints_await_extraction(self):
+        content = b'%PDF-1.4 facture asynchrone'
+        with self.settings(ASYNC_EXTRACTION_PROCESSES=0), \
+                mock.patch('invoice_api.cache.TextExtractor.extract_from_file',
+                           return_value={'text': 'Facture FA-2024-001'}) as extract:
+            response = await self.async_client.post(
+                '/api/async/invoices/', {'file': SimpleUploadedFile('facture.pdf', content)})
+            self.assertEqual(response.status_code, 201)
+            invoice_id = response.json()['invoice']['id']
+            self.assertEqual(response.json()['invoice']['extracted_content']['text'], 'Facture FA-2024-001')
+
+            response = await self.async_client.get(f'/api/async/invoices/{invoice_id}/extract/?refresh=1')
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(response.json()['cached'])
+            self.assertEqual(extract.call_count, 2)
+
+            with self.settings(ASYNC_EXTRACTION_MAX_PENDING=0):
+                response = await self.async_client.get(f'/api/async/invoices/{invoice_id}/extract/')
+            self.assertEqual(response.status_code, 503)
+
+        response = await self.async_client.get(f'/api/async/invoices/{invoice_id}/formatted_text/?format=html')
+        self.assertEqual(response.status_code, 200)
+        response = await self.async_client.get(f'/api/async/invoices/{invoice_id}/formatted_text/?format=html',
+                                               headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+        response = await self.async_client.post(
+            '/api/async/invoices/', {'file': SimpleUploadedFile('facture.pdf', b'pas un document')})
+        self.assertEqual(response.status_code, 415)
+
+    async def test_failed_async_upload_keeps_nothing(self):
+        content = b'%PDF-1.4 facture en erreur'
+        with self.settings(ASYNC_EXTRACTION_PROCESSES=0), \
+                mock.patch('invoice_api.async_views.run_extraction', side_effect=RuntimeError('boom')):
+            response = await self.async_client.post(
+                '/api/async/invoices/', {'file': SimpleUploadedFile('facture.pdf', content)})
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(await Invoice.objects.acount(), 0)
+        self.assertEqual(os.listdir(os.path.join(self.media_root, 'invoices')), [])
+
+        # Nouvel envoi : extrait normalement, et non servi comme doublon
+        with self.settings(ASYNC_EXTRACTION_PROCESSES=0), \
+                mock.patch('invoice_api.cache.TextExtractor.extract_from_file',
+                           return_value={'text': 'Facture FA-2024-001'}):
+            response = await self.async_client.post(
+                '/api/async/invoices/', {'file': SimpleUploadedFile('facture.pdf', content)})
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('duplicate', response.json())
+
+    def test_invoices_are_extracted_from_any_storage(self):
+        source = os.path.join(os.path.dirname(__file__), '..', 'media', 'invoices', 'Receipt_Uber.pdf')
+        with open(source, 'rb') as file:
+            content = file.read()
+
+        # Fichier local : contenu projeté en mémoire, partagé par l'empreinte et PyPDF2
+        with StoredDocument.from_path(source) as document:
+            self.assertEqual(document.sha256(), hashlib.sha256(content).hexdigest())
+            self.assertEqual(document.sniff()[0], 'pdf')
+            self.assertIsInstance(document.stream(), mmap.mmap)
+            self.assertEqual(document.local_path(), source)
+
+        # Stockage sans chemin local (comme S3) : ni MEDIA_ROOT ni fichier sur disque
+        storages = {
+            'default': {'BACKEND': 'django.core.files.storage.InMemoryStorage'},
+            'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+        }
+        with override_settings(STORAGES=storages):
+            response = self.upload(name='recu.pdf', content=content)
+            self.assertEqual(response.status_code, 202)
+            invoice_id = response.data['invoice']['id']
+            self.assertEqual(run_worker('test', max_jobs=10), 1)
+            response = self.client.get(f'/api/invoices/{invoice_id}/extract/', {'refresh': '1'})
+
+            invoice = Invoice.objects.get(id=invoice_id)
+            with StoredDocument.from_field(invoice.file) as document:
+                self.assertIsNone(document.path)
+                spooled = document.local_path()
+                with open(spooled, 'rb') as file:
+                    self.assertEqual(file.read(), content)
+            self.assertFalse(os.path.exists(spooled))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.data['cached'])
+        extracted = invoice.get_extracted_text()
+        self.assertEqual(extracted['document_type'], 'pdf_text')
+        self.assertIn('Uber', extracted['text'])
+        self.assertNotIn('invoices', os.listdir(self.media_root))
+
+    def test_bulk_extraction_resumes_and_updates_invoices(self):
+        invoice_dir = os.path.join(self.media_root, 'invoices')
+        os.makedirs(invoice_dir)
+        source = os.path.join(os.path.dirname(__file__), '..', 'media', 'invoices', 'Receipt_Uber.pdf')
+        for name in ('recu-1.pdf', 'recu-2.pdf'):
+            shutil.copy(source, os.path.join(invoice_dir, name))
+        invoice = Invoice.objects.create(file='invoices/recu-2.pdf')
+
+        # Sortie interrompue : recu-1.pdf déjà traité, dernière ligne incomplète
+        output = os.path.join(self.media_root, 'bulk.jsonl')
+        done = json.dumps({'path': os.path.join(invoice_dir, 'recu-1.pdf'), 'status': 'ok', 'result': {}})
+        with open(output, 'w', encoding='utf-8') as file:
+            file.write(done + '\n{"path": "/tronqu')
+
+        stats = run_bulk_extraction([invoice_dir], output, processes=1, resume=True,
+                                    update_invoices=True)
+        self.assertEqual((stats['done'], stats['skipped'], stats['invoices_updated']), (1, 1, 1))
+
+        with open(output, 'r', encoding='utf-8') as file:
+            records = [json.loads(line) for line in file]
+        self.assertEqual([record['path'] for record in records],
+                         [os.path.join(invoice_dir, name) for name in ('recu-1.pdf', 'recu-2.pdf')])
+
+        invoice.refresh_from_db()
+        self.assertTrue(invoice.processed)
+        self.assertEqual(invoice.get_extracted_text()['text'], records[1]['result']['text'])
+
+
+class AsyncExtractionPoolTests(SimpleTestCase):
+    def test_extraction_runs_in_spawned_pool_with_ocr_limit(self):
+        from . import async_views
+        from .conf import get_setting
+
+        # Les processus du pool lisent les settings du projet (MEDIA_ROOT par défaut)
+        with override_settings(ASYNC_EXTRACTION_PROCESSES=1):
+            executor = async_views.get_extraction_executor()
+            self.addCleanup(async_views._reset_extraction_executor, executor)
+            self.assertEqual(executor.submit(get_setting, 'OCR_PROCESSES').result(timeout=60), 1)
+            result, cached = asyncio.run(
+                async_views.run_extraction('invoices/Receipt_Uber.pdf', refresh=True))
+
+        self.assertFalse(cached)
+        self.assertEqual(result['document_type'], 'pdf_text')
+        self.assertIn('Uber', result['text'])
+
+
+class InvoiceStructuredFieldsTests(TestCase):
+    def create_invoice(self, text):
+        invoice = Invoice.objects.create(file='invoices/facture.pdf')
+        result = {
+            'text': text,
+            'extraction_method': 'direct',
+            'structured_data': TextProcessor.extract_structured_data(text),
+        }
+        invoice.set_extracted_text(result)
+        return invoice, result
+
+    def test_extracted_text_round_trip_and_columns(self):
+        invoice, result = self.create_invoice(SAMPLE_INVOICES[0])
+        invoice = Invoice.objects.get(pk=invoice.pk)
+
+        self.assertEqual(invoice.get_extracted_text(), result)
+        self.assertEqual(invoice.numero_facture, 'FA-2024-00123')
+        self.assertEqual(str(invoice.date_piece), '2024-03-12')
+        self.assertEqual(str(invoice.total_ttc), '73.20')
+        self.assertIsNone(Invoice.objects.create(file='invoices/vide.pdf').get_extracted_text())
+
+    def test_iso_dates_found_by_layout_are_indexed(self):
+        from .structured_fields import parse_date
+
+        self.assertEqual(str(parse_date('2024-03-15')), '2024-03-15')
+        self.assertEqual(str(parse_date('15/03/24')), '2024-03-15')
+        self.assertIsNone(parse_date('2024-02-30'))
+
+        invoice = Invoice.objects.create(file='invoices/facture.pdf')
+        invoice.set_extracted_text({'text': 'Date 2024-03-15', 'structured_data': {'datePiece': '2024-03-15'}})
+        invoice.refresh_from_db()
+        self.assertEqual(str(invoice.date_piece), '2024-03-15')
+
+    def test_formatted_text_is_rendered_once_and_revalidated(self):
+        invoice, result = self.create_invoice(SAMPLE_INVOICES[0])
+        client = APIClient()
+        url = f'/api/invoices/{invoice.id}/formatted_text/?format=html'
+
+        with mock.patch('invoice_api.models.create_invoice_html', return_value='<html></html>') as render:
+            first = client.get(url)
+            second = client.get(url)
+            not_modified = client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+
+        # Une nouvelle extraction invalide le rendu et l'ETag
+        invoice.set_extracted_text(dict(result, text='Autre texte'))
+        changed = client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], first['ETag'])
+
+        json_response = client.get(f'/api/invoices/{invoice.id}/formatted_text/')
+        self.assertEqual(json_response.json()['structured_data']['numeroFacture'], 'FA-2024-00123')
+
+    def test_list_filters_on_structured_columns(self):
+        invoice, _ = self.create_invoice(SAMPLE_INVOICES[0])
+        self.create_invoice(SAMPLE_INVOICES[1])
+        client = APIClient()
+
+        response = client.get('/api/invoices/', {'numero_facture': 'FA-2024-00123'})
+        self.assertEqual([item['id'] for item in response.data['results']], [invoice.id])
+        response = client.get('/api/invoices/', {'date_from': '2024-01-01', 'date_to': '2024-12-31'})
+        self.assertEqual([item['id'] for item in response.data['results']], [invoice.id])
+        self.assertEqual(client.get('/api/invoices/', {'date_from': '12/03/2024'}).status_code, 400)
+
+        response = client.get('/api/invoices/', {'total_min': str(invoice.total_ttc),
+                                                  'total_max': str(invoice.total_ttc)})
+        self.assertEqual([item['id'] for item in response.data['results']], [invoice.id])
+        for value in ('abc', 'NaN', '1e20'):
+            response = client.get('/api/invoices/', {'total_min': value})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.data['status'], 'error')
+
+    def test_list_is_paginated_and_summary_skips_content(self):
+        invoices = [self.create_invoice(text)[0] for text in SAMPLE_INVOICES[:3]]
+        client = APIClient()
+
+        response = client.get('/api/invoices/', {'view': 'summary', 'page_size': 2})
+        self.assertEqual([item['id'] for item in response.data['results']],
+                         [invoices[2].id, invoices[1].id])
+        self.assertNotIn('extracted_content', response.data['results'][0])
+        self.assertEqual(response.data['results'][1]['numero_facture'], invoices[1].numero_facture)
+        next_page = client.get(response.data['next'])
+        self.assertEqual([item['id'] for item in next_page.data['results']], [invoices[0].id])
+
+        response = client.get('/api/invoices/', {'fields': 'id,total_ttc'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'total_ttc'})
+
+    def test_search_ranks_and_highlights_indexed_invoices(self):
+        invoices = []
+        for text in SAMPLE_INVOICES[:3]:
+            invoice = Invoice.objects.create(file='invoices/facture.pdf')
+            invoice.set_extracted_text(TextProcessor.process_extracted_text(
+                {'text': text, 'extraction_method': 'direct'}))
+            invoices.append(invoice)
+        client = APIClient()
+
+        # Référence, montant (séparateur décimal indifférent) et préfixe
+        response = client.get('/api/invoices/search/', {'q': 'FA-2024-00123'})
+        self.assertEqual([item['invoice']['id'] for item in response.data['results']], [invoices[0].id])
+        self.assertIn('<mark>FA-2024-00123</mark>', response.data['results'][0]['highlights']['reference'])
+        response = client.get('/api/invoices/search/', {'q': '73,20'})
+        self.assertEqual([item['invoice']['id'] for item in response.data['results']], [invoices[0].id])
+        response = client.get('/api/invoices/search/', {'q': 'ramette pap*'})
+        self.assertIn('<mark>Ramette</mark> <mark>papier</mark>',
+                      response.data['results'][0]['highlights']['text'])
+
+        # Le numéro de facture pèse plus qu'une mention dans le texte
+        response = client.get('/api/invoices/search/', {'q': 'invoice'})
+        self.assertEqual(response.data['results'][0]['invoice']['id'], invoices[1].id)
+
+        # Nouvelle extraction et suppression mettent l'index à jour
+        invoices[2].set_extracted_text(TextProcessor.process_extracted_text(
+            {'text': 'Reçu Taxi\nMontant dû 12,00 €', 'extraction_method': 'direct'}))
+        self.assertEqual(client.get('/api/invoices/search/', {'q': 'uber'}).data['count'], 0)
+        self.assertEqual(client.get('/api/invoices/search/', {'q': 'taxi'}).data['count'], 1)
+        invoices[2].delete()
+        self.assertEqual(client.get('/api/invoices/search/', {'q': 'taxi'}).data['count'], 0)
+
+        self.assertEqual(client.get('/api/invoices/search/', {'q': '" * -'}).data['count'], 0)
+        self.assertEqual(client.get('/api/invoices/search/').status_code, 400)
+
+    def test_search_highlights_escape_invoice_markup(self):
+        invoice = Invoice.objects.create(file='invoices/facture.pdf')
+        invoice.set_extracted_text(TextProcessor.process_extracted_text(
+            {'text': 'Livraison <script>alert("x")</script> & <b>gratuite</b>',
+             'extraction_method': 'direct'}))
+
+        response = APIClient().get('/api/invoices/search/', {'q': 'livraison gratuite'})
+        highlight = response.data['results'][0]['highlights']['text']
+        self.assertNotIn('<script>', highlight)
+        self.assertNotIn('<b>', highlight)
+        self.assertIn('&lt;script&gt;', highlight)
+        self.assertIn('&amp;', highlight)
+        self.assertIn('<mark>Livraison</mark>', highlight)
+        self.assertIn('&lt;b&gt;<mark>gratuite</mark>&lt;/b&gt;', highlight)
+
+    def test_rescanned_invoices_are_flagged_as_duplicates(self):
+        def upload(text):
+            invoice = Invoice.objects.create(file='invoices/facture.pdf')
+            invoice.set_extracted_text(TextProcessor.process_extracted_text(
+                {'text': text, 'extraction_method': 'ocr'}))
+            return invoice
+
+        original = upload(SAMPLE_INVOICES[0])
+        other = upload(SAMPLE_INVOICES[1])
+        # Nouveau scan : quelques erreurs d'OCR et un numéro mal lu
+        rescan = upload(SAMPLE_INVOICES[0].replace('Lilas', 'Li1as').replace('Stylos', 'Sty1os')
+                        .replace('FA-2024-00123', 'FA-2O24-00123'))
+        # Même numéro et même total, texte différent
+        resent = upload("FACTURE N° FA-2024-00123\nTotal TTC 73,20 €")
+
+        self.assertIsNone(original.duplicate_of_id)
+        self.assertIsNone(other.duplicate_of_id)
+        self.assertEqual(rescan.duplicate_of_id, original.id)
+        self.assertEqual(resent.duplicate_of_id, original.id)
+
+        response = APIClient().get(f'/api/invoices/{original.id}/duplicates/')
+        self.assertEqual([(item['invoice']['id'], item['match']) for item in response.data['duplicates']],
+                         [(resent.id, 'reference'), (rescan.id, 'text')])
+        self.assertGreaterEqual(response.data['duplicates'][1]['similarity'], 0.7)
+        self.assertNotIn('fingerprint', original.get_extracted_text())
+
+    def test_pattern_changes_restructure_only_stale_invoices(self):
+        invoices = []
+        for text in SAMPLE_INVOICES[:2]:
+            invoice = Invoice.objects.create(file='invoices/facture.pdf')
+            invoice.set_extracted_text(TextProcessor.process_extracted_text(
+                {'text': text, 'extraction_method': 'direct'}))
+            invoices.append(invoice)
+        # Résultat enregistré avant le marquage de la version des patterns
+        unstamped = Invoice.objects.create(file='invoices/facture.pdf')
+        result = TextProcessor.process_extracted_text({'text': SAMPLE_INVOICES[2], 'extraction_method': 'ocr'})
+        del result['pattern_version']
+        unstamped.set_extracted_text(result)
+        self.assertEqual(invoices[0].pattern_version, pattern_registry.version)
+        self.assertIsNone(unstamped.pattern_version)
+        signature = InvoiceFingerprint.objects.get(invoice=invoices[0]).signature
+
+        # Nouveau jeu de patterns : seul le numéro de facture est lu autrement
+        patterns = load_regex_patterns(pattern_registry.patterns_file)
+        patterns['invoice_patterns'] = [r'FACTURE\s+N°\s+(FA-\d{4})']
+        work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work_dir)
+        patterns_file = os.path.join(work_dir, 'regex_patterns.yaml')
+        with open(patterns_file, 'w', encoding='utf-8') as file:
+            json.dump(patterns, file)
+        registry = PatternRegistry(patterns_file)
+
+        reports = []
+        with mock.patch('invoice_api.restructure.pattern_registry', registry):
+            stats = run_restructure(batch_size=2, progress=reports.append, progress_interval=0)
+            self.assertEqual(run_restructure()['total'], 0)
+        self.assertEqual((stats['total'], stats['done'], stats['changed']), (3, 3, 2))
+        self.assertEqual(reports[-1]['done'], 3)
+
+        invoice = Invoice.objects.get(pk=invoices[0].pk)
+        result = invoice.get_extracted_text()
+        self.assertEqual(invoice.numero_facture, 'FA-2024')
+        self.assertEqual(invoice.pattern_version, registry.version)
+        self.assertEqual(result['structured_data']['numeroFacture'], 'FA-2024')
+        self.assertEqual(result['pattern_version'], registry.version)
+        self.assertEqual(result['text'], SAMPLE_INVOICES[0])
+        self.assertEqual(InvoiceFingerprint.objects.get(invoice=invoice).signature, signature)
+        self.assertEqual(Invoice.objects.get(pk=unstamped.pk).pattern_version, registry.version)
@@ -1,6 +1,12 @@
 """
 Utilitaires pour le traitement du texte des factures
 """
+import json
+from html import escape
+
+# Version de la mise en forme : à incrémenter lorsque le HTML ou le JSON produit
+# change (invalide les rendus stockés dans InvoiceContent)
+RENDER_VERSION = '2'
 
 def text_to_html(text):
     """
@@ -40,6 +46,45 @@ def text_to_html(text):
     
     return '<br>'.join(result)
 
+def layout_to_html(layout):
+    """
+    Dessine les fragments positionnés de chaque page (mode mise en page)
+    
+    Les libellés et valeurs des champs localisés sont mis en évidence.
+    
+    Args:
+        layout: Positions relevées à l'extraction (pages et champs localisés)
+        
+    Returns:
+        str: HTML des pages, ou chaîne vide
+    """
+    if not layout or not layout.get("pages"):
+        return ""
+    
+    # Boîtes à mettre en évidence : (page, boîte) → classe et champ
+    highlighted = {}
+    for field, located in layout.get("fields", {}).items():
+        highlighted[(located["page"], tuple(located["label_box"]))] = ("label", field)
+        highlighted[(located["page"], tuple(located["value_box"]))] = ("value", field)
+    
+    pages = []
+    for page in layout["pages"]:
+        width, height = page["width"] or 1, page["height"] or 1
+        runs = []
+        for run in page["runs"]:
+            x, y, run_width, run_height = run["box"]
+            kind, field = highlighted.get((page["page"], tuple(run["box"])), ("", ""))
+            title = f' title="{escape(field)}"' if field else ''
+            runs.append(
+                f'<span class="run {kind}"{title} style="left:{x / width * 100:.2f}%;'
+                f'top:{y / height * 100:.2f}%;font-size:{run_height:.1f}px">{escape(run["text"])}</span>'
+            )
+        pages.append(
+            f'<div class="layout-page" style="width:{width:.0f}px;height:{height:.0f}px">'
+            f'{"".join(runs)}</div>'
+        )
+    return "\n".join(pages)
+
 def create_invoice_html(invoice_data):
     """
     Crée une page HTML complète pour afficher une facture
@@ -110,6 +155,24 @@ def create_invoice_html(invoice_data):
                 font-weight: bold;
                 color: #7f8c8d;
             }}
+            .layout-page {{
+                position: relative;
+                margin: 20px auto;
+                background-color: white;
+                box-shadow: 0 2px 5px rgba(0,0,0,0.1);
+                font-family: Helvetica, Arial, sans-serif;
+            }}
+            .run {{
+                position: absolute;
+                white-space: pre;
+            }}
+            .run.label {{
+                background-color: #d6eaf8;
+            }}
+            .run.value {{
+                background-color: #fadbd8;
+                font-weight: bold;
+            }}
         </style>
     </head>
     <body>
@@ -126,8 +189,26 @@ def create_invoice_html(invoice_data):
         <div class="invoice-container">
             {text_to_html(formatted_text)}
         </div>
+        
+        {layout_to_html(invoice_data.get("layout"))}
     </body>
     </html>
     """
     
-    return html
\ No newline at end of file
+    return html
+
+def create_formatted_text_json(invoice_data):
+    """
+    Crée la réponse JSON de l'endpoint formatted_text
+    
+    Args:
+        invoice_data: Dictionnaire contenant les données de la facture
+        
+    Returns:
+        str: Document JSON (même forme que le rendu JSON de l'API)
+    """
+    return json.dumps({
+        'status': 'success',
+        'formatted_text': invoice_data.get("formatted_text", ""),
+        'structured_data': invoice_data.get("structured_data", {})
+    }, ensure_ascii=False, separators=(',', ':'))
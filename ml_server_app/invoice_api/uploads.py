@@ -0,0 +1,156 @@
+"""
+Contrôle des fichiers téléchargés pendant leur réception
+
+Les gestionnaires d'upload ci-dessous remplacent ceux de Django pour les
+endpoints des factures. Pendant que les blocs arrivent, ils :
+- calculent l'empreinte SHA-256 du contenu (celle du cache des extractions) ;
+- identifient le type réel du fichier par sa signature (PDF, image, ZIP),
+  indépendamment de son extension ;
+- appliquent les limites de taille dès que le seuil est dépassé.
+
+Un fichier refusé n'est ni conservé ni extrait : il est ignoré par le parseur
+et le motif est enregistré dans `request.upload_rejections`, que les vues
+transforment en réponse d'erreur. Les fichiers acceptés portent les
+attributs `sha256` et `sniffed_type`, et leur extension est corrigée d'après
+le type détecté.
+"""
+import hashlib
+import os
+
+from django.core.files.uploadhandler import (
+    MemoryFileUploadHandler, SkipFile, TemporaryFileUploadHandler,
+)
+from rest_framework import status
+
+from .conf import get_setting
+from .extractors import IMAGE_EXTENSIONS
+from .storage import PDF_HEADER_WINDOW, sniff_file_type
+
+REJECTED_TYPE = 'type'
+REJECTED_SIZE = 'size'
+
+
+def max_upload_bytes(kind):
+    """Taille maximale d'un fichier reçu selon son type"""
+    if kind == 'zip':
+        return get_setting('BATCH_MAX_BYTES')
+    return get_setting('UPLOAD_MAX_FILE_BYTES')
+
+
+def _fixed_name(name, kind, extension):
+    # Le routage des extracteurs dépend de l'extension : elle doit refléter le contenu
+    base, current = os.path.splitext(name)
+    if kind == 'image' and current.lower() in IMAGE_EXTENSIONS:
+        return name
+    if current.lower() == extension:
+        return name
+    return f"{base or 'document'}{extension}"
+
+
+class InspectionMixin:
+    """Empreinte, type réel et limite de taille d'un fichier, calculés bloc par bloc"""
+
+    def new_file(self, field_name, file_name, *args, **kwargs):
+        self.digest = hashlib.sha256()
+        self.header = b''
+        self.sniffed = False
+        self.received = 0
+        self.inspected_field = field_name
+        self.inspected_name = file_name
+        super().new_file(field_name, file_name, *args, **kwargs)
+
+    def _handles_data(self):
+        return True
+
+    def _reject(self, reason, message):
+        if not hasattr(self.request, 'upload_rejections'):
+            self.request.upload_rejections = []
+        self.request.upload_rejections.append({
+            'field': self.inspected_field,
+            'name': self.inspected_name,
+            'reason': reason,
+            'message': message,
+        })
+        raise SkipFile(message)
+
+    def receive_data_chunk(self, raw_data, start):
+        if self._handles_data():
+            self.digest.update(raw_data)
+            self.received += len(raw_data)
+            if self.sniffed is False:
+                self.header = (self.header + raw_data)[:PDF_HEADER_WINDOW]
+                self.sniffed = sniff_file_type(self.header)
+                if self.sniffed is None:
+                    self._reject(REJECTED_TYPE, f"Type de fichier non pris en charge : {self.inspected_name}")
+            limit = max_upload_bytes(self.sniffed[0] if self.sniffed else None)
+            if self.received > limit:
+                self._reject(REJECTED_SIZE, f"Fichier trop volumineux (plus de {limit} octets) : "
+                                            f"{self.inspected_name}")
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded = super().file_complete(file_size)
+        if uploaded is None:
+            return None
+        if self.sniffed is False:
+            # Fichier plus court que la fenêtre d'en-tête
+            self.sniffed = sniff_file_type(self.header, complete=True)
+        uploaded.sha256 = self.digest.hexdigest()
+        uploaded.sniffed_type = None
+        if self.sniffed:
+            kind, extension, mime_type = self.sniffed
+            uploaded.sniffed_type = kind
+            uploaded.content_type = mime_type
+            uploaded.name = _fixed_name(uploaded.name, kind, extension)
+        return uploaded
+
+
+class InspectingMemoryFileUploadHandler(InspectionMixin, MemoryFileUploadHandler):
+    """Petites requêtes : fichier gardé en mémoire"""
+
+    def _handles_data(self):
+        # Non activé, le gestionnaire transmet les blocs au suivant sans les garder
+        return self.activated
+
+
+class InspectingTemporaryFileUploadHandler(InspectionMixin, TemporaryFileUploadHandler):
+    """Requêtes volumineuses : fichier écrit dans un fichier temporaire"""
+
+
+def get_upload_handlers(request):
+    return [InspectingMemoryFileUploadHandler(request), InspectingTemporaryFileUploadHandler(request)]
+
+
+def get_rejections(request):
+    """
+    Motifs de refus des fichiers ignorés pendant la réception
+
+    Returns:
+        list: Dictionnaires (field, name, reason, message)
+    """
+    return getattr(request, 'upload_rejections', [])
+
+
+def check_uploaded_file(request, uploaded):
+    """
+    Vérifie le fichier d'un téléchargement unitaire, une fois la requête analysée
+
+    Args:
+        request: Requête dont le corps a été lu (request.FILES)
+        uploaded: Fichier reçu, ou None
+
+    Returns:
+        dict: Refus (message, statut HTTP), ou None si le fichier est accepté
+    """
+    rejections = get_rejections(request)
+    if rejections:
+        rejection = rejections[0]
+    elif uploaded is not None and getattr(uploaded, 'sniffed_type', None) not in ('pdf', 'image'):
+        rejection = {'reason': REJECTED_TYPE,
+                     'message': f"Type de fichier non pris en charge : {uploaded.name}"}
+    else:
+        return None
+
+    if rejection['reason'] == REJECTED_SIZE:
+        return {'message': rejection['message'], 'status': status.HTTP_413_REQUEST_ENTITY_TOO_LARGE}
+    return {'message': rejection['message'], 'status': status.HTTP_415_UNSUPPORTED_MEDIA_TYPE}
@@ -1,10 +1,18 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import InvoiceViewSet
+from . import async_views
+from .views import InvoiceViewSet, ExtractionBatchViewSet, metrics_view
 
 router = DefaultRouter()
 router.register(r'invoices', InvoiceViewSet)
+router.register(r'batches', ExtractionBatchViewSet)
 
 urlpatterns = [
+    path('metrics/', metrics_view, name='metrics'),
+    # Versions asynchrones (ASGI) du téléchargement, de l'extraction et du texte formaté
+    path('async/invoices/', async_views.upload_invoice, name='async-invoice-upload'),
+    path('async/invoices/<int:pk>/extract/', async_views.extract_invoice, name='async-invoice-extract'),
+    path('async/invoices/<int:pk>/formatted_text/', async_views.formatted_text,
+         name='async-invoice-formatted-text'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -1,91 +1,450 @@
+from decimal import Decimal, InvalidOperation
+
 from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.decorators import action
-from django.conf import settings
 from django.http import HttpResponse
-import os
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.db.models import Prefetch
+from django.urls import reverse
+from django.utils.dateparse import parse_date
 
-from .models import Invoice
-from .serializers import InvoiceSerializer
-from .extractors import TextExtractor, TextProcessor
+from .models import Invoice, InvoiceContent, ExtractionBatch, ExtractionJob
+from .serializers import (
+    InvoiceSerializer, InvoiceSummarySerializer, ExtractionJobSerializer, ExtractionBatchSerializer
+)
+from .pagination import InvoiceCursorPagination
+from .jobs import enqueue_extraction
+from .cache import extract_with_cache, get_extraction_cache, lookup_cached_extraction
+from .batch import BatchUploadError, create_batch
+from .conf import get_setting
+from .metrics import profile_call, render_prometheus
+from .search import is_available as is_search_available, search_invoices
+from .storage import StoredDocument
+from .uploads import check_uploaded_file, get_rejections, get_upload_handlers
 
 class InvoiceViewSet(viewsets.ModelViewSet):
     queryset = Invoice.objects.all()
     serializer_class = InvoiceSerializer
     parser_classes = (MultiPartParser, FormParser)
+    pagination_class = InvoiceCursorPagination
+    
+    # Filtres de la liste : paramètre de requête → lookup sur les colonnes structurées
+    list_filters = {
+        'numero_facture': 'numero_facture',
+        'numero_commande': 'numero_commande',
+        'client_siret': 'client_siret',
+        'client_tva': 'client_tva',
+        'date_from': 'date_piece__gte',
+        'date_to': 'date_piece__lte',
+        'total_min': 'total_ttc__gte',
+        'total_max': 'total_ttc__lte',
+    }
+    
+    def initialize_request(self, request, *args, **kwargs):
+        # Empreinte, type réel et taille contrôlés pendant la réception (voir uploads.py)
+        request.upload_handlers = get_upload_handlers(request)
+        return super().initialize_request(request, *args, **kwargs)
+    
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            for param, lookup in self.list_filters.items():
+                value = self.request.query_params.get(param)
+                if value:
+                    queryset = queryset.filter(**{lookup: value})
+        if self.action in ('list', 'retrieve'):
+            fields = self._serialized_fields()
+            if 'extracted_content' in fields:
+                # Le contenu extrait est sérialisé : une seule requête avec la facture
+                queryset = queryset.select_related('content')
+            else:
+                # Ne lire que les colonnes utiles (processed sert aux URLs)
+                columns = {field.name for field in Invoice._meta.concrete_fields}
+                queryset = queryset.only('id', 'processed', *(columns & set(fields)))
+        return queryset
+    
+    def perform_content_negotiation(self, request, force=False):
+        # ?format=html est traité par formatted_text, et non comme un format DRF inconnu
+        if self.action == 'formatted_text':
+            force = True
+        return super().perform_content_negotiation(request, force)
+    
+    def get_serializer_class(self):
+        # ?view=summary : représentation allégée pour les listes
+        if self.action == 'list' and self.request.query_params.get('view') == 'summary':
+            return InvoiceSummarySerializer
+        return super().get_serializer_class()
+    
+    def get_serializer(self, *args, **kwargs):
+        # ?fields=id,numero_facture : restreindre les champs retournés
+        requested = self._requested_fields()
+        if requested is not None:
+            kwargs.setdefault('fields', requested)
+        return super().get_serializer(*args, **kwargs)
+    
+    def _requested_fields(self):
+        if self.action not in ('list', 'retrieve'):
+            return None
+        fields = self.request.query_params.get('fields')
+        if not fields:
+            return None
+        return [name.strip() for name in fields.split(',') if name.strip()]
+    
+    def _serialized_fields(self):
+        fields = self.get_serializer_class().Meta.fields
+        requested = self._requested_fields()
+        if requested is not None:
+            fields = [name for name in fields if name in requested]
+        return fields
+    
+    def list(self, request, *args, **kwargs):
+        for param in ('date_from', 'date_to'):
+            value = request.query_params.get(param)
+            if value and not self._is_valid_date(value):
+                return Response({
+                    'status': 'error',
+                    'message': f"Date invalide pour {param} (format attendu : AAAA-MM-JJ)"
+                }, status=status.HTTP_400_BAD_REQUEST)
+        for param in ('total_min', 'total_max'):
+            value = request.query_params.get(param)
+            if value and not self._is_valid_amount(value):
+                return Response({
+                    'status': 'error',
+                    'message': f"Montant invalide pour {param} (format attendu : 1234.56)"
+                }, status=status.HTTP_400_BAD_REQUEST)
+        return super().list(request, *args, **kwargs)
+    
+    @staticmethod
+    def _is_valid_date(value):
+        try:
+            return parse_date(value) is not None
+        except ValueError:
+            return False
+    
+    @staticmethod
+    def _is_valid_amount(value):
+        # Même plage que la colonne total_ttc (max_digits=14, decimal_places=2)
+        try:
+            amount = Decimal(value)
+        except InvalidOperation:
+            return False
+        return amount.is_finite() and abs(amount) < Decimal('1e12')
     
     def create(self, request, *args, **kwargs):
+        uploaded = request.FILES.get('file')
+        # Fichier refusé (type, taille) : rien n'a été enregistré
+        rejection = check_uploaded_file(request, uploaded)
+        if rejection:
+            return Response({
+                'status': 'error',
+                'message': rejection['message']
+            }, status=rejection['status'])
+        
+        # Un fichier identique à une facture existante n'est ni enregistré ni extrait
+        content_hash = getattr(uploaded, 'sha256', '')
+        duplicate = content_hash and Invoice.objects.filter(sha256=content_hash).order_by('id').first()
+        if duplicate:
+            return Response({
+                'status': 'success',
+                'message': 'Facture déjà téléchargée',
+                'duplicate': True,
+                'invoice': self.get_serializer(duplicate).data
+            }, status=status.HTTP_200_OK)
+        
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
-            invoice = serializer.save()
+            invoice = serializer.save(sha256=content_hash)
             
-            # Extraire le texte de la facture
-            file_path = os.path.join(settings.MEDIA_ROOT, invoice.file.name)
-            extracted_data = TextExtractor.extract_from_file(file_path)
+            # Un fichier déjà analysé est servi directement depuis le cache
+            with StoredDocument.from_field(invoice.file) as document:
+                cached_data = lookup_cached_extraction(document, content_hash=content_hash or None)
+            if cached_data is not None:
+                invoice.set_extracted_text(cached_data)
+                return Response({
+                    'status': 'success',
+                    'message': 'Facture téléchargée et traitée avec succès',
+                    'cached': True,
+                    'invoice': self.get_serializer(invoice).data
+                }, status=status.HTTP_201_CREATED)
             
-            # Enregistrer le texte extrait
-            invoice.set_extracted_text(extracted_data)
+            # L'extraction (OCR compris) est confiée aux workers en arrière-plan
+            job = enqueue_extraction(invoice)
             
-            # Retourner la réponse avec les données extraites
             return Response({
-                'status': 'success',
-                'message': 'Facture téléchargée et traitée avec succès',
+                'status': 'queued',
+                'message': 'Facture téléchargée, extraction en attente',
+                'job': ExtractionJobSerializer(job).data,
+                'status_url': request.build_absolute_uri(
+                    reverse('invoice-extraction-status', kwargs={'pk': invoice.pk})),
                 'invoice': self.get_serializer(invoice).data
-            }, status=status.HTTP_201_CREATED)
+            }, status=status.HTTP_202_ACCEPTED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """
+        Endpoint pour télécharger plusieurs factures (champ `files`, répété)
+        ou une archive ZIP en une seule requête
+        """
+        uploaded_files = request.FILES.getlist('files') + request.FILES.getlist('file')
+        # Les fichiers refusés pendant la réception figurent parmi les fichiers ignorés
+        rejected = [{'name': rejection['name'], 'reason': rejection['message']}
+                    for rejection in get_rejections(request)]
+        rejected += [{'name': uploaded.name, 'reason': 'Type de fichier non pris en charge'}
+                     for uploaded in uploaded_files if getattr(uploaded, 'sniffed_type', None) is None]
+        uploaded_files = [uploaded for uploaded in uploaded_files
+                          if getattr(uploaded, 'sniffed_type', None) is not None]
+        if not uploaded_files and not rejected:
+            return Response({
+                'status': 'error',
+                'message': 'Aucun fichier fourni'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            batch = create_batch(uploaded_files, rejected)
+        except BatchUploadError as e:
+            return Response({
+                'status': 'error',
+                'message': str(e)
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'status': 'queued',
+            'message': 'Lot téléchargé, extractions en attente',
+            'status_url': request.build_absolute_uri(
+                reverse('extractionbatch-detail', kwargs={'pk': batch.pk})),
+            'batch': ExtractionBatchSerializer(batch).data
+        }, status=status.HTTP_202_ACCEPTED)
+    
+    @action(detail=True, methods=['get'], url_path='status')
+    def extraction_status(self, request, pk=None):
+        """
+        Endpoint pour suivre la dernière tâche d'extraction d'une facture
+        """
+        invoice = self.get_object()
+        job = invoice.jobs.order_by('-created_at', '-id').first()
+        
+        if job is None and invoice.processed:
+            # Facture servie par le cache (ou doublon d'une telle facture) : pas
+            # de tâche, l'extraction est présentée comme terminée
+            return Response({
+                'status': 'success',
+                'job': {
+                    'id': None,
+                    'invoice': invoice.pk,
+                    'status': ExtractionJob.STATUS_DONE,
+                    'attempts': 0,
+                    'max_attempts': 0,
+                    'error': None,
+                    'created_at': invoice.uploaded_at,
+                    'started_at': None,
+                    'finished_at': None,
+                },
+                'invoice': self.get_serializer(invoice).data,
+            })
+        
+        if job is None:
+            return Response({
+                'status': 'error',
+                'message': "Aucune tâche d'extraction pour cette facture"
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        response = {
+            'status': 'success',
+            'job': ExtractionJobSerializer(job).data,
+        }
+        if job.is_finished:
+            response['invoice'] = self.get_serializer(invoice).data
+        return Response(response)
+    
+    @action(detail=True, methods=['get'])
+    def duplicates(self, request, pk=None):
+        """
+        Endpoint pour lister les factures qui sont probablement la même facture
+        (même numéro et même total TTC, ou texte similaire)
+        """
+        invoice = self.get_object()
+        duplicates = invoice.find_duplicates()
+        invoices = Invoice.objects.in_bulk([duplicate['invoice_id'] for duplicate in duplicates])
+        
+        return Response({
+            'status': 'success',
+            'duplicate_of': invoice.duplicate_of_id,
+            'duplicates': [{
+                'invoice': InvoiceSummarySerializer(invoices[duplicate['invoice_id']]).data,
+                'similarity': duplicate['similarity'],
+                'match': duplicate['match'],
+            } for duplicate in duplicates if duplicate['invoice_id'] in invoices]
+        })
+    
     @action(detail=True, methods=['get'])
     def extract(self, request, pk=None):
         """
         Endpoint pour extraire à nouveau le texte d'une facture existante
         """
         invoice = self.get_object()
-        file_path = os.path.join(settings.MEDIA_ROOT, invoice.file.name)
+        document = StoredDocument.from_field(invoice.file)
         
-        if not os.path.exists(file_path):
+        if not document.exists():
             return Response({
                 'status': 'error',
                 'message': 'Fichier non trouvé'
             }, status=status.HTTP_404_NOT_FOUND)
         
-        extracted_data = TextExtractor.extract_from_file(file_path)
+        # ?refresh=1 force une nouvelle analyse du fichier
+        refresh = request.query_params.get('refresh') in ('1', 'true')
+        # ?profile=1 : nouvelle analyse sous cProfile (si EXTRACTION_PROFILING)
+        profile = request.query_params.get('profile') in ('1', 'true')
+        
+        if profile:
+            if not get_setting('EXTRACTION_PROFILING'):
+                return Response({
+                    'status': 'error',
+                    'message': 'Profilage désactivé (EXTRACTION_PROFILING)'
+                }, status=status.HTTP_403_FORBIDDEN)
+            with document:
+                (extracted_data, cached), summary, profile_path = profile_call(
+                    extract_with_cache, document, invoice.sha256 or None, refresh=True)
+        else:
+            with document:
+                extracted_data, cached = extract_with_cache(document, invoice.sha256 or None, refresh=refresh)
         invoice.set_extracted_text(extracted_data)
         
-        return Response({
+        response = {
             'status': 'success',
             'message': 'Texte extrait avec succès',
+            'cached': cached,
             'invoice': self.get_serializer(invoice).data
+        }
+        if profile:
+            response['profile'] = {'file': profile_path, 'summary': summary}
+        return Response(response)
+    
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Endpoint de recherche plein texte (?q=) dans le texte et les champs
+        structurés des factures
+        
+        Les résultats sont classés par pertinence ; `highlights` contient, pour
+        chaque colonne de l'index où un mot a été trouvé, le texte surligné
+        (<mark>...</mark>).
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({
+                'status': 'error',
+                'message': 'Paramètre q manquant'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if not is_search_available():
+            return Response({
+                'status': 'error',
+                'message': 'Recherche plein texte non disponible pour cette base de données'
+            }, status=status.HTTP_501_NOT_IMPLEMENTED)
+        
+        try:
+            limit = int(request.query_params.get('limit', get_setting('SEARCH_RESULTS_LIMIT')))
+        except ValueError:
+            return Response({
+                'status': 'error',
+                'message': 'Limite invalide'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, get_setting('INVOICE_MAX_PAGE_SIZE')))
+        
+        results = search_invoices(query, limit)
+        # Factures des résultats en une requête, dans l'ordre du classement
+        invoices = Invoice.objects.in_bulk([result['id'] for result in results])
+        serialized = []
+        for result in results:
+            invoice = invoices.get(result['id'])
+            if invoice is not None:
+                serialized.append({
+                    'invoice': InvoiceSummarySerializer(invoice).data,
+                    'score': result['score'],
+                    'highlights': result['highlights'],
+                })
+        
+        return Response({
+            'status': 'success',
+            'query': query,
+            'count': len(serialized),
+            'results': serialized
+        })
+    
+    @action(detail=False, methods=['get'])
+    def cache_stats(self, request):
+        """
+        Endpoint pour consulter les compteurs du cache des extractions
+        """
+        cache = get_extraction_cache()
+        if cache is None:
+            return Response({
+                'status': 'error',
+                'message': 'Cache des extractions désactivé'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        return Response({
+            'status': 'success',
+            'cache': cache.stats()
         })
         
     @action(detail=True, methods=['get'])
     def formatted_text(self, request, pk=None):
         """
         Endpoint pour obtenir le texte formaté d'une facture
-        """
-        from .text_utils import create_invoice_html
         
+        Les rendus HTML et JSON sont calculés une fois par résultat d'extraction
+        puis servis avec ETag/Last-Modified : une requête conditionnelle sur un
+        rendu inchangé reçoit 304 sans lire le texte de la facture.
+        """
         invoice = self.get_object()
-        extracted_data = invoice.get_extracted_text()
+        kind = 'html' if request.query_params.get('format') == 'html' else 'json'
         
-        if not extracted_data or "error" in extracted_data:
+        # Seules l'empreinte et la date de mise à jour sont lues pour la validation
+        content = (InvoiceContent.objects.filter(invoice=invoice)
+                   .only('invoice_id', 'etag', 'updated_at').first())
+        if content is None or not content.etag:
             return Response({
                 'status': 'error',
                 'message': 'Aucun texte extrait disponible'
             }, status=status.HTTP_404_NOT_FOUND)
         
-        # Récupérer le texte formaté
-        formatted_text = extracted_data.get("formatted_text", "")
-        
-        # Option pour retourner en HTML
-        if request.query_params.get('format') == 'html':
-            # Utiliser la fonction utilitaire pour créer le HTML
-            html_content = create_invoice_html(extracted_data)
-            return HttpResponse(html_content, content_type='text/html')
+        etag = content.http_etag(kind)
+        last_modified = content.updated_at.timestamp()
+        not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if not_modified is not None:
+            response = not_modified
+        else:
+            content = (InvoiceContent.objects
+                       .only('invoice_id', 'etag', 'render_version', 'rendered_html', 'rendered_json')
+                       .get(pk=content.pk))
+            if kind == 'html':
+                response = HttpResponse(content.get_rendered('html'), content_type='text/html; charset=utf-8')
+            else:
+                response = HttpResponse(content.get_rendered('json'), content_type='application/json')
         
-        # Par défaut, retourner en JSON
-        return Response({
-            'status': 'success',
-            'formatted_text': formatted_text,
-            'structured_data': extracted_data.get("structured_data", {})
-        })
\ No newline at end of file
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        # Le client revalide à chaque fois (réponse 304 si rien n'a changé)
+        patch_cache_control(response, no_cache=True)
+        return response
+
+class ExtractionBatchViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Suivi des lots de factures : avancement agrégé des extractions
+    """
+    queryset = ExtractionBatch.objects.prefetch_related(
+        Prefetch('invoices', queryset=Invoice.objects.only('id', 'batch_id'))
+    )
+    serializer_class = ExtractionBatchSerializer
+    pagination_class = InvoiceCursorPagination
+
+
+def metrics_view(request):
+    """
+    Mesures agrégées de l'extraction, au format texte de Prometheus
+    """
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
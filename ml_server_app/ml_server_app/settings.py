@@ -86,6 +86,8 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Les workers d'extraction écrivent en parallèle dans la base
+        'OPTIONS': {'timeout': 20},
     }
 }
 
@@ -130,6 +132,116 @@ STATIC_URL = 'static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Stockage des fichiers des factures (Django 4.2+) : tout stockage Django
+# convient, par exemple S3 ou MinIO avec django-storages (voir invoice_api/storage.py)
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+# File d'attente des extractions (python manage.py run_extraction_workers)
+EXTRACTION_WORKERS = 2
+EXTRACTION_WORKER_POLL_INTERVAL = 1.0
+EXTRACTION_JOB_MAX_ATTEMPTS = 3
+EXTRACTION_JOB_RETRY_DELAY = 5
+EXTRACTION_JOB_TIMEOUT = 600
+
+# OCR des PDF scannés : processus par worker (None = nombre de cœurs)
+# et nombre maximal de pages d'un même document traitées en parallèle
+# Moteur OCR : 'auto' (tesserocr s'il est installé, sinon pytesseract), 'tesserocr' ou 'pytesseract'
+OCR_BACKEND = 'auto'
+OCR_LANG = 'fra+eng'
+OCR_PROCESSES = None
+OCR_MAX_PAGES_IN_FLIGHT = 4
+# Les PDF scannés sont rastérisés par fenêtres de OCR_RASTER_WINDOW pages
+OCR_RASTER_WINDOW = 4
+OCR_DPI = 200
+# Prétraitement OpenCV avant l'OCR (niveaux de gris, réduction, redressement,
+# binarisation), avec un profil par type de document (voir invoice_api/preprocessing.py)
+OCR_PREPROCESSING = True
+OCR_PREPROCESSING_PROFILES = {
+    'image': {
+        'max_side': 4000,
+        'target_char_height': 28,
+        'deskew': True,
+        'max_skew': 10,
+        'binarize': 'adaptive',
+    },
+    'pdf_scanned': {
+        'target_dpi': 300,
+        'deskew': True,
+        'max_skew': 5,
+        'binarize': 'otsu',
+    },
+}
+# Pages PDF dont la couche texte est plus courte (caractères hors espaces) : OCR
+OCR_MIN_PAGE_CHARS = 20
+
+# Position des fragments de texte des PDF et valeurs lues à côté de leur libellé
+PDF_LAYOUT_EXTRACTION = False
+
+# Cache des extractions, indexé par l'empreinte SHA-256 des fichiers
+EXTRACTION_CACHE_DIR = os.path.join(BASE_DIR, 'cache', 'extractions')
+EXTRACTION_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Mesures de l'extraction (endpoint /api/metrics/) : chaque processus y écrit ses agrégats
+METRICS_DIR = os.path.join(BASE_DIR, 'cache', 'metrics')
+METRICS_SNAPSHOT_INTERVAL = 5.0
+# ?profile=1 sur /api/invoices/{id}/extract/ : profil cProfile (à réserver au diagnostic)
+EXTRACTION_PROFILING = DEBUG
+
+# Téléchargement par lots (fichiers multiples ou archive ZIP)
+BATCH_MAX_FILES = 1000
+BATCH_MAX_BYTES = 2 * 1024 * 1024 * 1024
+DATA_UPLOAD_MAX_NUMBER_FILES = BATCH_MAX_FILES
+
+# Taille maximale d'un PDF ou d'une image téléchargé, contrôlée pendant la réception
+UPLOAD_MAX_FILE_BYTES = 50 * 1024 * 1024
+
+# Vues asynchrones (ASGI) : pool de processus d'extraction (None : nombre de
+# cœurs) et nombre maximal d'extractions en cours par processus serveur
+ASYNC_EXTRACTION_PROCESSES = None
+ASYNC_EXTRACTION_MAX_PENDING = 256
+
+# Pagination par curseur de la liste des factures (?page_size= borné par le maximum)
+INVOICE_PAGE_SIZE = 50
+INVOICE_MAX_PAGE_SIZE = 500
+
+# Recherche plein texte (/api/invoices/search/?q=) : nombre de résultats par défaut,
+# et configuration tsvector utilisée sous PostgreSQL (SQLite : FTS5)
+SEARCH_RESULTS_LIMIT = 20
+# Pour un mot très fréquent, seules les factures les plus récentes qui le
+# contiennent sont classées (durée bornée quelle que soit la taille de l'index)
+SEARCH_MAX_CANDIDATES = 5000
+SEARCH_TEXT_CONFIG = 'french'
+
+# Détection des doublons (nouveau scan d'une même facture) : similarité estimée
+# des textes nettoyés à partir de laquelle une facture est marquée (duplicate_of)
+DUPLICATE_SIMILARITY_THRESHOLD = 0.7
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'simple': {
+            'format': '{asctime} {levelname} {name} {message}',
+            'style': '{',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'simple',
+        },
+    },
+    'loggers': {
+        'invoice_api': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 